@@ -1,29 +1,38 @@
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import mplfinance as mpf
 import glob
+import argparse
+import os
+import sys
+
+# The cached price store lives with the trading simulator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'trading-simulator'))
+from price_store import load_prices
+
+# Resample rule for each supported DCA frequency
+FREQUENCY_PERIODS = {
+    'hourly': 'h',
+    'daily': 'D',
+    'weekly': 'W',
+    'monthly': 'MS',  # Month start
+}
 
 def load_data(files):
+    # Parsed and sorted once, then memory-mapped from the price cache
     dataframes = {}
     for file in files:
-        df = pd.read_csv(file)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        df.sort_index(inplace=True)
-        dataframes[file] = df
+        dataframes[file] = load_prices(file)
     return dataframes
 
-def simulate_dca_strategy(data, dca_amount, frequency='daily'):
-    if frequency == 'hourly':
-        period = 'H'
-    elif frequency == 'daily':
-        period = 'D'
-    elif frequency == 'weekly':
-        period = 'W'
-    elif frequency == 'monthly':
-        period = 'MS'  # Month start
-    else:
+def get_period(frequency):
+    if frequency not in FREQUENCY_PERIODS:
         raise ValueError("Frequency must be one of: hourly, daily, weekly, monthly")
+    return FREQUENCY_PERIODS[frequency]
+
+def simulate_dca_strategy(data, dca_amount, frequency='daily'):
+    period = get_period(frequency)
 
     # Resample data based on frequency
     resampled_data = data.resample(period).last().dropna()
@@ -47,78 +56,169 @@ def simulate_dca_strategy(data, dca_amount, frequency='daily'):
 
     return final_portfolio_value, total_investment, purchases, average_price_paid
 
-# Load all CSV files in the current directory
-csv_files = glob.glob("*.csv")
-
-# Define the total investment capital
-total_investment_capital = float(input("Enter the total investment capital: "))
-frequency = input("Enter the frequency (hourly, daily, weekly, monthly): ").lower()
-
-# Load data from all CSV files
-dataframes = load_data(csv_files)
-
-# Divide the total capital evenly across all assets
-dca_amount_per_asset = total_investment_capital / len(csv_files)
-
-# Track the best results
-best_value = 0
-best_amount = 0
-best_frequency = ''
-best_roi = 0
-results = {}
-
-# Variables to track overall performance
-total_final_value = 0
-total_total_investment = 0
-
-# Run simulations for each asset
-for file, df in dataframes.items():
-    final_value, total_investment, purchases, average_price_paid = simulate_dca_strategy(df, dca_amount_per_asset, frequency)
-    roi = ((final_value - total_investment) / total_investment) * 100
-    results[file] = {
-        'Final Value': final_value,
-        'Total Investment': total_investment,
-        'ROI': roi,
-        'Purchases': purchases,
-        'Average Price Paid': average_price_paid
-    }
-    print(f"\nAsset: {file}")
-    print(f"Final Value = ${final_value:.2f}")
-    print(f"Total Investment = ${total_investment:.2f}")
-    print(f"ROI = {roi:.2f}%")
-    print(f"Average Price Paid = ${average_price_paid:.2f}")
-
-    # Update overall totals
-    total_final_value += final_value
-    total_total_investment += total_investment
-
-    if final_value > best_value:
-        best_value = final_value
-        best_amount = dca_amount_per_asset
-        best_frequency = frequency
-        best_roi = roi
-
-# Calculate overall ROI
-overall_roi = ((total_final_value - total_total_investment) / total_total_investment) * 100
-
-# Output the best result
-print("\nBest DCA Strategy:")
-print(f"Amount Invested per Asset: ${best_amount}")
-print(f"Frequency: {best_frequency}")
-print(f"Final Portfolio Value: ${best_value:.2f}")
-print(f"ROI: {best_roi:.2f}%")
-print(f"\nOverall ROI for all investments: {overall_roi:.2f}%")
-print(f"Total Amount Invested: ${total_total_investment:.2f}")
-print(f"Total Return: ${total_final_value - total_total_investment:.2f} (${total_final_value:.2f})")
-
-# Plot the normalized price for each asset on a single chart
-plt.figure(figsize=(14, 7))
-for file, result in results.items():
-    normalized_prices = (result['Purchases']['Close'] / result['Purchases']['Close'].iloc[0] - 1) * 100
-    plt.plot(normalized_prices.index, normalized_prices, label=f"{file}: Final Value = ${result['Final Value']:.2f}, ROI = {result['ROI']:.2f}%, Avg Price Paid = ${result['Average Price Paid']:.2f}".replace('$', r'\$'))
-
-plt.title('Normalized Price Over Time for Multiple Assets')
-plt.xlabel('Date')
-plt.ylabel('Percentage Change from Initial Value (%)')
-plt.legend()
-plt.show()
+def build_price_panel(dataframes):
+    # One Close column per asset on a shared, sorted date index
+    return pd.concat({name: df['Close'] for name, df in dataframes.items()}, axis=1).sort_index()
+
+def sweep_dca_grid(dataframes, dca_amounts, frequencies):
+    """
+    Evaluate every DCA amount x frequency x asset combination.
+
+    The price panel is resampled once per frequency; the purchase count, mean
+    and last close per asset are all simulate_dca_strategy needs, and they
+    do not depend on the amount, so every amount is computed from them in a
+    single broadcast. Returns one row per combination, ranked by ROI.
+
+    Values agree with simulate_dca_strategy within floating-point rounding
+    (about 1e-12 relative): the panel's column means are summed in a
+    different order than a single asset's resampled Close.
+    """
+    panel = build_price_panel(dataframes)
+    assets = np.array(panel.columns, dtype=object)
+    amounts = np.asarray(dca_amounts, dtype=np.float64)
+
+    tables = []
+    for frequency in frequencies:
+        resampled = panel.resample(get_period(frequency)).last()
+        num_purchases = resampled.count().to_numpy(dtype=np.float64)
+        mean_close = resampled.mean().to_numpy()
+        last_close = resampled.ffill().iloc[-1].to_numpy()
+
+        # Shape (assets, amounts)
+        total_investment = num_purchases[:, None] * amounts[None, :]
+        total_asset_purchased = total_investment / mean_close[:, None]
+        final_value = total_asset_purchased * last_close[:, None]
+
+        tables.append(pd.DataFrame({
+            'Asset': np.repeat(assets, len(amounts)),
+            'Frequency': frequency,
+            'DCA Amount': np.tile(amounts, len(assets)),
+            'Purchases': np.repeat(num_purchases, len(amounts)).astype(np.int64),
+            'Total Investment': total_investment.ravel(),
+            'Final Value': final_value.ravel(),
+            'ROI': ((final_value - total_investment) / total_investment * 100).ravel(),
+            'Average Price Paid': (total_investment / total_asset_purchased).ravel(),
+        }))
+
+    results = pd.concat(tables, ignore_index=True)
+    return results.sort_values(['ROI', 'Final Value'], ascending=False, ignore_index=True)
+
+def run_sweep(args):
+    dataframes = load_data(args.files)
+    results = sweep_dca_grid(dataframes, args.amounts, args.frequencies)
+
+    print(f"Evaluated {len(results)} configurations "
+          f"({len(args.amounts)} amounts x {len(args.frequencies)} frequencies x {len(dataframes)} assets)\n")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(results.head(args.top).to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"\nFull results saved to {args.output}")
+
+def run_interactive(no_plot=False, plot_file=None):
+    # Load all CSV files in the current directory
+    csv_files = glob.glob("*.csv")
+
+    # Define the total investment capital
+    total_investment_capital = float(input("Enter the total investment capital: "))
+    frequency = input("Enter the frequency (hourly, daily, weekly, monthly): ").lower()
+
+    # Load data from all CSV files
+    dataframes = load_data(csv_files)
+
+    # Divide the total capital evenly across all assets
+    dca_amount_per_asset = total_investment_capital / len(csv_files)
+
+    # Track the best results
+    best_value = 0
+    best_amount = 0
+    best_frequency = ''
+    best_roi = 0
+    results = {}
+
+    # Variables to track overall performance
+    total_final_value = 0
+    total_total_investment = 0
+
+    # Run simulations for each asset
+    for file, df in dataframes.items():
+        final_value, total_investment, purchases, average_price_paid = simulate_dca_strategy(df, dca_amount_per_asset, frequency)
+        roi = ((final_value - total_investment) / total_investment) * 100
+        results[file] = {
+            'Final Value': final_value,
+            'Total Investment': total_investment,
+            'ROI': roi,
+            'Purchases': purchases,
+            'Average Price Paid': average_price_paid
+        }
+        print(f"\nAsset: {file}")
+        print(f"Final Value = ${final_value:.2f}")
+        print(f"Total Investment = ${total_investment:.2f}")
+        print(f"ROI = {roi:.2f}%")
+        print(f"Average Price Paid = ${average_price_paid:.2f}")
+
+        # Update overall totals
+        total_final_value += final_value
+        total_total_investment += total_investment
+
+        if final_value > best_value:
+            best_value = final_value
+            best_amount = dca_amount_per_asset
+            best_frequency = frequency
+            best_roi = roi
+
+    # Calculate overall ROI
+    overall_roi = ((total_final_value - total_total_investment) / total_total_investment) * 100
+
+    # Output the best result
+    print("\nBest DCA Strategy:")
+    print(f"Amount Invested per Asset: ${best_amount}")
+    print(f"Frequency: {best_frequency}")
+    print(f"Final Portfolio Value: ${best_value:.2f}")
+    print(f"ROI: {best_roi:.2f}%")
+    print(f"\nOverall ROI for all investments: {overall_roi:.2f}%")
+    print(f"Total Amount Invested: ${total_total_investment:.2f}")
+    print(f"Total Return: ${total_final_value - total_total_investment:.2f} (${total_final_value:.2f})")
+
+    if no_plot:
+        return
+
+    # Plot the normalized price for each asset on a single chart
+    if plot_file:
+        plt.switch_backend('Agg')  # No display needed to write an image
+    plt.figure(figsize=(14, 7))
+    for file, result in results.items():
+        normalized_prices = (result['Purchases']['Close'] / result['Purchases']['Close'].iloc[0] - 1) * 100
+        plt.plot(normalized_prices.index, normalized_prices, label=f"{file}: Final Value = ${result['Final Value']:.2f}, ROI = {result['ROI']:.2f}%, Avg Price Paid = ${result['Average Price Paid']:.2f}".replace('$', r'\$'))
+
+    plt.title('Normalized Price Over Time for Multiple Assets')
+    plt.xlabel('Date')
+    plt.ylabel('Percentage Change from Initial Value (%)')
+    plt.legend()
+    if plot_file:
+        plt.savefig(plot_file)
+        print(f"Chart saved to {plot_file}")
+    else:
+        plt.show()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate DCA strategies on the CSV files in the current directory.")
+    parser.add_argument('--sweep', action='store_true', help='Run a non-interactive grid search instead of prompting')
+    parser.add_argument('--amounts', type=float, nargs='+', default=[100.0], help='DCA amounts per purchase to evaluate')
+    parser.add_argument('--frequencies', nargs='+', choices=list(FREQUENCY_PERIODS), default=list(FREQUENCY_PERIODS), help='Purchase frequencies to evaluate')
+    parser.add_argument('--files', nargs='+', default=None, help='CSV files to include (default: all *.csv in the current directory)')
+    parser.add_argument('--top', type=int, default=20, help='Number of best configurations to print')
+    parser.add_argument('--output', type=str, default=None, help='Save the full ranked table to this CSV file')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the price chart in interactive mode')
+    parser.add_argument('--plot-file', type=str, default=None, help='Save the chart to this image file instead of opening a window')
+    args = parser.parse_args()
+
+    if args.sweep:
+        args.files = args.files or glob.glob("*.csv")
+        run_sweep(args)
+    else:
+        run_interactive(args.no_plot, args.plot_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark the connection sources of connections.py under attack-sized tables.
+
+Writes a synthetic /proc/net/tcp with --lines sockets (a botnet of
+--sources addresses opening connections, plus listening and TIME_WAIT
+sockets) and the same table as `netstat -nt` would print it, then times
+one monitor refresh with each parser and compares it with INTERVAL:
+
+    python bench_connections.py --lines 100000
+
+The netstat figure covers parsing its output only; running netstat itself
+(a fork, and netstat reading and formatting the same /proc tables) comes on
+top. With --live, every source is timed end to end against this machine's
+own sockets.
+"""
+
+import argparse
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+from connections import ESTABLISHED, ProcNetSource, SOURCES, open_source, parse_netstat
+from monitor import INTERVAL
+
+PROC_HEADER = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode"
+               "                                                     \n")
+NETSTAT_HEADER = "Active Internet connections (w/o servers)\nProto Recv-Q Send-Q Local Address           Foreign Address         State      \n"
+STATE_NAMES = {1: 'ESTABLISHED', 3: 'SYN_RECV', 6: 'TIME_WAIT', 10: 'LISTEN'}
+
+
+def proc_hex(address):
+    # The kernel prints each 32-bit word of the address in host byte order
+    return '%08X' % struct.unpack('=I', socket.inet_aton(address))[0]
+
+
+def synthetic_sockets(lines, sources, seed=0):
+    """
+    (local, remote, remote port, state) of `lines` sockets on a web server:
+    mostly ESTABLISHED and SYN_RECV from `sources` attacking addresses, some
+    TIME_WAIT and a few listeners.
+    """
+    rng = random.Random(seed)
+    botnet = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(sources)]
+    sockets = [('0.0.0.0', '0.0.0.0', 0, 10) for _ in range(min(8, lines))]
+    states = (1,) * 6 + (3,) * 3 + (6,)
+    for _ in range(lines - len(sockets)):
+        sockets.append(('10.0.0.5', rng.choice(botnet), rng.randint(1024, 65535), rng.choice(states)))
+    return sockets
+
+
+def proc_table(sockets):
+    rows = [PROC_HEADER]
+    for number, (local, remote, port, state) in enumerate(sockets):
+        rows.append(f"{number:>4}: {proc_hex(local)}:01BB {proc_hex(remote)}:{port:04X} {state:02X} 00000000:00000000 "
+                    f"00:00000000 00000000    33        0 {100000 + number} 1 0000000000000000 20 4 30 10 -1\n")
+    return ''.join(rows)
+
+
+def netstat_table(sockets):
+    rows = [NETSTAT_HEADER]
+    for local, remote, port, state in sockets:
+        if state != 10:  # -nt leaves out listening sockets
+            rows.append(f"tcp        0      0 {local + ':443':<23} {f'{remote}:{port}':<23} {STATE_NAMES[state]}\n")
+    return ''.join(rows)
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, seconds):
+    print(f"{name:<28}{seconds * 1e3:>10.2f} ms  {seconds / INTERVAL:>7.1%} of INTERVAL")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time a monitor refresh with each connection source.")
+    parser.add_argument('--lines', type=int, default=100_000, help='Sockets in the synthetic table')
+    parser.add_argument('--sources', type=int, default=20_000, help='Distinct attacking addresses')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic table')
+    parser.add_argument('--live', action='store_true', help="Also time every source on this machine's sockets")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sockets = synthetic_sockets(args.lines, args.sources, args.seed)
+    proc_text, netstat_text = proc_table(sockets), netstat_table(sockets)
+    print(f"{args.lines} sockets from {args.sources} addresses; /proc table {len(proc_text) / 2**20:.1f} MB\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, 'tcp')
+        with open(fixture, 'w') as f:
+            f.write(proc_text)
+
+        proc_seconds, proc_counts = best_time(lambda: ProcNetSource((fixture,)).read(ESTABLISHED), args.repeat)
+        netstat_seconds, netstat_counts = best_time(lambda: parse_netstat(netstat_text, ESTABLISHED), args.repeat)
+        report('proc (bulk read + regex)', proc_seconds)
+        report('netstat output parsing', netstat_seconds)
+        print(f"speedup {netstat_seconds / proc_seconds:.1f}x, same counts: {proc_counts == netstat_counts}")
+
+    if args.live:
+        print("\nThis machine:")
+        for name in SOURCES:
+            try:
+                source = open_source(name)
+                seconds, counts = best_time(source.read, args.repeat)
+            except OSError as e:
+                print(f"{name:<28}unavailable: {e}")
+                continue
+            report(f"{name} ({sum(counts.values())} sockets)", seconds)
+
+    if proc_counts != netstat_counts:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Blocking backends for monitor.py.
+
+Subnets are queued with block() during a monitoring interval and applied
+together by flush() at its end:
+
+    ipset     adds them to kernel hash sets (one for IPv4, one for IPv6) in a
+              single `ipset restore`; one iptables rule per family matches the
+              whole set, so the INPUT chain does not grow with each block
+    iptables  appends one DROP rule per subnet, as the monitor used to
+
+Both then drop the subnets' existing connections with one conntrack call
+and save the rules to disk in a background thread, at most once every
+`persist_delay` seconds however many subnets were blocked meanwhile.
+
+Every command goes through a runner: a callable taking the argument list
+and optional stdin text and returning a subprocess.CompletedProcess. The
+default runs the command; RecordingRunner only records it, to test the
+batching or to dry-run the monitor without root.
+
+Failed firewall commands are not printed, since the monitor's dashboard
+owns the terminal; they are counted in `failures`, and the latest one
+kept in `last_error`, for the dashboard and metrics to show.
+"""
+
+import os
+import subprocess
+import threading
+import time
+
+SET_NAME = 'monitor_blocked'
+RULES_FILES = {4: '/etc/iptables/rules.v4', 6: '/etc/iptables/rules.v6'}
+IPSET_FILE = '/etc/iptables/ipsets'
+
+
+def run_command(args, input_text=None):
+    try:
+        return subprocess.run(args, input=input_text, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except OSError as e:
+        # A missing tool fails like the shell would, for check() to report
+        return subprocess.CompletedProcess(args, 127, stdout='', stderr=str(e))
+
+
+class RecordingRunner:
+    """
+    A runner that executes nothing and keeps (args, stdin) of every call.
+    """
+
+    def __init__(self, output=''):
+        self.calls = []
+        self.output = output
+        self.lock = threading.Lock()
+
+    def __call__(self, args, input_text=None):
+        with self.lock:
+            self.calls.append((list(args), input_text))
+        return subprocess.CompletedProcess(args, 0, stdout=self.output, stderr='')
+
+
+def family(subnet):
+    return 6 if ':' in subnet else 4
+
+
+def write_atomically(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class Blocker:
+    """
+    Queueing, bulk conntrack cleanup and debounced persistence shared by the
+    backends; subclasses implement _apply() and _save().
+    """
+
+    def __init__(self, runner=run_command, persist=True, persist_delay=5.0, write_file=write_atomically):
+        self.runner = runner
+        self.persist = persist
+        self.persist_delay = persist_delay
+        self.write_file = write_file
+        self.pending = []
+        self.blocked = set()
+        self.dirty = False
+        self.last_saved = 0.0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.saver = None
+        self.conntrack_batch = True  # conntrack before 1.4.6 has no -R
+        self.failures = 0
+        self.last_error = None
+        self.errors_lock = threading.Lock()  # check() runs in the caller's and the persist thread
+        if persist:
+            self.saver = threading.Thread(target=self._persist_loop, name='blocker-persist', daemon=True)
+            self.saver.start()
+
+    def setup(self):
+        pass
+
+    def check(self, result):
+        # Record a failed command; its output is still returned to the caller
+        if result.returncode != 0:
+            with self.errors_lock:
+                self.failures += 1
+                self.last_error = f"{' '.join(result.args)} ({result.returncode}): {(result.stderr or '').strip()}"
+        return result
+
+    def errors(self):
+        """
+        (failed commands so far, description of the latest or None).
+        """
+        with self.errors_lock:
+            return self.failures, self.last_error
+
+    def block(self, subnet):
+        if subnet not in self.blocked and subnet not in self.pending:
+            self.pending.append(subnet)
+
+    def flush(self):
+        """
+        Applies every subnet queued since the last flush. Returns the ones
+        now blocked; those whose firewall command failed are not, and are
+        forgotten until block() queues them again.
+        """
+        subnets, self.pending = self.pending, []
+        if not subnets:
+            return []
+        applied = self._apply(subnets)
+        if not applied:
+            return []
+        self.blocked.update(applied)
+        self._drop_connections(applied)
+        if self.persist:
+            with self.condition:
+                self.dirty = True
+                self.condition.notify()
+        return applied
+
+    def _drop_connections(self, subnets):
+        # One conntrack process reading a delete command per subnet from stdin.
+        # conntrack also fails when a subnet had no entries, so only a rejected
+        # -R switches to one process per subnet.
+        if self.conntrack_batch:
+            commands = ''.join(f"-D -f {'ipv6' if family(subnet) == 6 else 'ipv4'} -s {subnet}\n" for subnet in subnets)
+            result = self.runner(['conntrack', '-R', '-'], commands)
+            if result.returncode == 0 or 'option' not in (result.stderr or ''):
+                return
+            self.conntrack_batch = False
+        for subnet in subnets:
+            self.runner(['conntrack', '-D', '-f', 'ipv6' if family(subnet) == 6 else 'ipv4', '-s', subnet])
+
+    def _persist_loop(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.closed:
+                    self.condition.wait()
+                if not self.dirty:
+                    return
+                # Let more blocks accumulate until persist_delay has passed since the last save
+                wait = self.last_saved + self.persist_delay - time.monotonic()
+                if wait > 0 and not self.closed:
+                    self.condition.wait(wait)
+                    continue
+                self.dirty = False
+            self._save()
+            self.last_saved = time.monotonic()
+
+    def close(self):
+        """
+        Applies what is still queued and writes the rules out one last time.
+        """
+        self.flush()
+        if self.saver is not None:
+            with self.condition:
+                self.closed = True
+                self.condition.notify()
+            self.saver.join()
+
+    def _save_rules(self):
+        for version, command in ((4, 'iptables-save'), (6, 'ip6tables-save')):
+            result = self.check(self.runner([command]))
+            # A failed save prints nothing; keep the last good file rather than empty it
+            if result.returncode == 0:
+                self.write_file(RULES_FILES[version], result.stdout)
+
+    def _apply(self, subnets):
+        # Returns the subnets the firewall now drops
+        raise NotImplementedError
+
+    def _save(self):
+        raise NotImplementedError
+
+
+class IpsetBlocker(Blocker):
+    """
+    Blocks subnets by adding them to hash:net ipsets matched by a single
+    iptables/ip6tables DROP rule each.
+    """
+
+    name = 'ipset'
+
+    def __init__(self, runner=run_command, set_name=SET_NAME, **kwargs):
+        super().__init__(runner, **kwargs)
+        self.set_names = {4: set_name, 6: f"{set_name}6"}
+
+    def setup(self):
+        for version, iptables, set_family in ((4, 'iptables', 'inet'), (6, 'ip6tables', 'inet6')):
+            set_name = self.set_names[version]
+            self.check(self.runner(['ipset', 'create', set_name, 'hash:net', 'family', set_family, '-exist']))
+            rule = ['INPUT', '-m', 'set', '--match-set', set_name, 'src', '-j', 'DROP']
+            # Insert the rule once, at the top of INPUT
+            if self.runner([iptables, '-C', *rule]).returncode != 0:
+                self.check(self.runner([iptables, '-I', *rule[:1], '1', *rule[1:]]))
+
+    def _apply(self, subnets):
+        lines = ''.join(f"add {self.set_names[family(subnet)]} {subnet}\n" for subnet in subnets)
+        # A failed restore may have stopped part way; -exist makes adding all of them again harmless
+        if self.check(self.runner(['ipset', 'restore', '-exist'], lines)).returncode != 0:
+            return []
+        return subnets
+
+    def _save(self):
+        saved = [self.check(self.runner(['ipset', 'save', name])) for name in self.set_names.values()]
+        if all(result.returncode == 0 for result in saved):
+            self.write_file(IPSET_FILE, ''.join(result.stdout for result in saved))
+        self._save_rules()
+
+
+class IptablesBlocker(Blocker):
+    """
+    One DROP rule per subnet in INPUT, for hosts without ipset.
+    """
+
+    name = 'iptables'
+
+    def _apply(self, subnets):
+        applied = []
+        for subnet in subnets:
+            iptables = 'ip6tables' if family(subnet) == 6 else 'iptables'
+            if self.check(self.runner([iptables, '-A', 'INPUT', '-s', subnet, '-j', 'DROP'])).returncode == 0:
+                applied.append(subnet)
+        return applied
+
+    def _save(self):
+        self._save_rules()
+
+
+BLOCKERS = {'ipset': IpsetBlocker, 'iptables': IptablesBlocker}
@@ -0,0 +1,223 @@
+"""
+Connection sources for monitor.py.
+
+Each source returns a Counter of remote IP address -> number of TCP sockets
+in the requested states, for IPv4 and IPv6 (IPv4-mapped IPv6 addresses are
+reported as IPv4):
+
+    netlink  asks the kernel over a NETLINK_SOCK_DIAG socket; the kernel
+             filters by state, so only matching sockets are copied out
+    proc     one bulk read of /proc/net/tcp and /proc/net/tcp6, matched with
+             a single bytes regex per file
+    netstat  runs `netstat -nt` and splits its text, as the monitor used to
+
+Addresses are counted in their raw form and each distinct one is decoded
+once, so thousands of sockets from the same sources cost little more than
+a Counter update.
+"""
+
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+from collections import Counter
+
+# TCP states, numbered as in the kernel's include/net/tcp_states.h
+TCP_STATES = {
+    'ESTABLISHED': 1, 'SYN_SENT': 2, 'SYN_RECV': 3, 'FIN_WAIT1': 4, 'FIN_WAIT2': 5, 'TIME_WAIT': 6,
+    'CLOSE': 7, 'CLOSE_WAIT': 8, 'LAST_ACK': 9, 'LISTEN': 10, 'CLOSING': 11,
+}
+ESTABLISHED = ('ESTABLISHED',)
+
+PROC_FILES = ('/proc/net/tcp', '/proc/net/tcp6')
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLMSG_HEADER = struct.Struct('=IHHII')  # length, type, flags, sequence, port id
+INET_DIAG_REQ = struct.Struct('=BBBBI')  # family, protocol, extensions, pad, state bitmask
+INET_DIAG_SOCKID_SIZE = 48
+# Offset of the remote address in a reply: header, then family/state/timer/retrans
+# and the sockid's two ports and 16-byte local address
+REMOTE_OFFSET = NLMSG_HEADER.size + 4 + 4 + 16
+
+IPV4_MAPPED = bytes(10) + b'\xff\xff'
+
+
+def decode_address(raw):
+    """
+    Text form of a 4- or 16-byte network-order address, with IPv4-mapped
+    IPv6 addresses given as IPv4.
+    """
+    if len(raw) == 4:
+        return socket.inet_ntoa(raw)
+    if raw.startswith(IPV4_MAPPED):
+        return socket.inet_ntoa(raw[12:])
+    return socket.inet_ntop(socket.AF_INET6, raw)
+
+
+def decode_proc_address(hex_address):
+    # /proc/net/tcp* print addresses as 32-bit words in host byte order
+    if len(hex_address) == 8:
+        return socket.inet_ntoa(int(hex_address, 16).to_bytes(4, sys.byteorder))
+    return decode_address(b''.join(int(hex_address[i:i + 8], 16).to_bytes(4, sys.byteorder) for i in range(0, 32, 8)))
+
+
+def _state_mask(states):
+    return sum(1 << TCP_STATES[state] for state in states)
+
+
+def _count_addresses(raw_counts, decode):
+    # Decode each distinct address once; two raw forms may name the same IPv4 address
+    counts = Counter()
+    for raw, count in raw_counts.items():
+        counts[decode(raw)] += count
+    return counts
+
+
+class ProcNetSource:
+    """
+    Reads the kernel's socket tables from /proc/net/tcp and /proc/net/tcp6.
+    Files that do not exist (IPv6 disabled) are skipped.
+    """
+
+    name = 'proc'
+
+    def __init__(self, paths=PROC_FILES):
+        self.paths = paths
+        self.patterns = {}
+
+    def _pattern(self, states):
+        # "\n  12: 0100007F:1F90 0A01A8C0:C350 01 ..." -> the remote address of matching lines.
+        # Anchoring on the newline rather than ^ with re.M lets the scan skip
+        # from line to line instead of trying every position.
+        if states not in self.patterns:
+            codes = b'|'.join(b'%02X' % TCP_STATES[state] for state in states)
+            self.patterns[states] = re.compile(rb'\n *\d+: [0-9A-F]+:[0-9A-F]{4} ([0-9A-F]+):[0-9A-F]{4} (?:%s) ' % codes)
+        return self.patterns[states]
+
+    def read(self, states=ESTABLISHED):
+        pattern = self._pattern(tuple(states))
+        raw_counts = Counter()
+        for path in self.paths:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            raw_counts.update(pattern.findall(data))
+        return _count_addresses(raw_counts, decode_proc_address)
+
+
+class NetlinkSource:
+    """
+    Dumps TCP sockets through NETLINK_SOCK_DIAG (what `ss` uses). The state
+    filter is applied by the kernel. Raises OSError where netlink sockets are
+    not available.
+    """
+
+    name = 'netlink'
+
+    def __init__(self, families=(socket.AF_INET, socket.AF_INET6), buffer_size=1 << 20):
+        self.families = families
+        self.buffer_size = buffer_size
+        self.sequence = 0
+        self.reply_formats = {}
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+
+    def _replies(self, size, address_size):
+        # Length, type, sequence number and remote address of `size`-byte replies
+        key = (size, address_size)
+        if key not in self.reply_formats:
+            self.reply_formats[key] = struct.Struct(
+                f'=IH2xI4x{REMOTE_OFFSET - NLMSG_HEADER.size}x{address_size}s{size - REMOTE_OFFSET - address_size}x')
+        return self.reply_formats[key]
+
+    def _dump(self, family, mask, raw_counts):
+        self.sequence += 1
+        request = INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, 0, 0, mask) + bytes(INET_DIAG_SOCKID_SIZE)
+        self.sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), SOCK_DIAG_BY_FAMILY,
+                                         NLM_F_REQUEST | NLM_F_DUMP, self.sequence, 0) + request)
+        address_size = 4 if family == socket.AF_INET else 16
+        while True:
+            data = self.sock.recv(self.buffer_size)
+            offset = 0
+            while offset < len(data):
+                length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+                if message_type == NLMSG_DONE:
+                    return
+                if message_type == NLMSG_ERROR:
+                    error = -struct.unpack_from('=i', data, offset + NLMSG_HEADER.size)[0]
+                    raise OSError(error, f"sock_diag dump failed: {os.strerror(error)}")
+                size = (length + 3) & ~3
+                if message_type != SOCK_DIAG_BY_FAMILY or length < REMOTE_OFFSET + address_size:
+                    offset += size
+                    continue
+                # The sockets of one dump come as a run of equally long replies;
+                # unpack the whole run at once and stop at the first one that differs
+                count = (len(data) - offset) // size
+                replies = list(self._replies(size, address_size).iter_unpack(data[offset:offset + count * size]))
+                run = next((i for i, reply in enumerate(replies) if reply[0] != length or reply[1] != SOCK_DIAG_BY_FAMILY), count)
+                raw_counts.update(reply[3] for reply in replies[:run] if reply[2] == self.sequence)
+                offset += run * size
+
+    def read(self, states=ESTABLISHED):
+        mask = _state_mask(states)
+        raw_counts = Counter()
+        for family in self.families:
+            self._dump(family, mask, raw_counts)
+        return _count_addresses(raw_counts, decode_address)
+
+    def close(self):
+        self.sock.close()
+
+
+class NetstatSource:
+    """
+    Runs `netstat -nt` and parses its output line by line.
+    """
+
+    name = 'netstat'
+
+    def read(self, states=ESTABLISHED):
+        result = subprocess.run(["netstat", "-nt"], stdout=subprocess.PIPE, text=True)
+        return parse_netstat(result.stdout, states)
+
+
+def parse_netstat(text, states=ESTABLISHED):
+    counts = Counter()
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 6 and parts[5] in states:
+            address = parts[4].rsplit(':', 1)[0]
+            counts[address[7:] if address.startswith('::ffff:') else address] += 1
+    return counts
+
+
+SOURCES = {'netlink': NetlinkSource, 'proc': ProcNetSource, 'netstat': NetstatSource}
+
+
+def open_source(name='auto'):
+    """
+    The named connection source; 'auto' tries netlink, then /proc, then netstat.
+    """
+    if name != 'auto':
+        return SOURCES[name]()
+    try:
+        source = NetlinkSource()
+        source.read()
+        return source
+    except OSError:
+        pass
+    try:
+        with open(PROC_FILES[0], 'rb'):
+            return ProcNetSource()
+    except OSError:
+        return NetstatSource()
@@ -0,0 +1,154 @@
+"""
+Outputs for monitor.py's metrics.
+
+The monitor hands a metrics dict to an output a few times a second, from
+its own thread, never from the detection loop:
+
+    TerminalDashboard  redraws the busiest subnets and the latest blocks
+                       in one write per frame
+    FileMetrics        rewrites a JSON file atomically, for scrapers
+    SocketMetrics      listens on a UNIX socket and sends every connected
+                       client one JSON line per frame; clients too slow
+                       to keep up are dropped rather than waited for
+    StreamMetrics      JSON lines on stdout, to pipe into other tools
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+CLEAR = "\033[2J\033[H"
+
+
+def format_dashboard(metrics):
+    lines = [f"Active Connections (top {len(metrics['top'])} of {metrics['subnets']} subnets, "
+             f"{metrics['sources']} sources):",
+             "--------------------",
+             f"{'subnet':<24}{'now':>8}{'avg':>8}{'new/s':>8}"]
+    for row in metrics['top']:
+        lines.append(f"{row['subnet']:<24}{row['connections']:>8}{row['average']:>8.1f}{row['new_per_second']:>8.1f}")
+
+    lines += ["", f"Blocked Subnets: {metrics['blocked']}", "--------------------"]
+    for block in reversed(metrics['recent_blocks']):
+        clock = time.strftime('%H:%M:%S', time.localtime(block['time']))
+        lines.append(f"\033[91m{clock} {block['subnet']} (Blocked: {block['reason']})\033[0m")
+
+    detection = metrics['detection']
+    lines += ["", f"Detection: {detection['seconds'] * 1e3:.0f} ms per read every {detection['interval'] * 1e3:.0f} ms, "
+                  f"{detection['overruns']} overruns, {metrics['tracked_prefixes']} prefixes tracked"]
+    firewall = metrics['firewall']
+    if firewall['failures']:
+        lines.append(f"\033[91mFirewall commands failed: {firewall['failures']}, latest: {firewall['last_error']}\033[0m")
+    return '\n'.join(lines) + '\n'
+
+
+class TerminalDashboard:
+    """
+    Redraws the terminal with each frame.
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+
+    def write(self, metrics):
+        # One write, so the screen is not left half drawn while the terminal catches up
+        self.stream.write(CLEAR + format_dashboard(metrics))
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class FileMetrics:
+    """
+    Keeps `path` holding the latest metrics as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, metrics):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(metrics, f)
+        os.replace(temporary, self.path)
+
+    def close(self):
+        pass
+
+
+class StreamMetrics:
+    """
+    Writes one JSON line per frame to a stream.
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+
+    def write(self, metrics):
+        self.stream.write(json.dumps(metrics) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class SocketMetrics:
+    """
+    Serves JSON lines to the clients of a UNIX stream socket at `path`,
+    e.g. `socat - UNIX-CONNECT:/run/monitor.sock`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)  # Left over from an earlier run
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.server.setblocking(False)
+        self.clients = []
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except BlockingIOError:
+                return
+            client.setblocking(False)
+            self.clients.append(client)
+
+    def write(self, metrics):
+        self._accept()
+        line = (json.dumps(metrics) + '\n').encode()
+        connected = []
+        for client in self.clients:
+            try:
+                # A client whose buffer cannot take a whole line is falling behind
+                if client.send(line) == len(line):
+                    connected.append(client)
+                    continue
+            except OSError:
+                pass
+            client.close()
+        self.clients = connected
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.server.close()
+        os.unlink(self.path)
+
+
+def open_metrics(target):
+    """
+    The output for --metrics: '-' for stdout, 'unix:PATH' for a UNIX
+    socket, anything else for a file.
+    """
+    if target == '-':
+        return StreamMetrics()
+    if target.startswith('unix:'):
+        return SocketMetrics(target[len('unix:'):])
+    return FileMetrics(target)
@@ -1,105 +1,236 @@
 #REDUCED DDOS by 99% =)
+import argparse
 import os
-import subprocess
+import threading
 import time
-from collections import defaultdict, deque
+from collections import deque
+
+from blocker import BLOCKERS
+from connections import SOURCES, open_source
+from dashboard import TerminalDashboard, open_metrics
+from rates import RateTracker
 
 # Parameters
 THRESHOLD = 10  # Connections per subnet to trigger immediate block
 HISTORY_WINDOW = 5  # Number of intervals to track
 INTERVAL = 1  # Monitoring interval in seconds
 PERSISTENT_THRESHOLD = 25  # Total connections over the history window to block
-
-# Connection history: {subnet: deque([counts_per_interval])}
-connection_history = defaultdict(lambda: deque(maxlen=HISTORY_WINDOW))
+NEW_CONNECTION_THRESHOLD = 50  # New connections per subnet over the history window to block
+SUPERNET_FACTOR = 16  # A /16 is blocked at this many times the /24 thresholds
+SAMPLE_INTERVAL = 0.25  # Seconds between connection reads; every read is checked
+STATES = ('SYN_RECV', 'ESTABLISHED')  # Half-open connections count too, so SYN floods show up
+TOP_SUBNETS = 20  # Busiest subnets shown on the dashboard
+FRAME_RATE = 2  # Dashboard redraws (or metrics writes) per second
+RECENT_BLOCKS = 10  # Latest blocks shown on the dashboard
+
+# Sliding windows of connections per source, subnet and supernet (see rates.py)
+rate_tracker = RateTracker(window=HISTORY_WINDOW, bucket_seconds=INTERVAL)
 blocked_subnets = set()
+queued_blocks = {}  # subnet -> reason, for the blocks waiting for the next flush
+block_log = deque(maxlen=RECENT_BLOCKS)  # {'time', 'subnet', 'reason'} of the latest blocks
+
+# Held by the detection thread while it updates the state above, and by
+# the dashboard while it reads it
+state_lock = threading.Lock()
+detection_stats = {'samples': 0, 'seconds': 0.0, 'overruns': 0, 'sources': 0}
+
+# Where connections are read from (see connections.py); chosen on first use
+connection_source = None
+
+# Applies the blocks (see blocker.py); set up in __main__
+blocker = None
 
 
 def get_active_connections():
     """
-    Use netstat to retrieve active connections in ESTABLISHED state.
-    Returns a dictionary of subnets and connection counts.
+    Read the connections in STATES from the connection source.
+    Returns a Counter of source addresses and connection counts.
     """
-    result = subprocess.run(
-        ["netstat", "-nt"],
-        stdout=subprocess.PIPE,
-        text=True
-    )
-    lines = result.stdout.splitlines()
+    global connection_source
+    if connection_source is None:
+        connection_source = open_source()
+    return connection_source.read(STATES)
 
-    connections = defaultdict(int)
-    for line in lines:
-        if "ESTABLISHED" in line:  # Only count established connections
-            parts = line.split()
-            if len(parts) >= 5:
-                source_ip = parts[4].split(":")[0]
-                # Extract /24 subnet (first 3 octets)
-                subnet = ".".join(source_ip.split(".")[:3]) + ".0/24"
-                connections[subnet] += 1
 
-    return connections
+def find_offenders(tracker):
+    """
+    Check every subnet in the tracker's latest snapshot against the thresholds.
+    Returns (subnet, reason) for each one to block.
+    """
+    offenders = []
+    for level, factor in (('/24', 1), ('/64', 1), ('/16', SUPERNET_FACTOR)):
+        # A /16 is judged once the /24s caught in it are out of its counts
+        caught = {subnet.rsplit('.', 2)[0] for subnet, _ in offenders}
+        for subnet, count, load, new in tracker.exceeding(level, THRESHOLD * factor, PERSISTENT_THRESHOLD * factor,
+                                                         NEW_CONNECTION_THRESHOLD * factor):
+            if subnet in blocked_subnets or (level == '/16' and subnet.rsplit('.', 2)[0] in caught):
+                continue
+            # Immediate block for high connection counts
+            if count > THRESHOLD * factor:
+                offenders.append((subnet, f"{count} connections"))
+            # Persistent activity or a burst of new connections over the history window
+            elif load > PERSISTENT_THRESHOLD * factor:
+                offenders.append((subnet, f"persistent activity, {load:.0f} connections"))
+            elif new > NEW_CONNECTION_THRESHOLD * factor:
+                offenders.append((subnet, f"{new:.0f} new connections"))
+    return offenders
+
+
+def block_subnet(subnet, reason=None):
+    """
+    Queue the offending subnet with the blocker. Its traffic is dropped and
+    its existing connections terminated when the blocker is flushed at the
+    end of the sample.
+    """
+    if subnet not in blocked_subnets and subnet not in queued_blocks:
+        queued_blocks[subnet] = reason or 'manual'
+        blocker.block(subnet)
 
 
-def block_subnet(subnet):
+def record_blocks(subnets):
     """
-    Add an iptables rule to drop all traffic from the offending subnet
-    and terminate existing connections.
+    Mark the subnets the blocker applied as blocked. Queued subnets whose
+    firewall command failed are not, so they are caught and tried again
+    on a later sample if they keep offending.
     """
-    if subnet not in blocked_subnets:
-        print(f"\033[91mBlocking subnet: {subnet}\033[0m")  # Red text for blocked subnets
-        os.system(f"iptables -A INPUT -s {subnet} -j DROP")
-        os.system("iptables-save > /etc/iptables/rules.v4")
-
-        # Terminate existing connections aggressively
-        print(f"Terminating active connections for subnet: {subnet}")
-        os.system(f"conntrack -D -s {subnet}")
+    for subnet in subnets:
         blocked_subnets.add(subnet)
+        # Its remaining sockets are dropped traffic; keep them out of its supernet's counts
+        rate_tracker.ignore(subnet)
+        # Shown by the dashboard; the detection loop does not write to the terminal
+        block_log.append({'time': time.time(), 'subnet': subnet, 'reason': queued_blocks.get(subnet, 'manual')})
+    queued_blocks.clear()
 
 
-def monitor_connections():
+def check_connections(connections, now):
     """
-    Monitor active connections and block subnets exceeding thresholds.
+    One detection step: add a snapshot of source address -> connections
+    taken at monotonic time `now`, block the subnets over the thresholds
+    and apply the blocks. Returns the subnets blocked.
     """
-    global connection_history, blocked_subnets
-
-    while True:
-        active_connections = get_active_connections()
-        print("\033[2J\033[H")  # Clear the terminal
-        print("Active Connections:")
-        print("--------------------")
+    with state_lock:
+        rate_tracker.update(connections, now)
+        for subnet, reason in find_offenders(rate_tracker):
+            block_subnet(subnet, reason)
 
-        for subnet, count in active_connections.items():
-            print(f"{subnet}: {count} connections")
+    # One batch of firewall and conntrack commands for all of this sample's blocks
+    blocked = blocker.flush()
+    with state_lock:
+        record_blocks(blocked)
+    return blocked
 
-            # Update connection history
-            connection_history[subnet].append(count)
 
-            # Immediate block for high connection rates
-            if count > THRESHOLD:
-                block_subnet(subnet)
-
-            # Check persistent activity over history window
-            if subnet not in blocked_subnets:
-                total_connections = sum(connection_history[subnet])
-                if total_connections > PERSISTENT_THRESHOLD:
-                    print(f"\033[93mPersistent activity detected: {subnet} ({total_connections} connections)\033[0m")
-                    block_subnet(subnet)
-
-        print("\nBlocked Subnets:")
-        print("--------------------")
-        for subnet in blocked_subnets:
-            print(f"{subnet} (Blocked)")
-
-        time.sleep(INTERVAL)
+def monitor_connections(stop):
+    """
+    Detection loop: read the connections, check them and apply the blocks
+    every SAMPLE_INTERVAL until `stop` is set. Reads that overrun skip the
+    missed slots instead of running back to back.
+    """
+    next_sample = time.monotonic()
+    while not stop.is_set():
+        started = time.monotonic()
+        connections = get_active_connections()
+        check_connections(connections, started)
+
+        now = time.monotonic()
+        next_sample += SAMPLE_INTERVAL
+        overrun = next_sample < now
+        if overrun:
+            next_sample += (now - next_sample) // SAMPLE_INTERVAL * SAMPLE_INTERVAL + SAMPLE_INTERVAL
+        with state_lock:
+            detection_stats['samples'] += 1
+            detection_stats['seconds'] = now - started
+            detection_stats['sources'] = len(connections)
+            detection_stats['overruns'] += overrun
+        stop.wait(next_sample - now)
+
+
+def collect_metrics(top=TOP_SUBNETS):
+    """
+    Snapshot of the detection state for the dashboard and --metrics: the
+    `top` subnets opening the most new connections, then holding the most,
+    with their average connections and new connections per second over
+    the history window.
+    """
+    window_seconds = HISTORY_WINDOW * INTERVAL
+    failures, last_error = blocker.errors()
+    with state_lock:
+        busiest = sorted(rate_tracker.top('/24', top) + rate_tracker.top('/64', top),
+                         key=lambda row: (row[3], row[2]), reverse=True)[:top]
+        return {
+            'time': time.time(),
+            'sources': detection_stats['sources'],
+            'subnets': len(rate_tracker.levels['/24'].current) + len(rate_tracker.levels['/64'].current),
+            'tracked_prefixes': len(rate_tracker),
+            'top': [{'subnet': subnet, 'connections': count, 'average': load / HISTORY_WINDOW,
+                     'new_per_second': new / window_seconds} for subnet, count, load, new in busiest],
+            'blocked': len(blocked_subnets),
+            'recent_blocks': list(block_log),
+            'detection': dict(detection_stats, interval=SAMPLE_INTERVAL),
+            'firewall': {'failures': failures, 'last_error': last_error},
+        }
+
+
+def show_metrics(output, detector, frame_rate=FRAME_RATE, top=TOP_SUBNETS):
+    """
+    Hand the metrics to the dashboard or --metrics output at most
+    `frame_rate` times a second, for as long as the detection thread runs.
+    """
+    while detector.is_alive():
+        started = time.monotonic()
+        output.write(collect_metrics(top))
+        detector.join(max(1 / frame_rate - (time.monotonic() - started), 0))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Block subnets that open too many connections.")
+    parser.add_argument('--source', choices=['auto', *SOURCES], default='auto',
+                        help='Where connections are read from; auto prefers netlink, then /proc/net/tcp, then netstat')
+    parser.add_argument('--blocker', choices=list(BLOCKERS), default='ipset',
+                        help='ipset adds subnets to a kernel hash set matched by one rule; iptables adds a rule per subnet')
+    parser.add_argument('--persist-delay', type=float, default=5.0,
+                        help='Minimum seconds between saves of the rules to /etc/iptables')
+    parser.add_argument('--top', type=int, default=TOP_SUBNETS, help='Busiest subnets shown')
+    parser.add_argument('--fps', type=float, default=FRAME_RATE, help='Dashboard redraws per second')
+    parser.add_argument('--metrics', metavar='TARGET',
+                        help="Write JSON metrics instead of drawing the dashboard: to a file, "
+                             "to 'unix:PATH' (a UNIX socket streaming one line per frame) or to '-' for stdout")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    print("Starting SYN connection monitor...")
-    try:
-        # Ensure conntrack is installed
-        if os.system("which conntrack > /dev/null") != 0:
-            print("\033[91mError: conntrack is not installed. Install it with 'sudo apt install conntrack'.\033[0m")
+    args = parse_args()
+    connection_source = open_source(args.source)
+    print(f"Starting SYN connection monitor (reading connections via {connection_source.name}, blocking via {args.blocker})...")
+    # Ensure conntrack, ip6tables (and ipset, when used) are installed; ip6tables comes with iptables
+    tools = {'conntrack': 'conntrack', 'ip6tables': 'iptables'}
+    if args.blocker == 'ipset':
+        tools['ipset'] = 'ipset'
+    for tool, package in tools.items():
+        if os.system(f"which {tool} > /dev/null") != 0:
+            print(f"\033[91mError: {tool} is not installed. Install it with 'sudo apt install {package}'.\033[0m")
             exit(1)
-        monitor_connections()
+    blocker = BLOCKERS[args.blocker](persist_delay=args.persist_delay)
+    blocker.setup()
+    if blocker.failures:
+        # Before the dashboard takes over the terminal
+        print(f"\033[91mError setting up the {args.blocker} blocker: {blocker.last_error}\033[0m")
+    output = open_metrics(args.metrics) if args.metrics else TerminalDashboard()
+
+    # Detection keeps its own cadence; drawing the dashboard happens here, between frames
+    stop = threading.Event()
+    detector = threading.Thread(target=monitor_connections, args=(stop,), name='detection', daemon=True)
+    detector.start()
+    try:
+        show_metrics(output, detector, args.fps, args.top)
     except KeyboardInterrupt:
         print("\nExiting...")
+    finally:
+        failed = not stop.is_set() and not detector.is_alive()
+        stop.set()
+        detector.join()
+        output.close()
+        blocker.close()
+    if failed:
+        print("\033[91mError: the detection loop stopped.\033[0m")
+        exit(1)
@@ -0,0 +1,299 @@
+"""
+Connection rate tracking for monitor.py.
+
+RateTracker takes the per-address socket counts of each connection
+snapshot and keeps, for every prefix at each level
+
+    /32  IPv4 sources
+    /24  IPv4 subnets (what the monitor blocks)
+    /16  IPv4 supernets
+    /64  IPv6 subnets
+
+a sliding window of `window` buckets of `bucket_seconds` each:
+
+    load  connections held, in connection-buckets: a subnet holding 6
+          connections for 5 one-second buckets has a load of 30, whatever
+          the sampling rate, as the monitor's per-interval history summed
+    new   new connections: how much an address's socket count rose since
+          the previous snapshot, summed over the addresses in the prefix
+
+Prefixes are integer keys (the address shifted right by the host bits)
+mapped to slots in flat arrays. A prefix whose window has emptied is
+evicted, and each level holds at most `max_prefixes`; past that the least
+recently active prefix makes room, so memory stays bounded however many
+sources an attack uses.
+"""
+
+import heapq
+import socket
+import time
+from array import array
+from collections import OrderedDict
+
+MAX_PREFIXES = 100_000  # Per level
+
+
+class PrefixTable:
+    """
+    The sliding windows of one prefix length of one address family.
+
+    `current` maps each prefix seen in the latest snapshot to its number
+    of connections there.
+    """
+
+    def __init__(self, family, prefix_length, window, max_prefixes=MAX_PREFIXES):
+        self.family = family
+        self.prefix_length = prefix_length
+        self.shift = (32 if family == socket.AF_INET else 128) - prefix_length
+        self.window = window
+        self.max_prefixes = max_prefixes
+        self.slots = OrderedDict()  # key -> slot, least recently active first
+        self.free = []
+        self.epochs = array('q')  # Last bucket written, per slot
+        self.load = array('d')  # `window` buckets per slot, bucket b at b % window
+        self.new = array('d')
+        self.load_totals = array('d')  # Sums of each slot's buckets
+        self.new_totals = array('d')
+        self.empty = array('d', bytes(8 * window))
+        self.current = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def prefix(self, key):
+        """
+        The text form of a key, e.g. '192.0.2.0/24'.
+        """
+        size = 4 if self.family == socket.AF_INET else 16
+        return f"{socket.inet_ntop(self.family, (key << self.shift).to_bytes(size, 'big'))}/{self.prefix_length}"
+
+    def key(self, address):
+        return int.from_bytes(socket.inet_pton(self.family, address), 'big') >> self.shift
+
+    def _allocate(self, key, bucket):
+        if len(self.slots) >= self.max_prefixes:
+            # Full of active prefixes: drop the one idle the longest
+            _, slot = self.slots.popitem(last=False)
+            self.free.append(slot)
+        if self.free:
+            slot = self.free.pop()
+            start = slot * self.window
+            self.load[start:start + self.window] = self.new[start:start + self.window] = self.empty
+            self.epochs[slot] = bucket
+            self.load_totals[slot] = self.new_totals[slot] = 0.0
+        else:
+            slot = len(self.epochs)
+            self.epochs.append(bucket)
+            self.load.extend(self.empty)
+            self.new.extend(self.empty)
+            self.load_totals.append(0.0)
+            self.new_totals.append(0.0)
+        self.slots[key] = slot
+        return slot
+
+    def _advance(self, key, slot, bucket):
+        # Clear the buckets that passed since the slot was last written
+        load, new, window = self.load, self.new, self.window
+        start = slot * window
+        cleared = False
+        for b in range(max(self.epochs[slot] + 1, bucket - window + 1), bucket + 1):
+            position = start + b % window
+            if load[position] or new[position]:
+                load[position] = new[position] = 0.0
+                cleared = True
+        if cleared:
+            # Summed afresh rather than subtracted, so rounding cannot build up in a long-lived slot
+            self.load_totals[slot] = sum(load[start:start + window])
+            self.new_totals[slot] = sum(new[start:start + window])
+        self.epochs[slot] = bucket
+        self.slots.move_to_end(key)
+
+    def add(self, counts, new_counts, bucket, weight):
+        """
+        Records a snapshot: `counts` connections and `new_counts` new
+        connections per key, the counts held for `weight` of a bucket.
+        """
+        slots, epochs, window = self.slots, self.epochs, self.window
+        load, new, load_totals, new_totals = self.load, self.new, self.load_totals, self.new_totals
+        offset = bucket % window
+        for key, count in counts.items():
+            slot = slots.get(key)
+            if slot is None:
+                slot = self._allocate(key, bucket)
+            elif epochs[slot] != bucket:
+                self._advance(key, slot, bucket)
+            position = slot * window + offset
+            held = count * weight
+            load[position] += held
+            load_totals[slot] += held
+        # Every key with new connections was just written, in this bucket
+        for key, opened in new_counts.items():
+            slot = slots.get(key)
+            if slot is not None:
+                new[slot * window + offset] += opened
+                new_totals[slot] += opened
+        self.current = counts
+
+    def expire(self, bucket):
+        """
+        Evicts the prefixes whose window no longer holds any bucket.
+        """
+        oldest = bucket - self.window
+        while self.slots:
+            key, slot = next(iter(self.slots.items()))
+            if self.epochs[slot] > oldest:
+                break
+            del self.slots[key]
+            self.free.append(slot)
+
+    def window_totals(self, key, bucket):
+        """
+        (load, new connections) of a prefix over the window ending at `bucket`.
+        """
+        slot = self.slots.get(key)
+        if slot is None:
+            return 0.0, 0.0
+        load, new = self.load_totals[slot], self.new_totals[slot]
+        # Leave out the buckets that have slid out of the window since the slot was written
+        start = slot * self.window
+        for b in range(self.epochs[slot] - self.window + 1, min(bucket - self.window + 1, self.epochs[slot] + 1)):
+            load -= self.load[start + b % self.window]
+            new -= self.new[start + b % self.window]
+        return load, new
+
+    def exceeding(self, count_limit, load_limit, new_limit):
+        """
+        (key, connections, load, new connections) of the prefixes in the
+        latest snapshot over any of the limits.
+        """
+        slots, load_totals, new_totals = self.slots, self.load_totals, self.new_totals
+        for key, count in self.current.items():
+            slot = slots.get(key)
+            if slot is None:
+                continue  # Evicted to make room later in the same snapshot
+            if count > count_limit or load_totals[slot] > load_limit or new_totals[slot] > new_limit:
+                yield key, count, load_totals[slot], new_totals[slot]
+
+    def top(self, k):
+        """
+        (key, connections, load, new connections) of the `k` prefixes in the
+        latest snapshot opening the most new connections, then holding the
+        most over the window.
+        """
+        slots, load_totals, new_totals = self.slots, self.load_totals, self.new_totals
+        ranked = [(new_totals[slot], load_totals[slot], key, count)
+                  for key, count in self.current.items() if (slot := slots.get(key)) is not None]
+        return [(key, count, load, new) for new, load, key, count in heapq.nlargest(k, ranked)]
+
+
+class RateTracker:
+    """
+    Sliding-window connection counts per /32, /24 and /16 IPv4 prefix and
+    per IPv6 /64, fed one snapshot at a time by update().
+    """
+
+    def __init__(self, window=5, bucket_seconds=1.0, max_prefixes=MAX_PREFIXES):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.levels = {
+            '/32': PrefixTable(socket.AF_INET, 32, window, max_prefixes),
+            '/24': PrefixTable(socket.AF_INET, 24, window, max_prefixes),
+            '/16': PrefixTable(socket.AF_INET, 16, window, max_prefixes),
+            '/64': PrefixTable(socket.AF_INET6, 64, window, max_prefixes),
+        }
+        self.ignored = {name: set() for name in self.levels}
+        self.bucket = None
+        self.last_update = None
+
+    def ignore(self, prefix):
+        """
+        Leaves the connections from a prefix such as '192.0.2.0/24' out of
+        later snapshots, e.g. once it is blocked.
+        """
+        address, length = prefix.split('/')
+        name = f"/{length}"
+        self.ignored[name].add(self.levels[name].key(address))
+
+    def update(self, counts, now=None):
+        """
+        Adds a snapshot of remote address -> number of connections (a
+        connection source's Counter) taken at monotonic time `now`.
+        """
+        if now is None:
+            now = time.monotonic()
+        bucket = int(now // self.bucket_seconds)
+        first = self.last_update is None
+        # The snapshot stands for the time since the previous one, up to a bucket
+        weight = 1.0 if first else min(max(now - self.last_update, 0.0) / self.bucket_seconds, 1.0)
+        self.bucket, self.last_update = bucket, now
+
+        ignored = self.ignored
+        filtering = any(ignored.values())
+        # Plain dicts rather than Counters: these loops run once per source
+        sources, subnets, supernets, subnets6 = {}, {}, {}, {}
+        inet_aton, from_bytes = socket.inet_aton, int.from_bytes
+        for address, count in counts.items():
+            if ':' in address:
+                subnet6 = from_bytes(socket.inet_pton(socket.AF_INET6, address), 'big') >> 64
+                if not filtering or subnet6 not in ignored['/64']:
+                    subnets6[subnet6] = subnets6.get(subnet6, 0) + count
+            else:
+                source = from_bytes(inet_aton(address), 'big')
+                if filtering and (source in ignored['/32'] or source >> 8 in ignored['/24'] or source >> 16 in ignored['/16']):
+                    continue
+                sources[source] = count
+                subnet = source >> 8
+                subnets[subnet] = subnets.get(subnet, 0) + count
+        for subnet, count in subnets.items():
+            supernets[subnet >> 8] = supernets.get(subnet >> 8, 0) + count
+
+        # New connections are counted per address (per /64 for IPv6), so that
+        # one source closing connections does not hide another opening them
+        # (the connections already open in the first snapshot are not new)
+        levels = self.levels
+        new_sources = _rises(sources if first else levels['/32'].current, sources)
+        new_subnets, new_supernets = {}, {}
+        for source, new in new_sources.items():
+            new_subnets[source >> 8] = new_subnets.get(source >> 8, 0) + new
+            new_supernets[source >> 16] = new_supernets.get(source >> 16, 0) + new
+
+        for name, level_counts, new_counts in (('/32', sources, new_sources), ('/24', subnets, new_subnets),
+                                               ('/16', supernets, new_supernets),
+                                               ('/64', subnets6, _rises(subnets6 if first else levels['/64'].current, subnets6))):
+            table = levels[name]
+            table.expire(bucket)
+            table.add(level_counts, new_counts, bucket, weight)
+
+    def exceeding(self, level, count_limit, load_limit, new_limit):
+        """
+        (prefix, connections now, window load, window new connections) for
+        the prefixes of `level` in the latest snapshot over any of the limits.
+        """
+        table = self.levels[level]
+        for key, count, load, new in table.exceeding(count_limit, load_limit, new_limit):
+            yield table.prefix(key), count, load, new
+
+    def top(self, level, k):
+        """
+        The `k` busiest prefixes of `level` in the latest snapshot, as
+        (prefix, connections now, window load, window new connections).
+        """
+        table = self.levels[level]
+        return [(table.prefix(key), count, load, new) for key, count, load, new in table.top(k)]
+
+    def prefixes(self, level):
+        """
+        (prefix, connections now, window load, window new connections) for
+        every prefix of `level` in the latest snapshot.
+        """
+        table = self.levels[level]
+        for key, count in table.current.items():
+            load, new = table.window_totals(key, self.bucket)
+            yield table.prefix(key), count, load, new
+
+    def __len__(self):
+        return sum(len(table) for table in self.levels.values())
+
+
+def _rises(previous, counts):
+    return {key: count - previous.get(key, 0) for key, count in counts.items() if count > previous.get(key, 0)}
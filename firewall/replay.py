@@ -0,0 +1,320 @@
+"""
+Replay connection snapshots through monitor.py's detection, offline.
+
+Each snapshot (source address -> connections, as a connection source
+returns it) goes through monitor.check_connections(), the same step the
+monitor runs on every read, with a dry-run blocker that records the
+firewall commands instead of running them. No root and no network are
+needed, and snapshots are replayed as fast as they can be checked:
+
+    python replay.py synthetic --bots 50000 --clients 20000
+    python replay.py record capture.jsonl.gz --seconds 120
+    python replay.py file capture.jsonl.gz
+
+`synthetic` generates a botnet ramping up among legitimate clients and a
+few busy NAT gateways; `record` saves what this machine's connection
+source reads every SAMPLE_INTERVAL; `file` replays such a recording (or a
+synthetic run saved with --save). Thresholds can be overridden to try a
+tuning before deploying it.
+
+Reported: snapshots checked per second, the blocks with when they
+happened and, when the attacking addresses are known (synthetic runs and
+recordings with an "attackers" list in their header), detection latency
+per attacking /24, how much of the attack is blocked and the false
+positives: blocked prefixes without an attacking source.
+
+Snapshot files are JSON lines, gzipped when the name ends in .gz: a header
+{"interval": ..., "attackers": [...]} then {"time": ..., "connections":
+{...}} per snapshot, times in seconds.
+"""
+
+import argparse
+import gzip
+import ipaddress
+import json
+import random
+import socket
+import statistics
+import sys
+import time
+from collections import Counter, deque
+
+import monitor
+from blocker import BLOCKERS, RecordingRunner
+from connections import SOURCES, open_source
+from rates import RateTracker
+
+
+def open_snapshots(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def read_snapshots(path):
+    """
+    The header of a snapshot file and a generator of its (time, connections).
+    """
+    f = open_snapshots(path)
+    header = json.loads(f.readline())
+
+    def snapshots():
+        with f:
+            for line in f:
+                snapshot = json.loads(line)
+                yield snapshot['time'], Counter(snapshot['connections'])
+
+    return header, snapshots()
+
+
+def write_snapshots(path, header, snapshots):
+    with open_snapshots(path, 'w') as f:
+        f.write(json.dumps(header) + '\n')
+        for now, connections in snapshots:
+            f.write(json.dumps({'time': now, 'connections': connections}) + '\n')
+            yield now, connections
+
+
+def address(value):
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+
+def random_subnets(rng, count):
+    # Distinct public-looking /24s, as integer keys (the address >> 8)
+    subnets = set()
+    while len(subnets) < count:
+        first = rng.randint(1, 223)
+        if first not in (10, 127):
+            subnets.add((first << 16) | rng.getrandbits(16))
+    return list(subnets)
+
+
+def hosts(rng, subnet, count):
+    return [(subnet << 8) | host for host in rng.sample(range(1, 255), count)]
+
+
+def synthetic_snapshots(args):
+    """
+    The attacking addresses and a generator of (time, connections): from
+    `attack_start`, `bots` sources spread over `bot_subnets` /24s join one
+    by one over `ramp` seconds, each holding about `bot_connections` and
+    reconnecting all the time. Meanwhile `clients` legitimate sources in
+    `client_subnets` /24s come and go with a few connections each, and
+    `nat_gateways` addresses each carry a handful.
+    """
+    rng = random.Random(args.seed)
+    if args.bots > 254 * args.bot_subnets:
+        sys.exit("--bots does not fit in --bot-subnets")
+    subnets = random_subnets(rng, args.bot_subnets + args.client_subnets)
+    bot_subnets, client_subnets = subnets[:args.bot_subnets], subnets[args.bot_subnets:]
+
+    bots = []
+    for i, subnet in enumerate(bot_subnets):
+        bots += hosts(rng, subnet, args.bots // args.bot_subnets + (i < args.bots % args.bot_subnets))
+    joins = sorted((args.attack_start + rng.random() * args.ramp, address(bot)) for bot in bots)
+    clients = [address(rng.choice(client_subnets) << 8 | rng.randint(1, 254)) for _ in range(args.clients)]
+    gateways = [address(rng.choice(client_subnets) << 8 | rng.randint(1, 254)) for _ in range(args.nat_gateways)]
+    attackers = {bot for _, bot in joins}
+
+    def snapshots():
+        sessions = {}  # Connections of each client with an open session
+        joined = 0
+        most = 2 * args.bot_connections - 1
+        for step in range(int(args.duration / monitor.SAMPLE_INTERVAL)):
+            now = step * monitor.SAMPLE_INTERVAL
+            for client in clients:
+                if client in sessions:
+                    if rng.random() < 0.05:
+                        del sessions[client]
+                elif rng.random() < 0.02:
+                    sessions[client] = rng.randint(1, 3)
+            connections = Counter(sessions)
+            for gateway in gateways:
+                connections[gateway] += rng.randint(2, 8)
+            while joined < len(joins) and joins[joined][0] <= now:
+                joined += 1
+            for _, bot in joins[:joined]:
+                connections[bot] += 1 + int(rng.random() * most)
+            yield now, connections
+
+    return attackers, snapshots()
+
+
+def record(path, seconds, source_name):
+    source = open_source(source_name)
+    print(f"Recording {seconds:g}s of connections via {source.name} to {path}...")
+
+    def snapshots():
+        end = time.monotonic() + seconds
+        next_read = time.monotonic()
+        while next_read < end:
+            yield next_read, source.read(monitor.STATES)
+            next_read += monitor.SAMPLE_INTERVAL
+            time.sleep(max(next_read - time.monotonic(), 0))
+
+    count = sum(1 for _ in write_snapshots(path, {'interval': monitor.SAMPLE_INTERVAL, 'attackers': []}, snapshots()))
+    print(f"Recorded {count} snapshots")
+
+
+def reset_monitor(args):
+    # Fresh detection state with the overridden thresholds and a blocker that runs nothing
+    for name in ('THRESHOLD', 'PERSISTENT_THRESHOLD', 'NEW_CONNECTION_THRESHOLD', 'SUPERNET_FACTOR'):
+        value = getattr(args, name.lower())
+        if value is not None:
+            setattr(monitor, name, value)
+    monitor.rate_tracker = RateTracker(window=monitor.HISTORY_WINDOW, bucket_seconds=monitor.INTERVAL)
+    monitor.blocked_subnets.clear()
+    monitor.queued_blocks.clear()
+    monitor.block_log = deque()  # Every block, for its reason
+    runner = RecordingRunner()
+    monitor.blocker = BLOCKERS[args.blocker](runner, persist=False)
+    return runner
+
+
+def replay(snapshots, attackers):
+    """
+    Runs every snapshot through the detection. Returns the blocks as
+    {prefix: time}, when each attacking /24 first showed up, the time of
+    the first snapshot, the number of snapshots, the seconds spent
+    checking them and the most sources in one.
+    """
+    blocks, first_seen = {}, {}
+    start = None
+    count = busy = 0
+    largest = 0
+    for now, connections in snapshots:
+        if start is None:
+            start = now
+        started = time.perf_counter()
+        blocked = monitor.check_connections(connections, now)
+        busy += time.perf_counter() - started
+        count += 1
+        largest = max(largest, len(connections))
+        for prefix in blocked:
+            blocks[prefix] = now
+        if attackers:
+            for source in connections.keys() & attackers:
+                first_seen.setdefault(int.from_bytes(socket.inet_aton(source), 'big') >> 8, now)
+    return blocks, first_seen, start, count, busy, largest
+
+
+def report_detection(blocks, first_seen, attackers, reasons):
+    blocked_keys, false_positives = {}, []
+    attacking = [int.from_bytes(socket.inet_aton(source), 'big') for source in attackers]
+    attacking_keys = {}  # prefix length -> keys of the prefixes with an attacking source
+    for prefix, blocked in blocks.items():
+        network = ipaddress.ip_network(prefix)
+        if network.version == 6:
+            false_positives.append(prefix)  # The synthetic and recorded attackers are IPv4
+            continue
+        length = network.prefixlen
+        key = int(network.network_address) >> (32 - length)
+        blocked_keys[(length, key)] = blocked
+        if length not in attacking_keys:
+            attacking_keys[length] = {source >> (32 - length) for source in attacking}
+        if key not in attacking_keys[length]:
+            false_positives.append(prefix)
+
+    # Few distinct prefix lengths are blocked: look each address up per length
+    by_length = {}
+    for (length, key), blocked in blocked_keys.items():
+        by_length.setdefault(length, {})[key] = blocked
+
+    def block_time(value):
+        times = [keys[value >> (32 - length)] for length, keys in by_length.items() if value >> (32 - length) in keys]
+        return min(times) if times else None
+
+    latencies = []
+    for subnet, seen in first_seen.items():
+        blocked = block_time(subnet << 8)
+        if blocked is not None:
+            latencies.append(max(blocked - seen, 0.0))
+    blocked_sources = sum(1 for source in attacking if block_time(source) is not None)
+
+    print(f"\nAttack: {len(attackers)} sources, {len(first_seen)} /24s seen attacking")
+    if latencies:
+        latencies.sort()
+        print(f"Blocked {len(latencies)} of those /24s ({len(first_seen) - len(latencies)} missed), "
+              f"covering {blocked_sources / len(attacking):.1%} of the attacking sources")
+        print(f"Detection latency from a /24's first attacking connection: median {statistics.median(latencies):.2f}s, "
+              f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s, max {latencies[-1]:.2f}s")
+    else:
+        print("No attacking /24 was blocked")
+    print(f"False positives: {len(false_positives)} blocked prefixes without an attacking source")
+    lengths = Counter(prefix.rsplit('/', 1)[1] for prefix in false_positives)
+    for length, count in sorted(lengths.items(), key=lambda item: int(item[0]), reverse=True):
+        examples = [prefix for prefix in false_positives if prefix.endswith(f"/{length}")][:3]
+        print(f"  {count} /{length}s, e.g. " + ', '.join(f"{prefix} ({reasons[prefix]})" for prefix in examples))
+
+
+def add_threshold_args(parser):
+    parser.add_argument('--threshold', type=int, help=f"Override THRESHOLD ({monitor.THRESHOLD})")
+    parser.add_argument('--persistent-threshold', type=int,
+                        help=f"Override PERSISTENT_THRESHOLD ({monitor.PERSISTENT_THRESHOLD})")
+    parser.add_argument('--new-connection-threshold', type=int,
+                        help=f"Override NEW_CONNECTION_THRESHOLD ({monitor.NEW_CONNECTION_THRESHOLD})")
+    parser.add_argument('--supernet-factor', type=int, help=f"Override SUPERNET_FACTOR ({monitor.SUPERNET_FACTOR})")
+    parser.add_argument('--blocker', choices=list(BLOCKERS), default='ipset', help='Blocker whose commands are recorded')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay connection snapshots through the monitor's detection.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    synthetic = commands.add_parser('synthetic', help='Replay a generated botnet attack among legitimate traffic')
+    synthetic.add_argument('--bots', type=int, default=50_000, help='Attacking sources')
+    synthetic.add_argument('--bot-subnets', type=int, default=2_000, help='/24s the attacking sources are spread over')
+    synthetic.add_argument('--bot-connections', type=int, default=2, help='Average connections per attacking source')
+    synthetic.add_argument('--clients', type=int, default=20_000, help='Legitimate sources')
+    synthetic.add_argument('--client-subnets', type=int, default=20_000, help='/24s the legitimate sources are spread over')
+    synthetic.add_argument('--nat-gateways', type=int, default=20, help='Legitimate sources with 2-8 connections each')
+    synthetic.add_argument('--duration', type=float, default=60.0, help='Seconds of traffic')
+    synthetic.add_argument('--attack-start', type=float, default=10.0, help='Second the first attacking source connects')
+    synthetic.add_argument('--ramp', type=float, default=10.0, help='Seconds over which the attacking sources join')
+    synthetic.add_argument('--seed', type=int, default=0, help='Seed for the generated traffic')
+    synthetic.add_argument('--save', metavar='FILE', help='Also write the snapshots to FILE for `replay.py file`')
+    add_threshold_args(synthetic)
+
+    recorded = commands.add_parser('file', help='Replay a snapshot file')
+    recorded.add_argument('path', help='Snapshot file (.jsonl or .jsonl.gz)')
+    add_threshold_args(recorded)
+
+    recorder = commands.add_parser('record', help="Save this machine's connection snapshots to a file")
+    recorder.add_argument('path', help='Snapshot file to write (.jsonl or .jsonl.gz)')
+    recorder.add_argument('--seconds', type=float, default=60.0, help='How long to record')
+    recorder.add_argument('--source', choices=['auto', *SOURCES], default='auto', help='Connection source to read')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'record':
+        record(args.path, args.seconds, args.source)
+        return
+
+    if args.command == 'synthetic':
+        attackers, snapshots = synthetic_snapshots(args)
+        if args.save:
+            snapshots = write_snapshots(args.save, {'interval': monitor.SAMPLE_INTERVAL, 'attackers': sorted(attackers)},
+                                        snapshots)
+    else:
+        header, snapshots = read_snapshots(args.path)
+        attackers = set(header.get('attackers', ()))
+
+    runner = reset_monitor(args)
+    blocks, first_seen, start, count, busy, largest = replay(snapshots, attackers)
+    if not count:
+        sys.exit("No snapshots to replay")
+
+    print(f"Replayed {count} snapshots of up to {largest} sources: {count / busy:.1f} snapshots/s checked, "
+          f"{busy / count * 1e3:.1f} ms each against a SAMPLE_INTERVAL of {monitor.SAMPLE_INTERVAL * 1e3:.0f} ms")
+    print(f"Blocked {len(blocks)} prefixes with {len(runner.calls)} firewall and conntrack commands (dry run)")
+    if attackers:
+        report_detection(blocks, first_seen, attackers, {block['subnet']: block['reason'] for block in monitor.block_log})
+    else:
+        for prefix, blocked in sorted(blocks.items(), key=lambda item: item[1]):
+            print(f"  {blocked - start:8.2f}s  {prefix}")
+
+
+if __name__ == '__main__':
+    main()
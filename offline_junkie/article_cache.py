@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import unquote
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "offline-junkie", "articles.sqlite")
+
+
+def title_from_link(link):
+    # "/content/wikipedia_en/A/Albert_Einstein" -> "Albert Einstein"
+    return unquote(link.rstrip('/').rsplit('/', 1)[-1]).replace('_', ' ')
+
+
+def fts_query(terms):
+    """
+    Turns free text into an FTS5 query matching every word, each quoted so
+    that punctuation in the input is not read as query syntax.
+    """
+    words = [word.replace('"', '""') for word in terms.split()]
+    return ' '.join(f'"{word}"' for word in words)
+
+
+class ArticleCache:
+    """
+    Persistent local copy of what the wiki client has fetched, in SQLite.
+
+    Articles are stored as their extracted text, zlib-compressed, so reading
+    one again needs neither the server nor an HTML parser. Every stored
+    article is also added to an FTS5 full-text index, which search() queries
+    offline. Search result pages are kept as the parsed article list, so a
+    repeated /q query is answered locally too. Summaries of article chunks
+    are kept by the hash of their prompt.
+
+    The fetcher calls it from its prefetch threads, so access is serialized
+    with a lock.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " id INTEGER PRIMARY KEY,"
+            " url TEXT UNIQUE NOT NULL,"
+            " link TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " content BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " fetched REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS searches ("
+            " search_url TEXT NOT NULL,"
+            " pattern TEXT NOT NULL,"
+            " start INTEGER NOT NULL,"
+            " results TEXT NOT NULL,"
+            " next_start INTEGER,"
+            " fetched REAL NOT NULL,"
+            " PRIMARY KEY (search_url, pattern, start))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        # Contentless: the text lives compressed in `articles`, the index only keeps the terms
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(title, content, content='')")
+        self.db.commit()
+
+    def get_article(self, url):
+        """
+        Returns the cached text of the article at `url`, or None.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT content FROM articles WHERE url = ?", (url,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def put_article(self, url, link, title, text):
+        data = zlib.compress(text.encode('utf-8'), 6)
+        with self.lock:
+            row = self.db.execute("SELECT id, title, content FROM articles WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                # A contentless index is cleared by giving back the indexed values
+                old_id, old_title, old_content = row
+                self.db.execute(
+                    "INSERT INTO articles_fts (articles_fts, rowid, title, content) VALUES ('delete', ?, ?, ?)",
+                    (old_id, old_title, zlib.decompress(old_content).decode('utf-8')),
+                )
+                self.db.execute("DELETE FROM articles WHERE id = ?", (old_id,))
+            cursor = self.db.execute(
+                "INSERT INTO articles (url, link, title, content, size, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, link, title, data, len(text), time.time()),
+            )
+            self.db.execute(
+                "INSERT INTO articles_fts (rowid, title, content) VALUES (?, ?, ?)",
+                (cursor.lastrowid, title, text),
+            )
+            self.db.commit()
+
+    def get_results(self, search_url, pattern, start):
+        """
+        Returns the cached (articles, next_page_start) of a search page, or None.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT results, next_start FROM searches WHERE search_url = ? AND pattern = ? AND start = ?",
+                (search_url, pattern, start),
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put_results(self, search_url, pattern, start, articles, next_page_start):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO searches (search_url, pattern, start, results, next_start, fetched)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (search_url, pattern, start, json.dumps(articles, ensure_ascii=False), next_page_start, time.time()),
+            )
+            self.db.commit()
+
+    def get_summary(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_summary(self, key, summary):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            self.db.commit()
+
+    def search(self, terms, limit=10):
+        """
+        Full-text search over the cached articles, best matches first.
+        Returns [{'title', 'link', 'url'}], the shape of a search results page.
+        """
+        query = fts_query(terms)
+        if not query:
+            return []
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT a.title, a.link, a.url"
+                " FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid"
+                " WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit),
+            ).fetchall()
+        return [{'title': title, 'link': link, 'url': url} for title, link, url in rows]
+
+    def usage(self):
+        with self.lock:
+            count, text_bytes, stored_bytes = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(content)), 0) FROM articles"
+            ).fetchone()
+            searches = self.db.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        return {'articles': count, 'text_bytes': text_bytes, 'stored_bytes': stored_bytes, 'searches': searches}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
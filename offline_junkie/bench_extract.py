@@ -0,0 +1,190 @@
+"""
+Benchmark the page extractors of extract.py against each other.
+
+Runs every available extractor over a set of saved pages, checks that each
+one returns exactly what the BeautifulSoup reference returns, and reports
+pages per second and the speedup over the reference:
+
+    python bench_extract.py                          # generated sample pages
+    python bench_extract.py --download http://127.0.0.1 --pattern physics --pages samples
+    python bench_extract.py --pages samples
+
+Saved pages live in two subdirectories of --pages: search/ for result
+pages and article/ for articles, one .html file each.
+"""
+
+import argparse
+import html
+import os
+import random
+import sys
+import time
+
+from extract import EXTRACTORS, available_extractors
+from fetcher import WikiFetcher
+
+KINDS = ('search', 'article')
+
+
+def synthetic_article(title, paragraphs, rng):
+    """
+    An article page shaped like a wiki page: navigation before the content,
+    headings, links, entities, tables, an infobox, inline scripts and
+    comments inside it, and a long footer after it.
+    """
+    words = ['energy', 'matter', 'quantum', 'field', 'theory', 'wave', 'particle', 'mass', 'light', 'relativity']
+    body = []
+    for i in range(paragraphs):
+        sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(20, 60)))
+        body.append(f'<p id="p{i}">{html.escape(title)} &amp; <a href="/content/wiki/A/{rng.choice(words)}">{rng.choice(words)}</a> '
+                    f'{sentence} &mdash; <b>{i}</b> <i>&eacute;t&eacute;</i>.<sup class="reference">[{i}]</sup></p>\n')
+        if i % 25 == 0:
+            body.append(f'<h2><span class="mw-headline">Section {i // 25}</span></h2>\n<!-- section {i} -->\n')
+        if i % 40 == 0:
+            rows = ''.join(f'<tr><th>Row {r}</th><td>{rng.random():.4f}</td><td>{rng.choice(words)}</td></tr>' for r in range(10))
+            body.append(f'<table class="wikitable">{rows}</table>\n<script>var n{i} = "<div class=content>";</script>\n')
+    infobox = '<div class="infobox"><div class="row">Born</div><div class="row">1879</div></div>'
+    navigation = ''.join(f'<li><a href="/nav/{n}">Navigation {n}</a></li>' for n in range(50))
+    footer = ''.join(f'<div class="navbox"><a href="/content/wiki/A/{w}">{w}</a></div>' for w in words * 30)
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>.content {{ margin: 0 }}</style></head><body><div class="header"><ul>{navigation}</ul></div>'
+            f'<div class="content" id="mw-content"><h1>{html.escape(title)}</h1>{infobox}\n{"".join(body)}</div>'
+            f'<div class="footer">{footer}</div></body></html>')
+
+
+def synthetic_search(pattern, start, results, rng):
+    items = ''.join(
+        f'<li><a href="/content/wiki/A/{pattern}_{i}">\n  {html.escape(pattern.title())} &amp; {i}\n</a>'
+        f'<cite>{" ".join(pattern for _ in range(rng.randint(5, 30)))}</cite><div class="informations">{rng.randint(100, 9999)} words</div></li>\n'
+        for i in range(start, start + results))
+    footer = f'<div class="footer"><ul><li><a href="/search?pattern={pattern}&amp;start={start + results}&amp;pageLength={results}">Next</a></li></ul></div>'
+    return (f'<!DOCTYPE html><html><head><title>Search: {pattern}</title></head><body>'
+            f'<div class="header">Results {start}-{start + results} for "{pattern}"</div>'
+            f'<div class="results"><ul>{items}</ul></div>{footer}</body></html>')
+
+
+def synthetic_pages(articles, paragraphs, seed=0):
+    rng = random.Random(seed)
+    pages = {'search': [], 'article': []}
+    for n in range(articles):
+        pages['search'].append((f'search{n}', synthetic_search(f'topic{n}', n * 25, 25, rng)))
+        pages['article'].append((f'article{n}', synthetic_article(f'Topic {n}', rng.randint(paragraphs // 2, paragraphs), rng)))
+    return pages
+
+
+def load_pages(directory):
+    pages = {}
+    for kind in KINDS:
+        folder = os.path.join(directory, kind)
+        names = sorted(name for name in os.listdir(folder) if name.endswith('.html')) if os.path.isdir(folder) else []
+        pages[kind] = []
+        for name in names:
+            with open(os.path.join(folder, name), encoding='utf-8') as f:
+                pages[kind].append((name, f.read()))
+    return pages
+
+
+def save_pages(directory, pages):
+    for kind in KINDS:
+        os.makedirs(os.path.join(directory, kind), exist_ok=True)
+        for name, page in pages[kind]:
+            filename = name if name.endswith('.html') else f"{name}.html"
+            with open(os.path.join(directory, kind, filename), 'w', encoding='utf-8') as f:
+                f.write(page)
+
+
+def download_pages(server, pattern, result_pages):
+    """
+    Saves search pages for `pattern` and the articles they list from a
+    running wiki server.
+    """
+    fetcher = WikiFetcher(server, workers=1, prefetch_articles=0)
+    pages = {'search': [], 'article': []}
+    start = 0
+    try:
+        for number in range(result_pages):
+            page = fetcher._get(fetcher.search_url, {'pattern': pattern, 'start': start})
+            pages['search'].append((f'search{number}', page))
+            articles, start = EXTRACTORS['bs4'][0](page)
+            for article in articles:
+                name = article['link'].rstrip('/').rsplit('/', 1)[-1]
+                pages['article'].append((''.join(c if c.isalnum() else '_' for c in name), fetcher._get(fetcher.article_url(article['link']))))
+            if start is None:
+                break
+    finally:
+        fetcher.close()
+    return pages
+
+
+def check(extract, pages, expected):
+    # Names of the pages where an extractor disagrees with the BeautifulSoup reference
+    return [name for (name, page), result in zip(pages, expected) if extract(page) != result]
+
+
+def measure(func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the speed of the wiki page extractors on saved pages.")
+    parser.add_argument('--pages', type=str, default=None, help='Directory with search/ and article/ pages (default: generated pages)')
+    parser.add_argument('--extractors', nargs='+', choices=list(EXTRACTORS), default=available_extractors(), help='Extractors to benchmark')
+    parser.add_argument('--articles', type=int, default=20, help='Generated pages of each kind')
+    parser.add_argument('--paragraphs', type=int, default=400, help='Paragraphs of the longest generated article')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per extractor; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the generated pages')
+    parser.add_argument('--save', type=str, default=None, help='Save the generated pages to this directory')
+    parser.add_argument('--download', type=str, default=None, help='Download the pages from this wiki server into --pages first')
+    parser.add_argument('--pattern', type=str, default='physics', help='Search pattern used with --download')
+    parser.add_argument('--result-pages', type=int, default=2, help='Search pages saved with --download')
+    args = parser.parse_args()
+    if args.download and not args.pages:
+        parser.error("--download needs --pages to save into")
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.download:
+        save_pages(args.pages, download_pages(args.download, args.pattern, args.result_pages))
+    if args.pages:
+        pages = load_pages(args.pages)
+    else:
+        pages = synthetic_pages(args.articles, args.paragraphs, args.seed)
+        if args.save:
+            save_pages(args.save, pages)
+
+    for kind in KINDS:
+        size = sum(len(page) for _, page in pages[kind])
+        print(f"{kind}: {len(pages[kind])} pages, {size / 2**20:.2f} MB")
+
+    reference = {kind: [EXTRACTORS['bs4'][index](page) for _, page in pages[kind]] for index, kind in enumerate(KINDS)}
+
+    failed = False
+    print(f"\n{'extractor':<10}{'kind':<9}{'pages/s':>10}{'MB/s':>9}{'speedup':>9}  identical")
+    for kind_index, kind in enumerate(KINDS):
+        if not pages[kind]:
+            continue
+        size = sum(len(page) for _, page in pages[kind]) / 2**20
+        baseline = measure(EXTRACTORS['bs4'][kind_index], pages[kind], args.repeat)
+        for name in args.extractors:
+            if name not in available_extractors():
+                print(f"{name:<10}{kind:<9}  not installed")
+                continue
+            seconds = baseline if name == 'bs4' else measure(EXTRACTORS[name][kind_index], pages[kind], args.repeat)
+            mismatches = check(EXTRACTORS[name][kind_index], pages[kind], reference[kind])
+            failed = failed or bool(mismatches)
+            print(f"{name:<10}{kind:<9}{len(pages[kind]) / seconds:>10.1f}{size / seconds:>9.2f}{baseline / seconds:>8.1f}x  "
+                  f"{'yes' if not mismatches else 'NO: ' + ', '.join(mismatches[:5])}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark vector_index.py's search on random embeddings.
+
+Fills a throwaway index with clustered random unit vectors, then times
+single and batched queries on the full scan and on the IVF index, and
+reports how many of the exact top-k results the IVF search finds:
+
+    python bench_vectors.py --chunks 100000 --dim 768
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from vector_index import VectorIndex, normalize, top_k
+
+
+def synthetic_embeddings(chunks, dim, topics, spread=0.6, seed=0):
+    # Chunks scattered around topic directions, as embeddings of articles are;
+    # `spread` is the length of the noise added to each unit topic vector
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.normal(size=(topics, dim)))
+    vectors = centers[rng.integers(0, topics, chunks)] + rng.normal(scale=spread / np.sqrt(dim), size=(chunks, dim))
+    return normalize(vectors).astype(np.float32)
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time flat and IVF searches of the embeddings index.")
+    parser.add_argument('--chunks', type=int, default=100_000, help='Vectors in the index')
+    parser.add_argument('--dim', type=int, default=768, help='Embedding dimension (768 for nomic-embed-text)')
+    parser.add_argument('--topics', type=int, default=500, help='Clusters the random vectors are drawn around')
+    parser.add_argument('--spread', type=float, default=0.6, help='Distance of the vectors from their topic direction')
+    parser.add_argument('--queries', type=int, default=64, help='Queries in the batched search')
+    parser.add_argument('--k', type=int, default=4, help='Results per query')
+    parser.add_argument('--nprobe', type=int, default=8, help='IVF clusters scored per query')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random vectors')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    vectors = synthetic_embeddings(args.chunks + args.queries, args.dim, args.topics, args.spread, args.seed)
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+
+    with tempfile.TemporaryDirectory() as directory:
+        # No automatic training, so both search kinds run on the same vectors
+        index = VectorIndex(directory, model='benchmark', ivf_threshold=float('inf'), nprobe=args.nprobe)
+        start = time.perf_counter()
+        index.add(vectors, [{'link': str(i), 'title': '', 'text': ''} for i in range(len(vectors))])
+        print(f"added {len(index)} x {args.dim} vectors in {time.perf_counter() - start:.2f}s")
+
+        exact = top_k(queries @ index.vectors.T, args.k)
+        flat_one = best_time(lambda: index.search(queries[0], args.k), args.repeat)
+        flat_batch = best_time(lambda: index.search(queries, args.k), args.repeat)
+
+        start = time.perf_counter()
+        index.train()
+        print(f"trained {len(index.centroids)} IVF clusters in {time.perf_counter() - start:.2f}s")
+        ivf_one = best_time(lambda: index.search(queries[0], args.k), args.repeat)
+        ivf_batch = best_time(lambda: index.search(queries, args.k), args.repeat)
+
+        found = [{int(record['link']) for _, record in result} for result in index.search(queries, args.k)]
+        recall = np.mean([len(found[q] & set(exact[q].tolist())) / args.k for q in range(args.queries)])
+
+    print(f"\n{'search':<8}{'1 query ms':>12}{f'{args.queries} queries ms':>16}{'per query ms':>14}")
+    for name, one, batch in (('flat', flat_one, flat_batch), ('ivf', ivf_one, ivf_batch)):
+        print(f"{name:<8}{one * 1e3:>12.2f}{batch * 1e3:>16.2f}{batch * 1e3 / args.queries:>14.3f}")
+    print(f"\nIVF recall@{args.k} against the full scan: {recall:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Extract search results and article text from the wiki server's pages.
+
+Three interchangeable extractors return the same values:
+
+    bs4     the original BeautifulSoup 'html.parser' tree, the reference
+    lxml    libxml2's C parser with XPath, when lxml is installed (it drops
+            CDATA sections, which wiki pages do not use)
+    stream  the standard library's HTMLParser fed the page in pieces, keeping
+            only the text it needs and stopping once it has read it
+
+get_extractor('auto') picks the fastest one available. Run bench_extract.py
+to compare them on saved pages.
+"""
+
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is optional
+    lxml = None
+
+NOT_FOUND = 'Content not found'
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+HIDDEN_TAGS = ('script', 'style', 'template')
+
+# Characters of the page handed to the streaming parser at a time
+FEED_SIZE = 16 * 1024
+
+
+def next_start(href):
+    return int(href.split('start=')[1].split('&')[0]) if href else None
+
+
+def bs4_results(html):
+    """
+    Extracts the result titles and links from a search page, plus the start
+    offset of the next page (None on the last page).
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    articles = []
+    for item in soup.select('.results li'):
+        title = item.select_one('a').text.strip()
+        link = item.select_one('a')['href'].strip()
+        articles.append({'title': title, 'link': link})
+
+    # Check if there's a next page link
+    next_page = soup.select_one('.footer a[href*=start]')
+    next_page_start = next_start(next_page['href']) if next_page else None
+
+    return articles, next_page_start
+
+
+def bs4_article(html):
+    """
+    Extracts the text of an article page.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    content_div = soup.select_one('div.content')  # Adjust based on actual page structure
+    return content_div.get_text(strip=True) if content_div else NOT_FOUND
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _lxml_text(element, strip):
+    # The text nodes get_text() would see, in document order: no comments,
+    # no script/style, but the text that follows them
+    parts = []
+    stack = [(element, False)]
+    while stack:
+        node, tail = stack.pop()
+        if tail:
+            if node.tail:
+                parts.append(node.tail)
+            continue
+        if node is not element:
+            stack.append((node, True))
+        if isinstance(node.tag, str) and node.tag not in HIDDEN_TAGS:
+            if node.text:
+                parts.append(node.text)
+            stack.extend((child, False) for child in reversed(node))
+    if strip:
+        return ''.join(part.strip() for part in parts if part.strip())
+    return ''.join(parts)
+
+
+def _lxml_root(html):
+    if not html.strip():
+        return None
+    try:
+        return lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def lxml_results(html):
+    root = _lxml_root(html)
+    if root is None:
+        return [], None
+
+    articles = []
+    for item in root.xpath(f"//*[{_has_class('results')}]//li"):
+        anchor = item.find('.//a')
+        if anchor is None:
+            continue
+        articles.append({'title': _lxml_text(anchor, strip=False).strip(), 'link': anchor.get('href', '').strip()})
+
+    next_page = root.xpath(f"(//*[{_has_class('footer')}]//a[contains(@href, 'start')])[1]")
+    return articles, next_start(next_page[0].get('href')) if next_page else None
+
+
+def lxml_article(html):
+    root = _lxml_root(html)
+    content = root.xpath(f"(//div[{_has_class('content')}])[1]") if root is not None else []
+    return _lxml_text(content[0], strip=True) if content else NOT_FOUND
+
+
+class _StreamParser(HTMLParser):
+    """
+    Base for the streaming extractors. Text between two tags is buffered and
+    handed to text() in one piece, as BeautifulSoup joins it into one string.
+    Subclasses set `done` once they have what they need.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self.pending = []
+        self.hidden = 0
+
+    def flush(self):
+        if self.pending:
+            data = ''.join(self.pending)
+            self.pending = []
+            if not self.hidden:
+                self.text(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in HIDDEN_TAGS:
+            self.hidden += 1
+        self.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag in HIDDEN_TAGS and self.hidden:
+            self.hidden -= 1
+        self.end(tag)
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> is a string of its own to BeautifulSoup
+        self.flush()
+        if data.startswith('CDATA['):
+            self.pending.append(data[len('CDATA['):])
+            self.flush()
+
+    def start(self, tag, attrs):
+        pass
+
+    def end(self, tag):
+        pass
+
+    def text(self, data):
+        pass
+
+    def run(self, html):
+        for offset in range(0, len(html), FEED_SIZE):
+            self.feed(html[offset:offset + FEED_SIZE])
+            if self.done:
+                return self
+        self.close()
+        self.flush()
+        return self
+
+
+def _classes(attrs):
+    return (attrs.get('class') or '').split()
+
+
+class _ElementTracker:
+    # Follows one element by counting open and close tags of its name
+    def __init__(self):
+        self.tag = None
+        self.depth = 0
+
+    def open(self, tag):
+        self.tag = tag
+        self.depth = 1
+
+    def inside(self):
+        return self.depth > 0
+
+    def start(self, tag):
+        if self.depth and tag == self.tag:
+            self.depth += 1
+
+    def end(self, tag):
+        if self.depth and tag == self.tag:
+            self.depth -= 1
+            return self.depth == 0
+        return False
+
+
+class _ResultsParser(_StreamParser):
+    def __init__(self):
+        super().__init__()
+        self.results = _ElementTracker()
+        self.footer = _ElementTracker()
+        self.results_seen = False
+        self.items = []  # [title parts, link, anchor depth] per li
+        self.anchor = None
+        self.next_href = None
+
+    def start(self, tag, attrs):
+        self.results.start(tag)
+        self.footer.start(tag)
+        classes = _classes(attrs)
+        if not self.results.inside() and 'results' in classes:
+            self.results.open(tag)
+            self.results_seen = True
+        if not self.footer.inside() and 'footer' in classes:
+            self.footer.open(tag)
+
+        if self.results.inside() and tag == 'li':
+            self.items.append(None)
+        elif tag == 'a':
+            if self.anchor is not None:
+                self.anchor[2] += 1
+            elif self.results.inside() and self.items and self.items[-1] is None:
+                # The first anchor of the newest li without one
+                self.anchor = [[], attrs.get('href', ''), 1]
+                self.items[-1] = self.anchor
+            if self.footer.inside() and self.next_href is None and 'start' in (attrs.get('href') or ''):
+                self.next_href = attrs['href']
+
+    def end(self, tag):
+        if self.results.end(tag) and self.next_href is not None:
+            self.done = True
+        if self.footer.end(tag) and self.results_seen and not self.results.inside() and self.next_href is not None:
+            self.done = True
+        if tag == 'a' and self.anchor is not None:
+            self.anchor[2] -= 1
+            if self.anchor[2] == 0:
+                self.anchor = None
+
+    def text(self, data):
+        if self.anchor is not None:
+            self.anchor[0].append(data)
+
+
+class _ArticleParser(_StreamParser):
+    def __init__(self):
+        super().__init__()
+        self.content = _ElementTracker()
+        self.found = False
+        self.parts = []
+
+    def start(self, tag, attrs):
+        self.content.start(tag)
+        if not self.found and tag == 'div' and 'content' in _classes(attrs):
+            self.content.open(tag)
+            self.found = True
+
+    def end(self, tag):
+        if self.content.end(tag):
+            self.done = True
+
+    def text(self, data):
+        if self.content.inside():
+            data = data.strip()
+            if data:
+                self.parts.append(data)
+
+
+def stream_results(html):
+    parser = _ResultsParser().run(html)
+    articles = [{'title': ''.join(item[0]).strip(), 'link': item[1].strip()} for item in parser.items if item is not None]
+    return articles, next_start(parser.next_href)
+
+
+def stream_article(html):
+    parser = _ArticleParser().run(html)
+    return ''.join(parser.parts) if parser.found else NOT_FOUND
+
+
+EXTRACTORS = {
+    'bs4': (bs4_results, bs4_article),
+    'lxml': (lxml_results, lxml_article),
+    'stream': (stream_results, stream_article),
+}
+
+
+def available_extractors():
+    return [name for name in EXTRACTORS if name != 'lxml' or lxml is not None]
+
+
+def get_extractor(name='auto'):
+    """
+    Returns the (results, article) functions of an extractor. 'auto' is
+    lxml when installed and the streaming parser otherwise.
+    """
+    if name == 'auto':
+        name = 'lxml' if lxml is not None else 'stream'
+    if name not in available_extractors():
+        raise ValueError(f"Extractor '{name}' is not available; choose from {', '.join(available_extractors())}")
+    return EXTRACTORS[name]
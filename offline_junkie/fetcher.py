@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from article_cache import title_from_link
+from extract import NOT_FOUND, get_extractor
+
+FETCH_ERROR = 'Error fetching content'
+
+
+class WikiFetcher:
+    """
+    Fetches search pages and articles from the local wiki server over one
+    keep-alive session, so requests reuse pooled connections.
+
+    prefetch() starts downloading the next results page and the first
+    articles of the current page in background threads while the user is
+    still reading; fetch_results() and fetch_article_content() then return
+    the prefetched result instead of making a new request.
+
+    With an ArticleCache, search pages and article texts that were fetched
+    before are read from it, and everything newly fetched is added to it.
+
+    `parser` names the extract.py extractor used on the pages.
+    """
+
+    def __init__(self, base_url="http://127.0.0.1", search_path="/search", workers=4, prefetch_articles=3, timeout=30,
+                 cache=None, parser='auto'):
+        self.base_url = base_url.rstrip('/')
+        self.search_url = self.base_url + search_path
+        self.prefetch_articles = prefetch_articles
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wiki-prefetch')
+        self.pending = {}  # Request key -> Future of a prefetch
+        self.cache = cache
+        self.titles = {}  # Link -> title, from the result pages seen so far
+        self.parse_results, self.parse_article = get_extractor(parser)
+
+    def article_url(self, link):
+        return f"{self.base_url}{link}"
+
+    def _get(self, url, params=None):
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def _load_results(self, pattern, start):
+        cached = self.cache.get_results(self.search_url, pattern, start) if self.cache else None
+        if cached is not None:
+            articles, next_page_start = cached
+        else:
+            articles, next_page_start = self.parse_results(self._get(self.search_url, {'pattern': pattern, 'start': start}))
+            if self.cache and articles:
+                self.cache.put_results(self.search_url, pattern, start, articles, next_page_start)
+        for article in articles:
+            self.titles[article['link']] = article['title']
+        return articles, next_page_start
+
+    def _load_article(self, link):
+        url = self.article_url(link)
+        content = self.cache.get_article(url) if self.cache else None
+        if content is None:
+            content = self.parse_article(self._get(url))
+            if self.cache and content != NOT_FOUND:
+                self.cache.put_article(url, link, self.titles.get(link) or title_from_link(link), content)
+        return content
+
+    def _submit(self, key, func, *args):
+        if key not in self.pending:
+            self.pending[key] = self.executor.submit(func, *args)
+
+    def _result(self, key, func, *args):
+        # Wait for a prefetch in progress, or fetch right away
+        future = self.pending.pop(key, None)
+        if future is not None:
+            return future.result()
+        return func(*args)
+
+    def fetch_results(self, pattern, start=0):
+        try:
+            return self._result(('results', pattern, start), self._load_results, pattern, start)
+        except requests.RequestException as e:
+            print(f"Error fetching results: {e}")
+            return [], None
+
+    def fetch_article_content(self, link):
+        try:
+            return self._result(('article', link), self._load_article, link)
+        except requests.RequestException as e:
+            print(f"Error fetching article content: {e}")
+            return FETCH_ERROR
+
+    def prefetch(self, pattern, articles, next_page_start):
+        """
+        Starts fetching the next results page and the first
+        `prefetch_articles` articles of `articles` in the background.
+        Prefetches left over from earlier pages are dropped.
+        """
+        wanted = [('article', article['link']) for article in articles[:self.prefetch_articles]]
+        if next_page_start is not None:
+            wanted.append(('results', pattern, next_page_start))
+        for key in list(self.pending):
+            if key not in wanted:
+                self.pending.pop(key).cancel()
+
+        # Articles first: picking one is more likely than paging on
+        for article in articles[:self.prefetch_articles]:
+            self._submit(('article', article['link']), self._load_article, article['link'])
+        if next_page_start is not None:
+            self._submit(('results', pattern, next_page_start), self._load_results, pattern, next_page_start)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+
+from summarizer import split_chunks
+
+EMBED_MODEL = 'nomic-embed-text'
+
+# Texts sent in one embeddings request
+EMBED_BATCH = 64
+
+GROUNDED_PROMPT = ("Answer the question using the excerpts from offline Wikipedia articles below where they are relevant. "
+                   "Say which article the answer comes from.\n\n{context}\n\nQuestion: {question}")
+
+
+class ArticleRetriever:
+    """
+    Grounds chat turns in the articles the client has read.
+
+    add_article() splits an article into chunks of `chunk_tokens` and embeds
+    them with the Ollama embeddings endpoint in a background thread, adding
+    them to a VectorIndex. prompt() embeds a question, looks up the `k`
+    closest chunks and returns a prompt that quotes them, or the question
+    unchanged when nothing is indexed or the lookup fails.
+    """
+
+    def __init__(self, index, model=EMBED_MODEL, client=None, chunk_tokens=256, k=4, min_score=0.0):
+        self.index = index
+        self.model = model
+        self.client = client or ollama.Client()
+        self.chunk_tokens = chunk_tokens
+        self.k = k
+        self.min_score = min_score
+        self.pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wiki-embed')
+        self.warned = False
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors.extend(self.client.embed(model=self.model, input=texts[start:start + EMBED_BATCH])['embeddings'])
+        return vectors
+
+    def _index_article(self, link, title, text):
+        try:
+            chunks = split_chunks(text, self.chunk_tokens)
+            if chunks:
+                # The title goes into every chunk so each one says what it is about
+                vectors = self.embed([f"{title}\n{chunk}" for chunk in chunks])
+                self.index.add(vectors, [{'link': link, 'title': title, 'text': chunk} for chunk in chunks])
+        except Exception as e:
+            print(f"\nError embedding {title}: {e}")
+        finally:
+            self.pending.discard(link)
+
+    def add_article(self, link, title, text):
+        if link in self.index or link in self.pending:
+            return None
+        self.pending.add(link)
+        return self.executor.submit(self._index_article, link, title, text)
+
+    def retrieve(self, question):
+        """
+        The closest chunks to the question as (score, record) pairs.
+        """
+        if not len(self.index):
+            return []
+        results = self.index.search(self.embed([question]), self.k)[0]
+        return [(score, record) for score, record in results if score >= self.min_score]
+
+    def prompt(self, question):
+        try:
+            results = self.retrieve(question)
+        except Exception as e:
+            if not self.warned:
+                print(f"Retrieval unavailable, answering without articles: {e}")
+                self.warned = True
+            return question
+        if not results:
+            return question
+        context = '\n\n'.join(f"[{record['title']}]\n{record['text']}" for _, record in results)
+        return GROUNDED_PROMPT.format(context=context, question=question)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
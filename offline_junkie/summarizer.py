@@ -0,0 +1,145 @@
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+
+# Rough size of a token in characters for English text; used to keep prompts
+# inside the context window without a tokenizer round trip to the server
+CHARS_PER_TOKEN = 4
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+MAP_INSTRUCTION = "Summarize the following part of a Wikipedia article about {title}. Keep every fact, name, date and number that matters; leave out filler.\n\n{text}"
+REDUCE_INSTRUCTION = "The following are summaries of consecutive parts of a Wikipedia article about {title}. Combine them into one summary of the whole article, in order, without repeating yourself.\n\n{text}"
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_chunks(text, max_tokens):
+    """
+    Splits text into consecutive chunks of at most `max_tokens` (estimated),
+    breaking between sentences where possible and inside a sentence only when
+    it is longer than a whole chunk.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = ''
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            # Cut at the last space that fits, or hard at max_chars
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            chunks.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def truncate(text, max_chars):
+    # Cut at the last space that fits, or hard at max_chars
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+
+def combine_summaries(summaries, max_tokens):
+    """
+    Numbers the partial summaries for the final prompt. When they are
+    longer than `max_tokens` together, each one is cut to an equal share
+    of it, so the final prompt stays bounded.
+    """
+    parts = [f"Part {i + 1}: " for i in range(len(summaries))]
+    combined = '\n\n'.join(part + summary for part, summary in zip(parts, summaries))
+    if estimate_tokens(combined) <= max_tokens:
+        return combined
+    overhead = sum(len(part) for part in parts) + 2 * (len(parts) - 1)
+    share = max((max_tokens - 1) * CHARS_PER_TOKEN - overhead, 0) // len(summaries)
+    return '\n\n'.join(part + truncate(summary, share) for part, summary in zip(parts, summaries))
+
+
+class ArticleSummarizer:
+    """
+    Map-reduce summaries of articles too long for one prompt.
+
+    The article is split into chunks of at most `chunk_tokens`, which are
+    summarized concurrently, at most `workers` requests at a time. The
+    partial summaries are then combined; if together they are still longer
+    than a chunk they go through another round first. The final combination
+    is streamed token by token.
+
+    With an ArticleCache, every chunk summary is stored under a hash of the
+    model, the prompt and the chunk, so summarizing an article again only
+    asks the model for the final answer.
+    """
+
+    def __init__(self, model, chunk_tokens=1500, workers=4, cache=None, client=None):
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.cache = cache
+        self.client = client or ollama.Client()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wiki-summary')
+
+    def _key(self, prompt):
+        return hashlib.sha256(f"{self.model}\n{prompt}".encode('utf-8')).hexdigest()
+
+    def _stream(self, prompt):
+        for chunk in self.client.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}], stream=True):
+            yield chunk['message']['content']
+
+    def _summarize(self, prompt):
+        key = self._key(prompt)
+        summary = self.cache.get_summary(key) if self.cache else None
+        if summary is None:
+            summary = ''.join(self._stream(prompt))
+            if self.cache:
+                self.cache.put_summary(key, summary)
+        return summary
+
+    def partial_summaries(self, title, text):
+        """
+        Summarizes the chunks of `text` in parallel and returns the summaries
+        in article order, going round again until they fit in one chunk.
+        """
+        chunks = split_chunks(text, self.chunk_tokens)
+        while True:
+            prompts = [MAP_INSTRUCTION.format(title=title, text=chunk) for chunk in chunks]
+            summaries = list(self.executor.map(self._summarize, prompts))
+            combined = '\n\n'.join(summaries)
+            if len(summaries) == 1 or estimate_tokens(combined) <= self.chunk_tokens:
+                return summaries
+            # Group consecutive summaries into chunks for another round
+            chunks = split_chunks(combined, self.chunk_tokens)
+            if len(chunks) >= len(summaries):
+                # The summaries are not getting any shorter; summarize() cuts
+                # each one down so that together they fit in a chunk
+                return summaries
+
+    def summarize(self, title, text, prompt):
+        """
+        Yields the final answer as it streams in. Articles that fit in one
+        chunk are sent whole with `prompt` (the text is appended to it);
+        longer ones are reduced to partial summaries first, which are cut
+        short if the model did not get them under `chunk_tokens`.
+        """
+        if estimate_tokens(text) <= self.chunk_tokens:
+            yield from self._stream(f"{prompt} {text}")
+            return
+        summaries = self.partial_summaries(title, text)
+        combined = combine_summaries(summaries, self.chunk_tokens)
+        yield from self._stream(REDUCE_INSTRUCTION.format(title=title, text=combined))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
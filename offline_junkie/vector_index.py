@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "offline-junkie", "vectors")
+
+# Chunks above which an IVF index is trained and used instead of a full scan
+IVF_THRESHOLD = 20_000
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    # Indices of the k highest scores, best first, without a full sort
+    k = min(k, scores.shape[-1])
+    if k == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(best, order, axis=-1)
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0, batch=65_536):
+    """
+    Spherical k-means: centroids of unit vectors, assigned by dot product in
+    batched matrix products. Returns (centroids, assignment of each vector).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        for start in range(0, len(vectors), batch):
+            assignment[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=clusters)
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(vectors[order], np.cumsum(counts)[~empty] - counts[~empty], axis=0)
+        # Restart empty clusters on random vectors
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids, assignment
+
+
+class VectorIndex:
+    """
+    Embeddings of text chunks kept on disk in a directory:
+
+        meta.json     embedding model and dimension
+        vectors.f32   float32 unit vectors, one row per chunk, appended to
+        chunks.jsonl  the chunk text and its article, one line per row
+        ivf.npz       IVF centroids, once there are more than ivf_threshold rows
+
+    Searches score the query against every vector with one matrix product.
+    Past `ivf_threshold` chunks, the vectors are clustered with k-means and a
+    search only scores the `nprobe` clusters closest to the query.
+
+    Adding and searching may happen on different threads.
+    """
+
+    def __init__(self, directory=DEFAULT_INDEX_DIR, model=None, ivf_threshold=IVF_THRESHOLD, nprobe=8):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model = model
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.lock = threading.Lock()
+        self.dim = None
+        self.buffer = np.empty((0, 0), dtype=np.float32)  # Grows by doubling; rows past len() are unused
+        self.records = []
+        self.links = set()
+        self.centroids = None
+        self.lists = None  # Row numbers of each IVF cluster
+        self.trained_size = 0
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path('meta.json')):
+            return
+        with open(self._path('meta.json')) as f:
+            meta = json.load(f)
+        if self.model is not None and meta['model'] != self.model:
+            # Vectors of another model are not comparable; start over
+            print(f"Vector index was built with {meta['model']}, rebuilding it for {self.model}.")
+            self.clear()
+            return
+        self.model = meta['model']
+        self.dim = meta['dim']
+        line_ends = []
+        with open(self._path('chunks.jsonl'), 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.records.append(json.loads(line))
+                line_ends.append((line_ends[-1] if line_ends else 0) + len(line))
+        vectors = np.fromfile(self._path('vectors.f32'), dtype=np.float32)
+        rows = min(len(vectors) // self.dim, len(self.records))
+        # An interrupted append leaves the two files at different lengths;
+        # cut both back to the rows they have in common
+        os.truncate(self._path('vectors.f32'), rows * self.dim * 4)
+        os.truncate(self._path('chunks.jsonl'), line_ends[rows - 1] if rows else 0)
+        self.buffer = vectors[:rows * self.dim].reshape(rows, self.dim)
+        self.records = self.records[:rows]
+        self.links = {record['link'] for record in self.records}
+        if os.path.exists(self._path('ivf.npz')):
+            with np.load(self._path('ivf.npz')) as ivf:
+                if ivf['centroids'].shape[1] == self.dim and int(ivf['size']) <= rows:
+                    self._set_ivf(ivf['centroids'], self._assign(ivf['centroids'], self.vectors), int(ivf['size']))
+
+    def clear(self):
+        for name in ('meta.json', 'vectors.f32', 'chunks.jsonl', 'ivf.npz'):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self.dim = None
+        self.buffer = np.empty((0, 0), dtype=np.float32)
+        self.records = []
+        self.links = set()
+        self.centroids = self.lists = None
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def vectors(self):
+        return self.buffer[:len(self.records)]
+
+    def __contains__(self, link):
+        return link in self.links
+
+    def add(self, vectors, records):
+        """
+        Appends embeddings and their records ({'link', 'title', 'text'}).
+        """
+        vectors = normalize(vectors)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.buffer = np.empty((0, self.dim), dtype=np.float32)
+                with open(self._path('meta.json'), 'w') as f:
+                    json.dump({'model': self.model, 'dim': self.dim}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+            with open(self._path('vectors.f32'), 'ab') as f:
+                vectors.tofile(f)
+            with open(self._path('chunks.jsonl'), 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            first = len(self.records)
+            if first + len(vectors) > len(self.buffer):
+                grown = np.empty((max(2 * len(self.buffer), first + len(vectors), 1024), self.dim), dtype=np.float32)
+                grown[:first] = self.vectors
+                self.buffer = grown
+            self.buffer[first:first + len(vectors)] = vectors
+            self.records.extend(records)
+            self.links.update(record['link'] for record in records)
+            if self.centroids is not None:
+                assignment = self._assign(self.centroids, vectors)
+                self.lists = [np.concatenate([rows, first + np.flatnonzero(assignment == c)]) for c, rows in enumerate(self.lists)]
+            # Retrain once the index has doubled since the last training
+            if len(self.records) > self.ivf_threshold and len(self.records) >= 2 * self.trained_size:
+                self.train()
+
+    def _assign(self, centroids, vectors, batch=65_536):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch):
+            assignment[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+        return assignment
+
+    def _set_ivf(self, centroids, assignment, size):
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(centroids))]
+        self.trained_size = size
+
+    def train(self, clusters=None, iterations=10, sample_per_cluster=64, seed=0):
+        """
+        Clusters the vectors for IVF search, about sqrt(n) clusters by
+        default. The centroids are fitted on a sample of the vectors, then
+        every vector is assigned to its closest one.
+        """
+        vectors = self.vectors
+        clusters = min(clusters or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        sample = min(len(vectors), clusters * sample_per_cluster)
+        rows = np.random.default_rng(seed).choice(len(vectors), sample, replace=False)
+        centroids, _ = kmeans(vectors[rows], clusters, iterations, seed)
+        self._set_ivf(centroids, self._assign(centroids, vectors), len(vectors))
+        np.savez(self._path('ivf.npz'), centroids=centroids, size=len(vectors))
+
+    def search(self, queries, k=4, exact=False):
+        """
+        The k best chunks for each query embedding, as lists of
+        (score, record) with cosine similarity scores, best first.
+        Several queries are answered with one matrix product.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        with self.lock:
+            if not self.records:
+                return [[] for _ in queries]
+            if self.centroids is None or exact:
+                scores = queries @ self.vectors.T
+                best = top_k(scores, k)
+                return [[(float(scores[q, i]), self.records[i]) for i in best[q]] for q in range(len(queries))]
+
+            results = []
+            probes = top_k(queries @ self.centroids.T, self.nprobe)
+            for q, query in enumerate(queries):
+                rows = np.concatenate([self.lists[c] for c in probes[q]])
+                scores = self.vectors[rows] @ query
+                best = top_k(scores, k)
+                results.append([(float(scores[i]), self.records[rows[i]]) for i in best])
+            return results
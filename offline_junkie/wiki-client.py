@@ -22,47 +22,22 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import argparse
+
 import ollama
-import requests
-from bs4 import BeautifulSoup
 
-# Base URL for the Wikipedia search
-BASE_URL = "http://127.0.0.1/search"
+from article_cache import DEFAULT_CACHE_PATH, ArticleCache
+from extract import EXTRACTORS, NOT_FOUND, available_extractors
+from fetcher import FETCH_ERROR, WikiFetcher
+from retrieval import EMBED_MODEL, ArticleRetriever
+from summarizer import ArticleSummarizer
+from vector_index import DEFAULT_INDEX_DIR, VectorIndex
 
-def fetch_results(pattern, start=0):
-    try:
-        url = f"{BASE_URL}?pattern={pattern}&start={start}"
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        articles = []
-        for item in soup.select('.results li'):
-            title = item.select_one('a').text.strip()
-            link = item.select_one('a')['href'].strip()
-            articles.append({'title': title, 'link': link})
-        
-        # Check if there's a next page link
-        next_page = soup.select_one('.footer a[href*=start]')
-        next_page_start = int(next_page['href'].split('start=')[1].split('&')[0]) if next_page else None
-        
-        return articles, next_page_start
-    except requests.RequestException as e:
-        print(f"Error fetching results: {e}")
-        return [], None
-
-def fetch_article_content(link):
-    try:
-        url = f"http://127.0.0.1{link}"
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        content_div = soup.select_one('div.content')  # Adjust based on actual page structure
-        return content_div.get_text(strip=True) if content_div else 'Content not found'
-    except requests.RequestException as e:
-        print(f"Error fetching article content: {e}")
-        return 'Error fetching content'
+# Base URL of the local Wikipedia server and its search endpoint
+SERVER_URL = "http://127.0.0.1"
+SEARCH_PATH = "/search"
+
+MODEL_NAME = 'llama3.1'
 
 def display_articles(articles):
     if not articles:
@@ -77,7 +52,7 @@ def display_articles(articles):
 def chat_with_ai(message):
     try:
         stream = ollama.chat(
-            model='llama3.1',
+            model=MODEL_NAME,
             messages=[{'role': 'user', 'content': message}],
             stream=True,
         )
@@ -89,63 +64,137 @@ def chat_with_ai(message):
         print(f"Error chatting with AI: {e}")
         return "Error interacting with AI."
 
-context = []
-current_instruction = None
-last_query_results = []
+def summarize_article(fetcher, summarizer, retriever, article):
+    article_content = fetcher.fetch_article_content(article['link'])
+    if retriever is not None and article_content not in (NOT_FOUND, FETCH_ERROR):
+        # Embedded in the background for later chat turns
+        retriever.add_article(article['link'], article['title'], article_content)
+    # Long articles are summarized in parts first; the answer is printed as it streams
+    print("Summary: ", end='', flush=True)
+    try:
+        for content in summarizer.summarize(article['title'], article_content, "Print out the content of the following article:"):
+            print(content, end='', flush=True)
+        print()
+    except Exception as e:
+        print(f"\nError chatting with AI: {e}")
+    # Print the URL of the article
+    print(f"Article URL: {fetcher.article_url(article['link'])}")
+
+def search_local(cache, fetcher, summarizer, retriever, terms):
+    """
+    Searches the articles read before in the local full-text index, without
+    the server, and summarizes the one picked.
+    """
+    articles = cache.search(terms)
+    if not display_articles(articles):
+        return []
 
-while True:
-    user_input = input("> ")
+    choice = input("\nEnter the number of the article you want to select or press Enter to skip: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(articles):
+        summarize_article(fetcher, summarizer, retriever, articles[int(choice) - 1])
+    return articles
 
-    if user_input.startswith('/q '):
-        # Prompt for instruction before processing the query
-        instruction = input("Enter instruction (or press Enter to skip): ").strip()
-        
-        parts = user_input.split(maxsplit=1)
-        if len(parts) == 2:
-            pattern = parts[1]
-            
-            start = 0
-            while True:
-                articles, next_page_start = fetch_results(pattern, start=start)
-                if not articles:
-                    print("No more articles found.")
-                    break
-
-                last_query_results = articles
-                display_articles(articles)
-                
-                ai_response = chat_with_ai('Choose one of the following articles:')
-                print(ai_response)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Search a local Wikipedia server and chat about the articles with a local model.")
+    parser.add_argument('--server', type=str, default=SERVER_URL, help='Base URL of the local Wikipedia server')
+    parser.add_argument('--prefetch', type=int, default=3, help='Articles of each results page to download in the background')
+    parser.add_argument('--workers', type=int, default=4, help='Background download threads')
+    parser.add_argument('--cache-path', type=str, default=DEFAULT_CACHE_PATH, help='SQLite file fetched articles and searches are kept in')
+    parser.add_argument('--no-cache', action='store_true', help='Always fetch from the server and keep nothing locally')
+    parser.add_argument('--parser', choices=['auto', *EXTRACTORS], default='auto', help='Page extractor; auto uses lxml when installed, else the streaming parser')
+    parser.add_argument('--chunk-tokens', type=int, default=1500, help='Longest part of an article summarized in one request, in tokens')
+    parser.add_argument('--summary-workers', type=int, default=4, help='Article parts summarized at once')
+    parser.add_argument('--embed-model', type=str, default=EMBED_MODEL, help='Ollama model the read articles are embedded with')
+    parser.add_argument('--index-dir', type=str, default=DEFAULT_INDEX_DIR, help='Directory of the embeddings index')
+    parser.add_argument('--top-k', type=int, default=4, help='Article excerpts added to a chat prompt')
+    parser.add_argument('--no-retrieval', action='store_true', help='Send chat messages without excerpts from the read articles')
+    args = parser.parse_args()
+    if args.parser != 'auto' and args.parser not in available_extractors():
+        parser.error(f"--parser {args.parser} is not installed")
+    return args
+
+def main():
+    args = parse_args()
+    cache = None if args.no_cache else ArticleCache(args.cache_path)
+    fetcher = WikiFetcher(args.server, SEARCH_PATH, workers=args.workers, prefetch_articles=args.prefetch, cache=cache, parser=args.parser)
+    summarizer = ArticleSummarizer(MODEL_NAME, args.chunk_tokens, args.summary_workers, cache=cache)
+    retriever = None if args.no_retrieval else ArticleRetriever(VectorIndex(args.index_dir, args.embed_model), args.embed_model, k=args.top_k)
+
+    context = []
+    current_instruction = None
+    last_query_results = []
+
+    try:
+        while True:
+            user_input = input("> ")
+
+            if user_input.startswith('/q '):
+                # Prompt for instruction before processing the query
+                instruction = input("Enter instruction (or press Enter to skip): ").strip()
                 
-                choice = input("\nEnter the number of the article you want to select or type 'next' for more results or 'exit' to quit: ")
+                parts = user_input.split(maxsplit=1)
+                if len(parts) == 2:
+                    pattern = parts[1]
+                    
+                    start = 0
+                    while True:
+                        articles, next_page_start = fetcher.fetch_results(pattern, start=start)
+                        if not articles:
+                            print("No more articles found.")
+                            break
+
+                        last_query_results = articles
+                        display_articles(articles)
+
+                        # Download the likely next requests while the user reads
+                        fetcher.prefetch(pattern, articles, next_page_start)
+                        
+                        ai_response = chat_with_ai('Choose one of the following articles:')
+                        print(ai_response)
+                        
+                        choice = input("\nEnter the number of the article you want to select or type 'next' for more results or 'exit' to quit: ")
+                        
+                        if choice.lower() == 'next' and next_page_start is not None:
+                            start = next_page_start
+                        elif choice.lower() == 'exit':
+                            break
+                        elif choice.isdigit() and 1 <= int(choice) <= len(articles):
+                            summarize_article(fetcher, summarizer, retriever, articles[int(choice) - 1])
+                            # After summarizing, return to the main loop
+                            break
+                        else:
+                            print("Invalid choice. Please try again.")
                 
-                if choice.lower() == 'next' and next_page_start is not None:
-                    start = next_page_start
-                elif choice.lower() == 'exit':
-                    break
-                elif choice.isdigit() and 1 <= int(choice) <= len(articles):
-                    selected_article = articles[int(choice) - 1]
-                    selected_link = selected_article['link']
-                    article_content = fetch_article_content(selected_link)
-                    summary = chat_with_ai(f"Print out the content of the following article: {article_content}")
-                    print("Summary:", summary)
-                    # Print the URL of the article
-                    print(f"Article URL: http://127.0.0.1{selected_link}")
-                    # After summarizing, return to the main loop
-                    break
+                # Combine instruction with results if provided
+                if instruction:
+                    instruction_message = f"Instruction: {instruction}\n\nResults: {last_query_results}"
+                    ai_response = chat_with_ai(instruction_message)
+                    print(ai_response)
+
+            elif user_input.startswith('/local '):
+                parts = user_input.split(maxsplit=1)
+                if cache is None:
+                    print("The local index is disabled (--no-cache).")
+                elif len(parts) == 2:
+                    last_query_results = search_local(cache, fetcher, summarizer, retriever, parts[1]) or last_query_results
                 else:
-                    print("Invalid choice. Please try again.")
-        
-        # Combine instruction with results if provided
-        if instruction:
-            instruction_message = f"Instruction: {instruction}\n\nResults: {last_query_results}"
-            ai_response = chat_with_ai(instruction_message)
-            print(ai_response)
-
-    elif user_input == '/exit':
-        print("Exiting.")
-        break
-    
-    else:
-        ai_response = chat_with_ai(user_input)
-        print(ai_response)
+                    print("Usage: /local <search terms>")
+
+            elif user_input == '/exit':
+                print("Exiting.")
+                break
+            
+            else:
+                # Ground the answer in the closest excerpts of the articles read so far
+                ai_response = chat_with_ai(retriever.prompt(user_input) if retriever is not None else user_input)
+                print(ai_response)
+    finally:
+        fetcher.close()
+        summarizer.close()
+        if retriever is not None:
+            retriever.close()
+        if cache is not None:
+            cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import os
+
+
+def read_records(path, skip_ids=()):
+    """
+    Yields (id, prompt) for every record of a JSONL file, one JSON object per
+    line with a "prompt" field and an optional "id" (the line number when
+    missing). Records whose id is in skip_ids are passed over. The file is
+    read lazily, one line at a time.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                prompt = record["prompt"]
+            except (ValueError, KeyError, TypeError):
+                print(f"Skipping line {line_number} of {path}: expected a JSON object with a \"prompt\" field")
+                continue
+            record_id = str(record.get("id", line_number))
+            if record_id not in skip_ids:
+                yield record_id, prompt
+
+
+def completed_ids(path):
+    """
+    Returns the ids that already have a successful result in the output file.
+    Later records supersede earlier ones, so an id that failed and then
+    succeeded counts as completed, and one that only failed is retried. A
+    last line cut short by an interrupted run is removed.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        complete_bytes = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete_bytes += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("error"):
+                done.discard(record["id"])
+            else:
+                done.add(record["id"])
+        f.truncate(complete_bytes)
+    return done
+
+
+def result_record(record_id, result):
+    """
+    The output line for one finished chain: every stage's response and
+    timing stats, plus the error if the chain stopped early.
+    """
+    return {
+        "id": record_id,
+        "prompt": result["prompt"],
+        "responses": result["responses"],
+        "timings": result["stats"],
+        "seconds": result["seconds"],
+        "error": result["error"],
+    }
+
+
+class ResultWriter:
+    """
+    Appends one JSON line per result and flushes it straight away, so an
+    interrupted run loses at most the chains still in progress.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "multi-reasoning", "responses.sqlite")
+
+
+def cache_key(model, messages, options=None):
+    """
+    Content address of one model call: a SHA-256 over the model, the full
+    messages (stage instructions included) and the sampling options.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "options": options or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of stage responses in SQLite.
+
+    Entries older than `ttl` seconds are treated as missing. Once the stored
+    responses exceed `max_bytes`, the least recently used ones are removed
+    until they fit again.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=256 * 2**20, ttl=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " stage TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " stats TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+
+    def get(self, key):
+        """
+        Returns (response, stats) stored under `key`, or None.
+        """
+        row = self.db.execute("SELECT response, stats, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, stats, created = row
+        now = time.time()
+        if self.ttl is not None and now - created > self.ttl:
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.db.commit()
+            return None
+        self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        return response, json.loads(stats)
+
+    def put(self, key, stage, response, stats):
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, stage, response, stats, size, created, accessed)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, stage, response, json.dumps(stats), len(response.encode("utf-8")), now, now),
+        )
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until enough is freed
+        stale = []
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def usage(self):
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": total}
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,133 @@
+import csv
+from collections import defaultdict
+
+# Per-stage timings summarized with quantiles; (stats key, metric name, help)
+TIMINGS = (
+    ("seconds", "reasoning_stage_seconds", "Wall time of a stage request, from sending it to the last token"),
+    ("time_to_first_token", "reasoning_stage_time_to_first_token_seconds", "Time from sending a stage request to its first token"),
+    ("queued", "reasoning_stage_queued_seconds", "Time a stage waited for a free concurrency slot"),
+    ("server_seconds", "reasoning_stage_server_seconds", "Time the model server reports spending on a stage"),
+    ("tokens_per_sec", "reasoning_stage_tokens_per_second", "Generation speed of a stage after its first token"),
+)
+# Per-stage totals; (stats key, metric name, help)
+COUNTS = (
+    ("chunks", "reasoning_stage_chunks_total", "Streamed chunks received"),
+    ("characters", "reasoning_stage_characters_total", "Characters of output received"),
+    ("tokens", "reasoning_stage_tokens_total", "Tokens generated"),
+)
+QUANTILES = (0.5, 0.95, 0.99)
+CSV_FIELDS = ("sample", "stage", "cached", "seconds", "time_to_first_token", "queued", "server_seconds",
+              "chunks", "characters", "tokens", "tokens_per_sec")
+
+
+def percentile(sorted_values, q):
+    """
+    The q-th quantile (0..1) of an ascending list, interpolating linearly
+    between the closest ranks.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class MetricsRecorder:
+    """
+    Collects the stats of every stage run in a session and summarizes them
+    per stage. Cached responses are counted as cache hits but left out of the
+    timing quantiles, which describe the model calls actually made.
+    """
+
+    def __init__(self):
+        self.samples = []
+        self.cache_hits = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, stage, stats):
+        self.samples.append(dict(stats, stage=stage, sample=len(self.samples) + 1))
+        if stats.get("cached"):
+            self.cache_hits[stage] += 1
+
+    def record_error(self, stage):
+        self.errors[stage] += 1
+
+    def stages(self):
+        # In the order they first ran
+        return list(dict.fromkeys(sample["stage"] for sample in self.samples))
+
+    def summary(self):
+        """
+        Returns {stage: {key: {"count", "mean", "p50", "p95", "p99"}}} for
+        every timing in TIMINGS, over the uncached samples of each stage.
+        """
+        summary = {}
+        for stage in self.stages():
+            samples = [sample for sample in self.samples if sample["stage"] == stage and not sample.get("cached")]
+            summary[stage] = {}
+            for key, _, _ in TIMINGS:
+                values = sorted(sample[key] for sample in samples if sample.get(key) is not None)
+                summary[stage][key] = {
+                    "count": len(values),
+                    "mean": sum(values) / len(values) if values else None,
+                    **{f"p{round(q * 100)}": percentile(values, q) for q in QUANTILES},
+                }
+        return summary
+
+    def format_summary(self):
+        lines = [f"{'stage':<14}{'runs':>6}{'cached':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}"
+                 f"{'p50 ttft':>10}{'p50 queued':>12}{'p50 tok/s':>11}"]
+        for stage, timings in self.summary().items():
+            def cell(key, quantile, width):
+                value = timings[key][quantile]
+                return f"{value:>{width}.2f}" if value is not None else f"{'-':>{width}}"
+            lines.append(
+                f"{stage:<14}{timings['seconds']['count']:>6}{self.cache_hits[stage]:>8}"
+                f"{cell('seconds', 'p50', 9)}{cell('seconds', 'p95', 9)}{cell('seconds', 'p99', 9)}"
+                f"{cell('time_to_first_token', 'p50', 10)}{cell('queued', 'p50', 12)}{cell('tokens_per_sec', 'p50', 11)}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """
+        The session's metrics in the Prometheus text exposition format:
+        a summary per timing and a counter per total, labelled by stage.
+        """
+        summary = self.summary()
+        lines = []
+        for key, name, help_text in TIMINGS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for stage in summary:
+                values = [sample[key] for sample in self.samples
+                          if sample["stage"] == stage and not sample.get("cached") and sample.get(key) is not None]
+                for q in QUANTILES:
+                    value = summary[stage][key][f"p{round(q * 100)}"]
+                    lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value if value is not None else "NaN"}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {sum(values)}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {len(values)}')
+        for key, name, help_text in COUNTS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage in summary:
+                total = sum(sample.get(key) or 0 for sample in self.samples if sample["stage"] == stage and not sample.get("cached"))
+                lines.append(f'{name}{{stage="{stage}"}} {total}')
+        for counts, name, help_text in ((self.cache_hits, "reasoning_stage_cache_hits_total", "Stages answered from the response cache"),
+                                        (self.errors, "reasoning_stage_errors_total", "Stage requests that failed")):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage in dict.fromkeys([*summary, *counts]):
+                lines.append(f'{name}{{stage="{stage}"}} {counts[stage]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+
+    def write_csv(self, path):
+        # One row per stage run, cached ones included
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.samples)
@@ -1,147 +1,17 @@
-import ollama
+import argparse
+import asyncio
 import time
 import sys
 import textwrap
 
+from batch import ResultWriter, completed_ids, read_records, result_record
+from cache import DEFAULT_CACHE_PATH, ResponseCache
+from metrics import MetricsRecorder
+from pipeline import STAGES, ReasoningPipeline
+
 # Define the model to be used consistently across all functions
 MODEL_NAME = "ajindal/llama3.1-storm:8b"
 
-def get_response(prompt):
-    """
-    Fetches the initial comprehensive response from the AI model based on the user prompt.
-    """
-    message = {"role": "user", "content": prompt}
-
-    # Display progress
-    print("\nGenerating initial response...", end=' ', flush=True)
-
-    try:
-        # Get the response from the Ollama chat model with streaming
-        response_stream = ollama.chat(
-            model=MODEL_NAME,
-            messages=[message],
-            stream=True,
-        )
-
-        # Accumulate the response
-        ai_response = ""
-        for chunk in response_stream:
-            content = chunk.get("message", {}).get("content", "")
-            ai_response += content
-
-        print("Done.\n")  # Indicate completion
-
-        return ai_response.strip()
-    except Exception as e:
-        print(f"\nAn error occurred during initial response generation: {e}\n")
-        return ""
-
-def think(prompt):
-    """
-    AI thinks deeply about the prompt and provides a detailed reflection.
-    """
-    system_message = (
-        "You are an expert analyst and coder. "
-        "Provide a detailed reflection on the following topic, maintaining context from previous steps. "
-        "Format your response using numbered steps with titles and subheaders where applicable. "
-        "Include Python code blocks using triple backticks if needed.\n\n"
-        
-        f"{prompt}"
-    )
-    message = {"role": "system", "content": system_message}
-
-    # Display progress
-    print("Thinking...", end=' ', flush=True)
-
-    try:
-        thinking_stream = ollama.chat(
-            model=MODEL_NAME,
-            messages=[message],
-            stream=True,
-        )
-
-        thinking_response = ""
-        for chunk in thinking_stream:
-            content = chunk.get("message", {}).get("content", "")
-            thinking_response += content
-
-        print("Done.\n")
-
-        return thinking_response.strip()
-    except Exception as e:
-        print(f"\nAn error occurred during thinking step: {e}\n")
-        return ""
-
-def process(thinking_response):
-    """
-    Processes the AI's reflection and summarizes key points.
-    """
-    system_message = (
-        "You are an expert in summarizing and structuring information. "
-        "Summarize the following detailed reflection into key actionable steps, maintaining context from previous steps. "
-        "Ensure that each step is numbered and includes a title and subheaders if applicable. "
-        "Maintain any code blocks with proper formatting.\n\n"
-        f"{thinking_response}"
-    )
-    message = {"role": "system", "content": system_message}
-
-    # Display progress
-    print("Processing...", end=' ', flush=True)
-
-    try:
-        processing_stream = ollama.chat(
-            model=MODEL_NAME,
-            messages=[message],
-            stream=True,
-        )
-
-        processing_response = ""
-        for chunk in processing_stream:
-            content = chunk.get("message", {}).get("content", "")
-            processing_response += content
-
-        print("Done.\n")
-
-        return processing_response.strip()
-    except Exception as e:
-        print(f"\nAn error occurred during processing step: {e}\n")
-        return ""
-
-def analyze(processing_response):
-    """
-    Analyzes the summarized steps to extract actionable insights and evaluations.
-    """
-    system_message = (
-        "You are an expert analyst and coder. "
-        "Analyze the following summarized steps to extract actionable insights, identify key challenges, and provide comprehensive evaluations, maintaining context from previous steps. "
-        "Format your response using numbered steps with titles and subheaders where applicable. "
-        "Ensure that any included Python code blocks are properly formatted using triple backticks.\n\n"
-        f"{processing_response}"
-    )
-    message = {"role": "system", "content": system_message}
-
-    # Display progress
-    print("Analyzing...", end=' ', flush=True)
-
-    try:
-        analyzing_stream = ollama.chat(
-            model=MODEL_NAME,
-            messages=[message],
-            stream=True,
-        )
-
-        analyzing_response = ""
-        for chunk in analyzing_stream:
-            content = chunk.get("message", {}).get("content", "")
-            analyzing_response += content
-
-        print("Done.\n")
-
-        return analyzing_response.strip()
-    except Exception as e:
-        print(f"\nAn error occurred during analyzing step: {e}\n")
-        return ""
-
 def format_final_output(text):
     """
     Formats the final analysis result using Markdown-like syntax and text wrapping.
@@ -165,9 +35,32 @@ def format_final_output(text):
     formatted_output = f"{header}\n{wrapped_text}\n{separator}"
     return formatted_output
 
-def main():
+def format_stats(stats):
+    if stats.get('cached'):
+        return f"cached, originally {stats['seconds']:.2f}s"
+    first_token = f"{stats['time_to_first_token']:.2f}s" if stats['time_to_first_token'] is not None else "n/a"
+    speed = f"{stats['tokens_per_sec']:.1f} tokens/s" if stats['tokens_per_sec'] is not None else "n/a"
+    return f"{stats['seconds']:.2f}s, first token after {first_token}, {stats['tokens']} tokens at {speed}"
+
+def print_stage_start(stage):
+    # Display progress, then the response as it streams in
+    print(f"\n{stage.progress}" if stage is STAGES[0] else stage.progress)
+    print(f"=== {stage.title} ===")
+
+def print_token(stage, content):
+    print(content, end='', flush=True)
+
+def print_stage_end(stage, response, stats):
+    print("\n" + "=" * len(f"=== {stage.title} ==="))
+    print(f"({format_stats(stats)})\n")
+
+async def run_interactive(pipeline):
+    """
+    Reads prompts one at a time and streams every stage's response to the
+    terminal as it is generated.
+    """
     while True:
-        prompt = input("Enter a prompt (or type 'exit' to quit): ")
+        prompt = await asyncio.to_thread(input, "Enter a prompt (or type 'exit' to quit): ")
         if prompt.lower() == 'exit':
             print("Exiting the program. Goodbye!")
             break
@@ -175,64 +68,143 @@ def main():
         # Start timer
         start_time = time.time()
 
-        # Step 1: Generate Initial Response
-        initial_response = get_response(prompt)
-
-        if not initial_response:
-            print("Failed to generate initial response. Please try again.\n")
+        result = await pipeline.run_chain(prompt, print_stage_start, print_stage_end, print_token)
+        if result["error"]:
+            print(f"\nAn error occurred: {result['error']}. Please try again.\n")
             continue
 
-        # Print Initial Response
-        print("=== Initial Response ===")
-        print(initial_response)
-        print("========================\n")
-
-        # Step 2: Think about the initial response
-        think_response = think(initial_response)
-
-        if not think_response:
-            print("Failed during thinking step. Please try again.\n")
-            continue
-
-        # Print Think Response
-        print("=== Think Response ===")
-        print(think_response)
-        print("======================\n")
-
-        # Step 3: Process the thinking response
-        process_response = process(think_response)
-
-        if not process_response:
-            print("Failed during processing step. Please try again.\n")
-            continue
-
-        # Print Process Response
-        print("=== Process Response ===")
-        print(process_response)
-        print("========================\n")
-
-        # Step 4: Analyze the processing response
-        analyze_response = analyze(process_response)
-
-        if not analyze_response:
-            print("Failed during analyzing step. Please try again.\n")
-            continue
-
-        # Print Analyze Response
-        print("=== Analyze Response ===")
-        print(analyze_response)
-        print("========================\n")
-
         # End timer
         end_time = time.time()
         total_time = end_time - start_time
 
         # Format the final output nicely
-        final_output = format_final_output(analyze_response)
+        final_output = format_final_output(result["responses"]["analyze"])
         print(final_output)
 
         # Display total processing time
         print(f"Total Processing Time: {total_time:.2f} seconds\n")
 
+def read_prompts(path):
+    """
+    Yields the non-empty lines of a text file, one prompt per line.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line.strip()
+
+async def run_prompt_file(pipeline, path, max_in_flight):
+    """
+    Runs every prompt in the file with chains overlapping and prints each
+    final analysis as its chain completes.
+    """
+    start_time = time.time()
+    completed = failed = 0
+    async for number, result in pipeline.run_batch(enumerate(read_prompts(path), 1), max_in_flight):
+        print(f"=== Prompt {number}: {result['prompt']} ===")
+        if result["error"]:
+            failed += 1
+            print(f"An error occurred: {result['error']}\n")
+            continue
+        completed += 1
+        print(format_final_output(result["responses"]["analyze"]))
+        for name, stats in result["stats"].items():
+            print(f"{name}: {format_stats(stats)}")
+        print()
+
+    total_time = time.time() - start_time
+    print(f"Completed {completed} prompts ({failed} failed) in {total_time:.2f} seconds")
+
+async def run_jsonl(pipeline, input_path, output_path, max_in_flight):
+    """
+    Runs every record of a JSONL file and appends one result line per record
+    to the output file as it completes. Records that already have a result
+    there are skipped, so an interrupted run picks up where it stopped.
+    """
+    done = completed_ids(output_path)
+    if done:
+        print(f"Resuming: {len(done)} records already completed in {output_path}")
+
+    start_time = time.time()
+    completed = failed = 0
+    writer = ResultWriter(output_path)
+    try:
+        async for record_id, result in pipeline.run_batch(read_records(input_path, done), max_in_flight):
+            writer.write(result_record(record_id, result))
+            if result["error"]:
+                failed += 1
+                print(f"[{record_id}] failed after {result['seconds']:.2f}s: {result['error']}")
+            else:
+                completed += 1
+                print(f"[{record_id}] done in {result['seconds']:.2f}s")
+    finally:
+        writer.close()
+
+    total_time = time.time() - start_time
+    print(f"Completed {completed} records ({failed} failed) in {total_time:.2f} seconds; results in {output_path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run prompts through a multi-stage reasoning chain on a local Ollama model.")
+    parser.add_argument('--prompts', type=str, default=None, help='Text file with one prompt per line to run as a batch (default: interactive)')
+    parser.add_argument('--input', type=str, default=None, help='JSONL file of {"id", "prompt"} records to run as a batch')
+    parser.add_argument('--output', type=str, default=None, help='JSONL file the --input results are appended to')
+    parser.add_argument('--concurrency', type=int, default=2, help='Maximum number of requests sent to the model server at once')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='Prompts worked on at once in batch mode (default: twice the concurrency)')
+    parser.add_argument('--host', type=str, default=None, help='Ollama server address (default: OLLAMA_HOST or localhost)')
+    parser.add_argument('--model', type=str, default=MODEL_NAME, help='Model used for every stage')
+    parser.add_argument('--temperature', type=float, default=None, help='Sampling temperature (default: the model\'s own)')
+    parser.add_argument('--seed', type=int, default=None, help='Sampling seed for reproducible responses')
+    parser.add_argument('--metrics-csv', type=str, default=None, help='Write the stats of every stage run to this CSV file on exit')
+    parser.add_argument('--metrics-prom', type=str, default=None, help='Write per-stage summaries in Prometheus text format to this file on exit')
+    parser.add_argument('--no-cache', action='store_true', help='Always query the model instead of reusing cached responses')
+    parser.add_argument('--cache-path', type=str, default=DEFAULT_CACHE_PATH, help='SQLite file the responses are cached in')
+    parser.add_argument('--cache-size', type=float, default=256, help='Maximum size of the cached responses in MB')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='Seconds a cached response stays valid (default: forever)')
+    args = parser.parse_args()
+
+    if args.concurrency <= 0 or (args.max_in_flight is not None and args.max_in_flight <= 0):
+        parser.error("--concurrency and --max-in-flight must be positive")
+    if (args.input is None) != (args.output is None):
+        parser.error("--input and --output must be given together")
+    return args
+
+async def run(args):
+    options = {name: value for name, value in (('temperature', args.temperature), ('seed', args.seed)) if value is not None}
+    cache = None if args.no_cache else ResponseCache(args.cache_path, int(args.cache_size * 2**20), args.cache_ttl)
+
+    metrics = MetricsRecorder()
+
+    # One client and connection pool for the whole session
+    pipeline = ReasoningPipeline(args.model, args.host, args.concurrency, cache=cache, options=options or None, metrics=metrics)
+    try:
+        if args.input:
+            await run_jsonl(pipeline, args.input, args.output, args.max_in_flight)
+        elif args.prompts:
+            await run_prompt_file(pipeline, args.prompts, args.max_in_flight)
+        else:
+            await run_interactive(pipeline)
+    finally:
+        await pipeline.close()
+        report_metrics(metrics, args)
+
+def report_metrics(metrics, args):
+    if not metrics.samples:
+        return
+    print("\n=== Stage Latency Summary ===")
+    print(metrics.format_summary())
+    if args.metrics_csv:
+        metrics.write_csv(args.metrics_csv)
+        print(f"Stage metrics written to {args.metrics_csv}")
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f"Prometheus metrics written to {args.metrics_prom}")
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+import asyncio
+import time
+
+import ollama
+
+from cache import cache_key
+
+
+class Stage:
+    """
+    One step of the reasoning chain: the instructions sent with its input and
+    the labels used when printing it.
+    """
+
+    def __init__(self, name, title, progress, instructions=None):
+        self.name = name
+        self.title = title
+        self.progress = progress
+        self.instructions = instructions
+
+    def messages(self, text):
+        """
+        Builds the chat messages for this stage. The first stage sends the
+        user's prompt as is; later stages wrap the previous output in their
+        system instructions.
+        """
+        if self.instructions is None:
+            return [{"role": "user", "content": text}]
+        return [{"role": "system", "content": self.instructions + text}]
+
+
+STAGES = (
+    Stage("get_response", "Initial Response", "Generating initial response..."),
+    Stage(
+        "think", "Think Response", "Thinking...",
+        "You are an expert analyst and coder. "
+        "Provide a detailed reflection on the following topic, maintaining context from previous steps. "
+        "Format your response using numbered steps with titles and subheaders where applicable. "
+        "Include Python code blocks using triple backticks if needed.\n\n"
+    ),
+    Stage(
+        "process", "Process Response", "Processing...",
+        "You are an expert in summarizing and structuring information. "
+        "Summarize the following detailed reflection into key actionable steps, maintaining context from previous steps. "
+        "Ensure that each step is numbered and includes a title and subheaders if applicable. "
+        "Maintain any code blocks with proper formatting.\n\n"
+    ),
+    Stage(
+        "analyze", "Analyze Response", "Analyzing...",
+        "You are an expert analyst and coder. "
+        "Analyze the following summarized steps to extract actionable insights, identify key challenges, and provide comprehensive evaluations, maintaining context from previous steps. "
+        "Format your response using numbered steps with titles and subheaders where applicable. "
+        "Ensure that any included Python code blocks are properly formatted using triple backticks.\n\n"
+    ),
+)
+
+
+def stage_stats(start, first_token, end, chunks, characters, tokens=None, queued=0.0, server_seconds=None):
+    """
+    Timing of one streamed stage. Tokens are the model's eval_count when the
+    server reports it, otherwise the number of streamed chunks; tokens/sec
+    is measured from the first token on, so it excludes prompt processing.
+    `queued` is the time spent waiting for a concurrency slot before the
+    request was sent, and `server_seconds` the server's own total_duration,
+    so the rest of "seconds" is spent on the network and in the client.
+    """
+    tokens = tokens if tokens is not None else chunks
+    generating = end - first_token if first_token is not None else 0.0
+    return {
+        "seconds": end - start,
+        "queued": queued,
+        "server_seconds": server_seconds,
+        "time_to_first_token": first_token - start if first_token is not None else None,
+        "chunks": chunks,
+        "characters": characters,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / generating if generating > 0 else None,
+        "cached": False,
+    }
+
+
+class ReasoningPipeline:
+    """
+    Runs the reasoning chain on one shared AsyncClient.
+
+    At most `concurrency` stage requests are sent to the model server at a
+    time, whichever prompts they belong to. In batch mode several chains are
+    in flight together, so one prompt's first stage runs while another is
+    in its last one and the server never waits on the client between stages.
+    """
+
+    def __init__(self, model, host=None, concurrency=1, client=None, cache=None, options=None, metrics=None):
+        self.model = model
+        self.client = client or ollama.AsyncClient(host=host)
+        self.concurrency = concurrency
+        self.limit = asyncio.Semaphore(concurrency)
+        self.cache = cache  # A cache.ResponseCache, or None to always call the model
+        self.options = options  # Sampling options sent with every request
+        self.metrics = metrics  # A metrics.MetricsRecorder that sees every stage, or None
+
+    async def run_stage(self, stage, text, on_token=None):
+        """
+        Runs one stage on `text`, passing every piece of the response to
+        on_token(stage, content) as it arrives. Returns the full response and
+        its timing stats (see stage_stats).
+
+        Responses found in the cache are returned at once without a request;
+        their stats are the ones recorded when they were generated, with
+        "cached" set.
+        """
+        messages = stage.messages(text)
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.model, messages, self.options)
+            hit = self.cache.get(key)
+            if hit is not None:
+                response, stats = hit
+                if on_token:
+                    on_token(stage, response)
+                stats = dict(stats, cached=True)
+                self._record(stage, stats)
+                return response, stats
+
+        waiting = time.perf_counter()
+        async with self.limit:
+            start = time.perf_counter()
+            first_token = None
+            tokens = None
+            server_seconds = None
+            chunks = []
+            stream = await self.client.chat(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                options=self.options,
+            )
+            async for chunk in stream:
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    chunks.append(content)
+                    if on_token:
+                        on_token(stage, content)
+                if chunk.get("done"):
+                    tokens = chunk.get("eval_count")
+                    if chunk.get("total_duration"):
+                        server_seconds = chunk.get("total_duration") / 1e9
+            end = time.perf_counter()
+        response = "".join(chunks)
+        stats = stage_stats(start, first_token, end, len(chunks), len(response), tokens, start - waiting, server_seconds)
+        self._record(stage, stats)
+        response = response.strip()
+        if key is not None and response:
+            self.cache.put(key, stage.name, response, stats)
+        return response, stats
+
+    async def run_chain(self, prompt, on_stage_start=None, on_stage_end=None, on_token=None):
+        """
+        Runs every stage in order, each on the previous stage's output. A
+        stage starts as soon as the previous one has streamed its last token.
+        Returns {"prompt", "responses", "stats", "seconds", "error"}: the
+        response and stats of every stage that completed, the chain's total
+        time, and why it stopped early if it did.
+        """
+        start = time.perf_counter()
+        result = {"prompt": prompt, "responses": {}, "stats": {}, "seconds": None, "error": None}
+        text = prompt
+        for stage in STAGES:
+            if on_stage_start:
+                on_stage_start(stage)
+            try:
+                text, stats = await self.run_stage(stage, text, on_token)
+            except Exception as e:
+                result["error"] = f"{stage.name} failed: {e}"
+                if self.metrics is not None:
+                    self.metrics.record_error(stage.name)
+                break
+            if not text:
+                result["error"] = f"{stage.name} returned an empty response"
+                break
+            result["responses"][stage.name] = text
+            result["stats"][stage.name] = stats
+            if on_stage_end:
+                on_stage_end(stage, text, stats)
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    async def run_batch(self, items, max_in_flight=None):
+        """
+        Runs the chain for every (key, prompt) of the iterable `items`,
+        keeping at most `max_in_flight` chains started (twice the
+        concurrency limit by default) so long inputs are read as they are
+        needed. Yields (key, result) as each chain finishes.
+        """
+        max_in_flight = max_in_flight or 2 * self.concurrency
+        items = iter(items)
+        running = {}
+
+        def start_next():
+            for key, prompt in items:
+                running[asyncio.ensure_future(self.run_chain(prompt))] = key
+                return True
+            return False
+
+        while len(running) < max_in_flight and start_next():
+            pass
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = running.pop(task)
+                start_next()
+                yield key, task.result()
+
+    def _record(self, stage, stats):
+        if self.metrics is not None:
+            self.metrics.record(stage.name, stats)
+
+    async def close(self):
+        await self.client.close()
+        if self.cache is not None:
+            self.cache.close()
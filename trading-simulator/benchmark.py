@@ -0,0 +1,245 @@
+"""
+Benchmark the trading simulators on synthetic price series.
+
+Generates geometric Brownian motion series of the requested lengths and
+times each building block separately: the Bollinger Band pass, single
+perform_action calls, full run_backtest runs on both engines and DCA.py's
+simulate_dca_strategy. Each result is reported as steps (price rows) per
+second together with the peak memory traced during one extra run.
+
+Results can be saved as a baseline and later runs compared against it, so
+a change to an engine that slows it down shows up as a regression:
+
+    python benchmark.py --rows 1000 100000 1000000 --save-baseline baseline.json
+    python benchmark.py --rows 1000 100000 1000000 --compare baseline.json
+
+Nothing is plotted or shown, so it runs unattended on a server.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import kernel
+import multi_dca
+from bench_bollinger import synthetic_prices
+from indicators import add_bollinger_bands, calculate_bollinger_bands
+
+# DCA.py lives in the sibling 'Trading Stuff' directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Trading Stuff'))
+import DCA
+
+BENCHMARKS = ('bollinger', 'perform_action', 'backtest_pandas', 'backtest_kernel', 'dca')
+DEFAULT_ROWS = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def synthetic_ohlcv(rows, seed=0):
+    """
+    A minute-bar OHLCV frame in the layout of the Yahoo Finance CSVs, built
+    around the GBM close prices of bench_bollinger.synthetic_prices.
+    """
+    data = synthetic_prices(rows, seed)
+    data.index.name = 'Date'
+    close = data['Adj Close'].to_numpy()
+    rng = np.random.default_rng(seed + 1)
+    spread = np.abs(rng.normal(0.0, 0.005, rows))
+    data['Open'] = np.concatenate(([close[0]], close[:-1]))
+    data['High'] = np.maximum(data['Open'], close) * (1 + spread)
+    data['Low'] = np.minimum(data['Open'], close) * (1 - spread)
+    data['Close'] = close
+    data['Volume'] = rng.integers(1_000, 1_000_000, rows)
+    return data[['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']]
+
+
+# Each setup_* prepares its inputs outside the timed region and returns the
+# function to time and the number of steps one call of it processes
+
+def setup_bollinger(data, args):
+    prices = data['Adj Close']
+    return lambda: calculate_bollinger_bands(prices, multi_dca.window, multi_dca.num_std_dev), len(prices)
+
+
+def setup_perform_action(data, args):
+    calls = min(len(data), args.action_calls)
+    prices = data['Adj Close'].to_numpy()[:calls].tolist()
+    actions = np.random.default_rng(args.seed).integers(multi_dca.num_actions, size=calls).tolist()
+
+    def run():
+        portfolio = multi_dca.reset_portfolio()
+        transaction_log = multi_dca.TransactionLog(multi_dca.log_level)
+        for action, price in zip(actions, prices):
+            multi_dca.perform_action(action, price, portfolio, transaction_log, float('inf'), 0,
+                                     multi_dca.epsilon_base, multi_dca.alpha_base, multi_dca.gamma_base)
+    return run, calls
+
+
+def _setup_backtest(data, args, engine):
+    multi_dca.set_historical_data(add_bollinger_bands(data.copy(), multi_dca.window, multi_dca.num_std_dev))
+    backtest = multi_dca.run_backtest_kernel if engine == 'kernel' else multi_dca.run_backtest
+
+    def run():
+        q_table = np.zeros((multi_dca.get_num_states(), multi_dca.num_actions))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            backtest(float('inf'), q_table, np.random.default_rng(args.seed))
+    return run, len(data)
+
+
+def setup_backtest_pandas(data, args):
+    return _setup_backtest(data, args, 'pandas')
+
+
+def setup_backtest_kernel(data, args):
+    return _setup_backtest(data, args, 'kernel')
+
+
+def setup_dca(data, args):
+    return lambda: DCA.simulate_dca_strategy(data, 100.0, args.dca_frequency), len(data)
+
+
+SETUPS = {
+    'bollinger': setup_bollinger,
+    'perform_action': setup_perform_action,
+    'backtest_pandas': setup_backtest_pandas,
+    'backtest_kernel': setup_backtest_kernel,
+    'dca': setup_dca,
+}
+
+
+def measure(func, repeat, trace_memory):
+    # Best of `repeat` untraced runs; tracemalloc slows Python code down a
+    # lot, so peak memory comes from one separate traced run
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(args):
+    results = []
+    for rows in args.rows:
+        data = synthetic_ohlcv(rows, args.seed)
+        for name in args.benchmarks:
+            if name == 'backtest_pandas' and rows > args.pandas_limit:
+                print(f"{name:>16} {rows:>12,}  skipped (above --pandas-limit)")
+                continue
+            func, steps = SETUPS[name](data, args)
+            if name == 'backtest_kernel':
+                func()  # Compile (or load the cached) numba kernel outside the timing
+            seconds, peak = measure(func, args.repeat, not args.no_memory)
+            result = {
+                'benchmark': name,
+                'rows': rows,
+                'steps': steps,
+                'seconds': seconds,
+                'steps_per_sec': steps / seconds if seconds > 0 else float('inf'),
+                'peak_memory_mb': peak / 2**20 if peak is not None else None,
+            }
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(result):
+    memory = f"{result['peak_memory_mb']:10.1f} MB" if result['peak_memory_mb'] is not None else ''
+    print(f"{result['benchmark']:>16} {result['rows']:>12,}  {result['seconds']:10.4f}s  "
+          f"{result['steps_per_sec']:>14,.0f} steps/s  {memory}")
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'numba': kernel.compiled_kernel is not None,
+    }
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=4)
+    print(f"\nBaseline saved to {path}")
+
+
+def compare_with_baseline(path, results, tolerance):
+    """
+    Print the speed of every result relative to the baseline and return the
+    ones more than `tolerance` slower.
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    previous = {(result['benchmark'], result['rows']): result for result in baseline['results']}
+
+    print(f"\nCompared with {path}:")
+    regressions = []
+    for result in results:
+        old = previous.get((result['benchmark'], result['rows']))
+        if old is None:
+            continue
+        ratio = result['steps_per_sec'] / old['steps_per_sec']
+        status = 'REGRESSION' if ratio < 1 - tolerance else 'ok'
+        print(f"{result['benchmark']:>16} {result['rows']:>12,}  {ratio:6.2f}x baseline speed  {status}")
+        if status == 'REGRESSION':
+            regressions.append(result)
+    if baseline.get('environment') != environment():
+        print("Note: the baseline was recorded in a different environment:", baseline.get('environment'))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the trading simulators on synthetic GBM price series.")
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS), help='Series lengths to benchmark (1k to 10M rows)')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS), help='Benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic series and the backtests')
+    parser.add_argument('--pandas-limit', type=int, default=1_000_000, help='Skip the row-by-row pandas backtest above this many rows')
+    parser.add_argument('--action-calls', type=int, default=100_000, help='Maximum number of perform_action calls timed per size')
+    parser.add_argument('--dca-frequency', choices=list(DCA.FREQUENCY_PERIODS), default='daily', help='Frequency for simulate_dca_strategy')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that measures peak memory')
+    parser.add_argument('--save-baseline', type=str, default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, default=None, help='Compare the results with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Slowdown relative to the baseline reported as a regression')
+    args = parser.parse_args()
+
+    if any(rows < 1 for rows in args.rows) or args.repeat < 1:
+        parser.error("--rows and --repeat must be positive")
+    return args
+
+
+def main():
+    args = parse_args()
+    multi_dca.log_level = 'trades'
+
+    print(f"{'benchmark':>16} {'rows':>12}  {'best time':>11}  {'throughput':>22}  {'peak memory':>13}")
+    results = run_benchmarks(args)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        regressions = compare_with_baseline(args.compare, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
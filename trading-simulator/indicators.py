@@ -0,0 +1,135 @@
+import numpy as np
+
+
+# Calculate Moving Average and Bollinger Bands
+def calculate_moving_average(data, window):
+    return data.rolling(window=window).mean()
+
+def calculate_bollinger_bands(data, window, num_std_dev):
+    rolling_mean = calculate_moving_average(data, window)
+    rolling_std = data.rolling(window=window).std()
+    upper_band = rolling_mean + (rolling_std * num_std_dev)
+    lower_band = rolling_mean - (rolling_std * num_std_dev)
+    return rolling_mean, upper_band, lower_band
+
+def add_bollinger_bands(data, window, num_std_dev, column='Adj Close'):
+    """
+    Compute the MA, Upper Band and Lower Band columns for the whole frame in a
+    single rolling pass. Rolling windows only look backwards, so the value at
+    each row is the same one the per-row recompute over data.loc[:date] gave.
+    """
+    rolling_mean, upper_band, lower_band = calculate_bollinger_bands(data[column], window, num_std_dev)
+    data['MA'] = rolling_mean
+    data['Upper Band'] = upper_band
+    data['Lower Band'] = lower_band
+    return data
+
+class RollingBands:
+    """
+    Incremental Bollinger Bands: O(1) per value using a running sum and sum of
+    squares over the last `window` values. Use this when prices arrive one at
+    a time and the full series is not available up front.
+    """
+
+    def __init__(self, window, num_std_dev):
+        self.window = window
+        self.num_std_dev = num_std_dev
+        self.values = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, value):
+        slot = self.count % self.window
+        if self.count >= self.window:
+            old = self.values[slot]
+            self.total -= old
+            self.total_sq -= old * old
+        self.values[slot] = value
+        self.total += value
+        self.total_sq += value * value
+        self.count += 1
+        if slot == self.window - 1:
+            # Re-sum once per full window so rounding drift can't build up
+            self.total = float(self.values.sum())
+            self.total_sq = float(np.dot(self.values, self.values))
+        return self.bands()
+
+    def bands(self):
+        if self.count < self.window:
+            return np.nan, np.nan, np.nan
+        mean = self.total / self.window
+        variance = max(0.0, (self.total_sq - self.total * mean) / (self.window - 1))
+        std = variance ** 0.5
+        return mean, mean + std * self.num_std_dev, mean - std * self.num_std_dev
+
+# Discretized market state for the Q-learning agent: where the price sits in
+# the bands (%B), whether the bands are widening, and short-term momentum
+POSITION_EDGES = (0.0, 0.25, 0.5, 0.75, 1.0)  # %B buckets: below, 4 inside, above
+MOMENTUM_EDGES = (-0.5, 0.5)  # Price change over the momentum period, in band standard deviations
+NUM_POSITIONS = len(POSITION_EDGES) + 1
+NUM_MOMENTUM = len(MOMENTUM_EDGES) + 1
+WARMUP_STATE = NUM_POSITIONS * 2 * NUM_MOMENTUM  # Until the bands and momentum are defined
+NUM_BAND_STATES = WARMUP_STATE + 1
+
+def encode_band_states(prices, ma, upper, lower, num_std_dev, momentum_period=5):
+    """
+    Encode every bar as one integer state in [0, NUM_BAND_STATES) from the
+    price and its precomputed bands. Bars before the bands, the previous
+    band width and the momentum lookback exist get WARMUP_STATE.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    ma = np.asarray(ma, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    n = len(prices)
+
+    width = upper - lower
+    previous_width = np.full(n, np.nan)
+    previous_width[1:] = width[:-1]
+    change = np.full(n, np.nan)
+    change[momentum_period:] = prices[momentum_period:] - prices[:-momentum_period]
+    std = width / (2 * num_std_dev)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_b = np.where(width > 0, (prices - lower) / width, 0.5)
+        momentum = np.where(std > 0, change / std, 0.0)
+    position = np.digitize(percent_b, POSITION_EDGES)
+    expanding = (width > previous_width).astype(np.int64)
+    trend = np.digitize(momentum, MOMENTUM_EDGES)
+
+    codes = (position * 2 + expanding) * NUM_MOMENTUM + trend
+    warmup = np.isnan(ma) | np.isnan(width) | np.isnan(previous_width) | np.isnan(change)
+    codes[warmup] = WARMUP_STATE
+    return codes
+
+class BandStateEncoder:
+    """
+    encode_band_states one bar at a time, for bands from RollingBands. Gives
+    the same state for the same band values.
+    """
+
+    def __init__(self, num_std_dev, momentum_period=5):
+        self.num_std_dev = num_std_dev
+        self.momentum_period = momentum_period
+        self.prices = np.zeros(momentum_period)
+        self.count = 0
+        self.previous_width = np.nan
+
+    def update(self, price, ma, upper, lower):
+        slot = self.count % self.momentum_period
+        change = price - self.prices[slot] if self.count >= self.momentum_period else np.nan
+        self.prices[slot] = price
+        self.count += 1
+
+        width = upper - lower
+        previous_width, self.previous_width = self.previous_width, width
+        if np.isnan(ma) or np.isnan(width) or np.isnan(previous_width) or np.isnan(change):
+            return WARMUP_STATE
+
+        std = width / (2 * self.num_std_dev)
+        percent_b = (price - lower) / width if width > 0 else 0.5
+        momentum = change / std if std > 0 else 0.0
+        position = int(np.digitize(percent_b, POSITION_EDGES))
+        trend = int(np.digitize(momentum, MOMENTUM_EDGES))
+        return (position * 2 + int(width > previous_width)) * NUM_MOMENTUM + trend
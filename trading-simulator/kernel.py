@@ -0,0 +1,412 @@
+"""
+Array-based backtest kernel for multi_dca.py.
+
+run_kernel walks the price series over plain float64 arrays instead of
+DataFrame rows and dicts. The same loop body is compiled with numba when it
+is installed and otherwise runs as plain Python over lists, which is still
+far cheaper than iterrows(). Every floating point operation happens in the
+same order as in multi_dca's pandas engine, so under the same seed both
+produce identical results.
+"""
+
+import numpy as np
+
+from transactions import BUY, HOLD, SELL, STOP_LOSS
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional
+    njit = None
+
+# Event codes written to the kernel's event buffers, shared with transactions.py
+EVENT_BUY = BUY
+EVENT_SELL = SELL
+EVENT_HOLD = HOLD
+EVENT_STOP_LOSS = STOP_LOSS
+EVENT_RESET = 4  # Portfolio depleted and reset, not a transaction
+EVENT_COLUMNS = ('kind', 'step', 'amount', 'price', 'total')
+EVENT_DTYPES = (np.int8, np.int64, np.float64, np.float64, np.float64)
+
+# Layout of the kernel's scalar state vector
+CASH = 0
+TOTAL_FEES = 1
+EPSILON = 2
+ALPHA = 3
+GAMMA = 4
+COOLDOWN_PERIOD = 5
+COOLDOWN_COUNTER = 6
+TOTAL_AMOUNT = 7
+TOTAL_COST = 8
+OPEN_LOTS = 9
+LOT_COUNT = 10
+EVENT_COUNT = 11
+TYPE_COUNTS = 12  # Four slots: number of events of each transaction type
+STATE_SIZE = 16
+
+# Layout of the parameter vector
+INITIAL_CASH = 0
+MAX_ORDER = 1
+COOLDOWN_BASE = 2
+STOP_LOSS = 3
+MAKER_FEE = 4
+TAKER_FEE = 5
+MAX_TRADES = 6
+LIMIT_TRADES = 7
+LOG_LEVEL = 8  # 2 records every event, 1 skips holds, 0 records only resets
+PARAM_SIZE = 9
+
+
+class RandomBlocks:
+    """
+    Exploration draws pre-drawn in blocks from a numpy Generator: one uniform
+    and one random action per step. The pandas engine takes them one step at
+    a time with next(), the kernel takes whole runs with take(), and both
+    consume the generator in exactly the same order.
+    """
+
+    def __init__(self, rng, num_actions, block_size=4096):
+        self.rng = rng
+        self.num_actions = num_actions
+        self.block_size = block_size
+        self.uniform = np.empty(0)
+        self.actions = np.empty(0, dtype=np.int64)
+        self.position = 0
+
+    def _refill(self):
+        self.uniform = self.rng.random(self.block_size)
+        self.actions = self.rng.integers(self.num_actions, size=self.block_size)
+        self.position = 0
+
+    def next(self):
+        if self.position >= len(self.uniform):
+            self._refill()
+        i = self.position
+        self.position += 1
+        return self.uniform[i], self.actions[i]
+
+    def take(self, n):
+        uniform = np.empty(n)
+        actions = np.empty(n, dtype=np.int64)
+        filled = 0
+        while filled < n:
+            if self.position >= len(self.uniform):
+                self._refill()
+            count = min(n - filled, len(self.uniform) - self.position)
+            uniform[filled:filled + count] = self.uniform[self.position:self.position + count]
+            actions[filled:filled + count] = self.actions[self.position:self.position + count]
+            self.position += count
+            filled += count
+        return uniform, actions
+
+
+def _backtest_kernel(start, prices, states, uniform, random_actions, q, num_actions, params, state, step_action, step_reward,
+                     lot_price, lot_amount, lot_stop, event_kind, event_step, event_amount, event_price, event_total):
+    # Returns the index of the next step to run. When the lot or event
+    # buffers are too small to guarantee the next step fits, it returns early
+    # so the caller can grow them and resume.
+    initial_cash = params[INITIAL_CASH]
+    max_order = params[MAX_ORDER]
+    cooldown_base = params[COOLDOWN_BASE]
+    stop_loss_percentage = params[STOP_LOSS]
+    maker_fee = params[MAKER_FEE]
+    taker_fee = params[TAKER_FEE]
+    max_trades = params[MAX_TRADES]
+    limit_trades = params[LIMIT_TRADES] > 0
+    record_trades = params[LOG_LEVEL] >= 1
+    record_holds = params[LOG_LEVEL] >= 2
+
+    cash = state[CASH]
+    total_fees = state[TOTAL_FEES]
+    epsilon = state[EPSILON]
+    alpha = state[ALPHA]
+    gamma = state[GAMMA]
+    cooldown_period = state[COOLDOWN_PERIOD]
+    cooldown_counter = state[COOLDOWN_COUNTER]
+    total_amount = state[TOTAL_AMOUNT]
+    total_cost = state[TOTAL_COST]
+    open_lots = int(state[OPEN_LOTS])
+    lots = int(state[LOT_COUNT])
+    events = int(state[EVENT_COUNT])
+    max_stop = -np.inf
+    for j in range(lots):
+        if lot_amount[j] > 0:
+            max_stop = max(max_stop, lot_stop[j])
+
+    n = len(prices)
+    i = start
+    while i < n:
+        # Drop closed lots when the buffer is full or mostly closed, then
+        # make sure a buy and the worst-case number of events fit
+        if lots == len(lot_amount) or (lots > 32 and open_lots < lots // 2):
+            kept = 0
+            max_stop = -np.inf
+            for j in range(lots):
+                if lot_amount[j] > 0:
+                    lot_price[kept] = lot_price[j]
+                    lot_amount[kept] = lot_amount[j]
+                    lot_stop[kept] = lot_stop[j]
+                    max_stop = max(max_stop, lot_stop[j])
+                    kept += 1
+            lots = kept
+            if lots == len(lot_amount):
+                break
+        if events + 2 * open_lots + 3 > len(event_kind):
+            break
+
+        price = prices[i]
+        s = states[i]
+        next_s = states[i + 1]
+
+        # Choose action (epsilon-greedy). The argmax loops here and below
+        # break ties like np.argmax: first maximum, or the first NaN if any
+        if uniform[i] < epsilon:
+            action = random_actions[i]
+        else:
+            action = 0
+            for a in range(num_actions):
+                value = q[s * num_actions + a]
+                if value != value:
+                    action = a
+                    break
+                if value > q[s * num_actions + action]:
+                    action = a
+
+        # Perform action
+        fees = 0.0
+        if cooldown_counter > 0:
+            cooldown_counter -= 1
+            reward = 0.0
+        else:
+            fee_percentage = maker_fee if action == 0 else taker_fee
+            cap = max_order / price
+
+            if action == 0:  # Buy
+                if cash > 0 and (not limit_trades or open_lots < max_trades):
+                    amount_to_invest = min(cash, max_order)
+                    amount = amount_to_invest / price
+                    cost = amount * price * (1 + fee_percentage)
+                    cash -= cost
+                    fees += amount * price * fee_percentage
+                    stop_loss_price = price * (1 - stop_loss_percentage)
+                    lot_price[lots] = price
+                    lot_amount[lots] = amount
+                    lot_stop[lots] = stop_loss_price
+                    max_stop = max(max_stop, stop_loss_price)
+                    lots += 1
+                    open_lots += 1
+                    total_amount += amount
+                    total_cost += price * amount
+                    state[TYPE_COUNTS + EVENT_BUY] += 1
+                    if record_trades:
+                        event_kind[events] = EVENT_BUY
+                        event_step[events] = i
+                        event_amount[events] = amount
+                        event_price[events] = price
+                        event_total[events] = cost
+                        events += 1
+            elif action == 1:  # Sell
+                if open_lots > 0:
+                    sold = 0.0
+                    for j in range(lots):
+                        if lot_amount[j] > 0:
+                            amount_to_sell = min(lot_amount[j], cap)
+                            sold += amount_to_sell
+                            remaining = lot_amount[j] - amount_to_sell
+                            total_amount -= amount_to_sell
+                            total_cost -= lot_price[j] * amount_to_sell
+                            if remaining <= 0:
+                                remaining = 0.0
+                                open_lots -= 1
+                            lot_amount[j] = remaining
+                            revenue = amount_to_sell * price * (1 - fee_percentage)
+                            cash += revenue
+                            fees += amount_to_sell * price * fee_percentage
+                            state[TYPE_COUNTS + EVENT_SELL] += 1
+                            if record_trades:
+                                event_kind[events] = EVENT_SELL
+                                event_step[events] = i
+                                event_amount[events] = amount_to_sell
+                                event_price[events] = price
+                                event_total[events] = revenue
+                                events += 1
+                            if sold >= cap:
+                                break
+                    if open_lots == 0:
+                        lots = 0
+                        total_amount = 0.0
+                        total_cost = 0.0
+            else:  # Hold
+                state[TYPE_COUNTS + EVENT_HOLD] += 1
+                if record_holds:
+                    event_kind[events] = EVENT_HOLD
+                    event_step[events] = i
+                    event_amount[events] = 0.0
+                    event_price[events] = price
+                    event_total[events] = 0.0
+                    events += 1
+
+            # Apply stop-loss for each position, skipped when the price is
+            # above every open stop-loss
+            triggered = False
+            for j in range(lots if price <= max_stop else 0):
+                if price <= lot_stop[j] and lot_amount[j] > 0:
+                    triggered = True
+                    amount_to_sell = min(lot_amount[j], cap)
+                    remaining = lot_amount[j] - amount_to_sell
+                    total_amount -= amount_to_sell
+                    total_cost -= lot_price[j] * amount_to_sell
+                    if remaining <= 0:
+                        remaining = 0.0
+                        open_lots -= 1
+                    lot_amount[j] = remaining
+                    revenue = amount_to_sell * price * (1 - fee_percentage)
+                    cash += revenue
+                    fees += amount_to_sell * price * fee_percentage
+                    state[TYPE_COUNTS + EVENT_STOP_LOSS] += 1
+                    if record_trades:
+                        event_kind[events] = EVENT_STOP_LOSS
+                        event_step[events] = i
+                        event_amount[events] = amount_to_sell
+                        event_price[events] = price
+                        event_total[events] = revenue
+                        events += 1
+            if triggered and open_lots == 0:
+                lots = 0
+                total_amount = 0.0
+                total_cost = 0.0
+
+            reward = cash + total_amount * price - initial_cash
+
+        # Update Q-table
+        best_next = 0
+        for a in range(num_actions):
+            value = q[next_s * num_actions + a]
+            if value != value:
+                best_next = a
+                break
+            if value > q[next_s * num_actions + best_next]:
+                best_next = a
+        td_target = reward + gamma * q[next_s * num_actions + best_next]
+        td_error = td_target - q[s * num_actions + action]
+        q[s * num_actions + action] += alpha * td_error
+        step_action[i] = action
+        step_reward[i] = reward
+
+        total_fees += fees
+
+        if cash + total_amount * price <= 0:
+            for j in range(len(q)):
+                q[j] = 0.0
+            cash = initial_cash
+            total_fees = 0.0
+            total_amount = 0.0
+            total_cost = 0.0
+            open_lots = 0
+            lots = 0
+            cooldown_counter = cooldown_base
+            event_kind[events] = EVENT_RESET
+            event_step[events] = i
+            event_amount[events] = 0.0
+            event_price[events] = price
+            event_total[events] = 0.0
+            events += 1
+
+        # Adjust parameters
+        if reward > 0:
+            epsilon *= 0.99
+            alpha *= 1.01
+            gamma *= 1.01
+            cooldown_period = max(1.0, cooldown_period - 1)
+        else:
+            epsilon *= 1.01
+            alpha *= 0.99
+            gamma *= 0.99
+            cooldown_period += 1
+
+        i += 1
+
+    state[CASH] = cash
+    state[TOTAL_FEES] = total_fees
+    state[EPSILON] = epsilon
+    state[ALPHA] = alpha
+    state[GAMMA] = gamma
+    state[COOLDOWN_PERIOD] = cooldown_period
+    state[COOLDOWN_COUNTER] = cooldown_counter
+    state[TOTAL_AMOUNT] = total_amount
+    state[TOTAL_COST] = total_cost
+    state[OPEN_LOTS] = open_lots
+    state[LOT_COUNT] = lots
+    state[EVENT_COUNT] = events
+    return i
+
+
+compiled_kernel = njit(cache=True)(_backtest_kernel) if njit is not None else None
+
+
+def run_kernel(prices, states, q_table, draws, params, state, actions=None, rewards=None, initial_capacity=1024):
+    """
+    Run the backtest over `prices`. `states` holds the Q-table row for every
+    step plus one (the next state of the last step); `params` and `state`
+    are float64 vectors in the layouts above. The Q-table and the state
+    vector are updated in place, as are `actions` (int64) and `rewards`
+    (float64) with the action taken and reward received at each step when
+    given. Returns the recorded events as a dict of arrays keyed by
+    EVENT_COLUMNS.
+    """
+    if not q_table.flags.c_contiguous:
+        raise ValueError("q_table must be C-contiguous to be updated in place")
+    n = len(prices)
+    num_actions = q_table.shape[1]
+    uniform, random_actions = draws.take(n)
+    flat_q = q_table.reshape(-1)  # A view, so updates land in q_table
+    if actions is None:
+        actions = np.empty(n, dtype=np.int64)
+    if rewards is None:
+        rewards = np.empty(n)
+    lots = [np.empty(initial_capacity) for _ in range(3)]
+    events = [np.empty(initial_capacity, dtype=dtype) for dtype in EVENT_DTYPES]
+
+    if compiled_kernel is not None:
+        kernel = compiled_kernel
+        args = [np.ascontiguousarray(prices, dtype=np.float64), np.ascontiguousarray(states, dtype=np.int64),
+                uniform, random_actions, flat_q, num_actions, params, state, actions, rewards]
+    else:
+        # Plain Python indexes lists of floats much faster than NumPy arrays
+        kernel = _backtest_kernel
+        args = [prices.tolist(), states.tolist(), uniform.tolist(), random_actions.tolist(),
+                flat_q.tolist(), num_actions, params.tolist(), state.tolist(), actions.tolist(), rewards.tolist()]
+        lots = [values.tolist() for values in lots]
+        events = [values.tolist() for values in events]
+    kernel_state = args[7]
+
+    i = 0
+    while True:
+        i = kernel(i, *args, *lots, *events)
+        if i >= n:
+            break
+        # Out of room: double the lot buffers if they are full, and the event
+        # buffers if the next step might not fit
+        open_lots = int(kernel_state[OPEN_LOTS])
+        if int(kernel_state[LOT_COUNT]) == len(lots[0]):
+            lots = [_grown(values) for values in lots]
+        if int(kernel_state[EVENT_COUNT]) + 2 * open_lots + 3 > len(events[0]):
+            events = [_grown(values, 2 * open_lots + 3) for values in events]
+
+    if compiled_kernel is None:
+        flat_q[:] = args[4]
+        state[:] = kernel_state
+        actions[:] = args[8]
+        rewards[:] = args[9]
+        events = [np.array(values, dtype=dtype) for values, dtype in zip(events, EVENT_DTYPES)]
+
+    count = int(state[EVENT_COUNT])
+    return {name: values[:count] for name, values in zip(EVENT_COLUMNS, events)}
+
+
+def _grown(values, minimum=0):
+    extra = max(len(values), minimum)
+    if isinstance(values, list):
+        return values + [0] * extra
+    grown = np.empty(len(values) + extra, dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
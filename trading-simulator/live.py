@@ -0,0 +1,289 @@
+"""
+Live, incremental mode for multi_dca.py.
+
+Instead of replaying a whole CSV, the simulation consumes price bars as they
+arrive, either from stdin or by following a growing CSV file, and keeps the
+rolling Bollinger window, the portfolio, the exploration draws and the
+Q-table in memory between bars. Each bar costs the same as one step of
+multi_dca.run_backtest, however long the history already is.
+
+The whole session is checkpointed every few bars or seconds with an atomic
+replace, so a restart loads one small pickle and carries on from the last
+bar it saw. Fed the same bars with the same --seed, a live session ends in
+the same state as the equivalent multi_dca.py backtest.
+
+Examples:
+    python live.py --follow BTC-USD.csv
+    tail -n +2 -f prices.csv | python live.py --checkpoint live.pkl
+"""
+
+import argparse
+import csv
+import io
+import os
+import pickle
+import signal
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import multi_dca
+from indicators import WARMUP_STATE, BandStateEncoder, RollingBands
+from transactions import TYPE_NAMES
+
+CHECKPOINT_VERSION = 1
+DEFAULT_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the DCA Q-learning simulation incrementally on new price bars.")
+    parser.add_argument('--follow', type=str, default=None, help='CSV file to tail for new rows (default: read rows from stdin)')
+    parser.add_argument('--checkpoint', type=str, default='live_checkpoint.pkl', help='Session checkpoint to resume from and write to')
+    parser.add_argument('--checkpoint-every', type=int, default=500, help='Write a checkpoint after this many new bars')
+    parser.add_argument('--checkpoint-seconds', type=float, default=30.0, help='Write a checkpoint at least this often while bars arrive')
+    parser.add_argument('--transactions', type=str, default='live_transactions.csv', help='CSV file the transactions are appended to')
+    parser.add_argument('--poll', type=float, default=1.0, help='Seconds between checks for new rows when following a file')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for a new session')
+    parser.add_argument('--state', choices=['step', 'bands'], default='step', help='Agent state for a new session, as in multi_dca.py')
+    parser.add_argument('--limit_trades', action='store_true', help='Limit the maximum number of trades in a new session')
+    parser.add_argument('--log-level', dest='log_level', choices=multi_dca.transactions.LOG_LEVELS, default='trades', help='Transactions to keep in the transactions file')
+    args = parser.parse_args()
+
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    return args
+
+
+def new_session(seed, limit_trades, level, state_mode):
+    multi_dca.log_level = level
+    multi_dca.state_mode = state_mode
+    rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+    max_trades = int(rng.integers(1, 6)) if limit_trades else float('inf')
+    multi_dca.limit_trades = limit_trades
+    first_state = WARMUP_STATE if state_mode == 'bands' else 0
+    return {
+        'version': CHECKPOINT_VERSION,
+        'limit_trades': limit_trades,
+        'state_mode': state_mode,
+        'simulation': multi_dca.new_simulation(max_trades, multi_dca.load_q_table(), rng, first_state),
+        'bands': RollingBands(multi_dca.window, multi_dca.num_std_dev),
+        'encoder': BandStateEncoder(multi_dca.num_std_dev),
+        'last_date': None,
+        'last_price': None,
+        'columns': DEFAULT_COLUMNS,  # Column order from the last CSV header seen
+        'input_offset': 0,  # Bytes of the followed file already consumed
+        'transactions_offset': 0,  # Bytes of the transactions file covered by this checkpoint
+    }
+
+
+def load_session(path):
+    try:
+        with open(path, 'rb') as f:
+            session = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    if session.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} was written by an incompatible version; remove it to start a new session")
+    multi_dca.limit_trades = session['limit_trades']
+    multi_dca.state_mode = session['state_mode']
+    multi_dca.log_level = session['simulation']['transaction_log'].level
+    return session
+
+
+def write_atomic(path, dump):
+    # Write next to the target and rename over it, so a crash leaves either
+    # the old file or the new one, never a partial one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def flush_transactions(session, path, dates):
+    log = session['simulation']['transaction_log']
+    columns = log.columns()
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['date', 'step', 'type', 'amount', 'price', 'total'])
+        for step, kind, amount, price, total in zip(columns['step'].tolist(), columns['type'].tolist(), columns['amount'].tolist(), columns['price'].tolist(), columns['total'].tolist()):
+            writer.writerow([dates.get(step, ''), step, TYPE_NAMES[kind], amount, price, total])
+        f.flush()
+        os.fsync(f.fileno())
+        session['transactions_offset'] = f.tell()
+    # Flushed events no longer need to stay in memory
+    log.clear()
+    dates.clear()
+
+
+def save_checkpoint(session, checkpoint_path, transactions_path, dates):
+    flush_transactions(session, transactions_path, dates)
+    write_atomic(checkpoint_path, lambda f: pickle.dump(session, f, protocol=pickle.HIGHEST_PROTOCOL))
+    write_atomic(multi_dca.q_table_file, lambda f: pickle.dump(session['simulation']['q_table'], f))
+
+
+def truncate_transactions(path, offset):
+    # Rows written after the checkpoint will be produced again on resume
+    if os.path.exists(path) and os.path.getsize(path) > offset:
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+
+
+def follow_lines(path, offset, poll):
+    """
+    Yield (line, end_offset) for every complete line of path from offset on,
+    waiting for new ones as the file grows. A file that shrinks is treated
+    as rotated and read again from the start.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        partial = b''
+        while True:
+            chunk = f.readline()
+            if chunk:
+                partial += chunk
+                if partial.endswith(b'\n'):
+                    yield partial.decode(), f.tell()
+                    partial = b''
+                continue
+            if os.path.getsize(path) < f.tell():
+                f.seek(0)
+                partial = b''
+                continue
+            time.sleep(poll)
+
+
+def stdin_lines():
+    for line in io.TextIOWrapper(sys.stdin.buffer, newline=''):
+        yield line, None
+
+
+def parse_bars(lines, session):
+    """
+    Turn CSV lines into (date, price, end_offset) tuples. A header row sets
+    the column order, which is remembered across restarts; without one the
+    Yahoo Finance layout is assumed. Uses 'Adj Close' and falls back to
+    'Close'.
+    """
+    for line, offset in lines:
+        row = next(csv.reader([line]), None)
+        if not row:
+            continue
+        if row[0] == 'Date':
+            session['columns'] = row
+            continue
+        values = dict(zip(session['columns'], row))
+        price = values.get('Adj Close') or values.get('Close')
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            print(f"Skipping malformed row: {line.strip()}")
+            continue
+        yield np.datetime64(values['Date']), price, offset
+
+
+def run(session, bars, args):
+    sim = session['simulation']
+    bands = session['bands']
+    encoder = session['encoder']
+    dates = {}  # Step -> date for the events not yet flushed
+    last_checkpoint = time.monotonic()
+    pending = 0
+
+    # Ctrl+C while waiting for input stops at once; during a step it waits
+    # for the step to finish, so the final checkpoint is never half-updated
+    interrupt = {'in_step': False, 'stop': False}
+
+    def on_sigint(signum, frame):
+        if interrupt['in_step']:
+            interrupt['stop'] = True
+        else:
+            raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGINT, on_sigint)
+    try:
+        for date, price, offset in bars:
+            if offset is not None:
+                session['input_offset'] = offset
+            if session['last_date'] is not None and date <= session['last_date']:
+                continue  # Already processed before the last checkpoint
+
+            interrupt['in_step'] = True
+            step = sim['current_step']
+            ma, upper, lower = bands.update(price)
+            code = encoder.update(price, ma, upper, lower)
+            next_state = code if session['state_mode'] == 'bands' else (step + 1) % multi_dca.window
+            log = sim['transaction_log']
+            recorded = len(log)
+            multi_dca.run_step(sim, price, date, next_state)
+            session['last_date'] = date
+            session['last_price'] = price
+
+            if len(log) > recorded:
+                dates[step] = str(date)
+                for kind, amount, total in zip(log.buffers['type'][recorded:len(log)].tolist(), log.buffers['amount'][recorded:len(log)].tolist(), log.buffers['total'][recorded:len(log)].tolist()):
+                    print(f"{date}: {TYPE_NAMES[kind]} {amount:.6f} at ${price:.2f} (${total:.2f})")
+
+            pending += 1
+            if pending >= args.checkpoint_every or time.monotonic() - last_checkpoint >= args.checkpoint_seconds:
+                save_checkpoint(session, args.checkpoint, args.transactions, dates)
+                last_checkpoint = time.monotonic()
+                pending = 0
+
+            interrupt['in_step'] = False
+            if interrupt['stop']:
+                raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        print("Interrupted, writing checkpoint.")
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if pending:
+            save_checkpoint(session, args.checkpoint, args.transactions, dates)
+
+
+def main():
+    args = parse_args()
+
+    start = time.perf_counter()
+    session = load_session(args.checkpoint)
+    if session is None:
+        session = new_session(args.seed, args.limit_trades, args.log_level, args.state)
+        truncate_transactions(args.transactions, 0)
+        print(f"Starting a new session, checkpointing to {args.checkpoint}")
+    else:
+        truncate_transactions(args.transactions, session['transactions_offset'])
+        print(f"Resumed at step {session['simulation']['current_step']} ({session['last_date']}) "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.follow:
+        offset = session['input_offset']
+        if offset > os.path.getsize(args.follow):
+            offset = 0  # The file was replaced; dates still skip the old bars
+        lines = follow_lines(args.follow, offset, args.poll)
+    else:
+        lines = stdin_lines()
+    run(session, parse_bars(lines, session), args)
+
+    sim = session['simulation']
+    portfolio = sim['portfolio']
+    print(f"Steps: {sim['current_step']}")
+    if session['last_price'] is not None:
+        print(f"Portfolio Value: ${multi_dca.get_total_portfolio_value(session['last_price'], portfolio):.2f}")
+    print(f"Cash: ${portfolio['cash']:.2f}")
+    print(f"Shares Held: {multi_dca.get_number_of_shares(portfolio):.4f}")
+    print(f"Average Cost Per Share: ${multi_dca.get_average_cost_per_share(portfolio):.2f}")
+    print(f"Total Fees: ${portfolio['total_fees']:.2f}")
+    print(f"Transaction Counts: {sim['transaction_log'].summary()}")
+
+
+if __name__ == "__main__":
+    main()
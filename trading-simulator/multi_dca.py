@@ -24,43 +24,20 @@ Author: Jose Diaz Ayala - Neuralbytes
 
 
 import numpy as np
-import pandas as pd
 import json
 import os
 import pickle
 import matplotlib.pyplot as plt
 import argparse
 import sys
-import random
-
-# Step 1: Set up the argument parser
-parser = argparse.ArgumentParser(description="Run stock trading simulations based on user-defined parameters.")
-parser.add_argument('--num', type=int, default=5, help='Number of simulations to run')
-parser.add_argument('--file', type=str, required=True, help='Path to the CSV file containing stock data')
-parser.add_argument('--limit_trades', type=bool, default=False, help='Limit the maximum number of trades per simulation')
-
-# Step 2: Parse arguments
-args = parser.parse_args()
-
-# Validate and handle the arguments
-try:
-    # Check if the number of simulations is a positive integer
-    if args.num <= 0:
-        raise ValueError("Number of simulations must be a positive integer.")
-
-    # Attempt to open the specified file to ensure it exists
-    with open(args.file, 'r') as file:
-        pass  # If the file opens successfully, we do nothing else here
-
-except FileNotFoundError:
-    print(f"Error: The file '{args.file}' does not exist. Please check the file path and try again.")
-    sys.exit(1)  # Exit the script with an error code
-except ValueError as e:
-    print(f"Error: {e}")
-    sys.exit(1)  # Exit the script with an error code
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-    sys.exit(1)  # Exit the script with an error code
+from multiprocessing import Pool
+import indicators
+from indicators import add_bollinger_bands
+from positions import PositionBook
+from price_store import load_prices
+import kernel
+import transactions
+from transactions import TransactionLog, open_transaction_writer
 
 # Parameters
 window = 20
@@ -78,36 +55,106 @@ epsilon_base = 0.2  # Base exploration rate
 alpha_base = 0.1  # Base learning rate
 gamma_base = 0.9  # Base discount factor
 
-# Step 3: Assign arguments to variables
-num_simulations = args.num  # Number of simulations to run
-limit_trades = args.limit_trades  # Limit the maximum number of trades per simulation
+# Run-time settings, filled in by main() or by each worker's initializer
+limit_trades = False  # Limit the maximum number of trades per simulation
+backtest_engine = 'pandas'  # 'pandas' walks DataFrame rows, 'kernel' runs kernel.py over arrays
+log_level = 'all'  # Which events the transaction log keeps, see transactions.LOG_LEVELS
+state_mode = 'step'  # 'step' uses the step within the window as state, 'bands' the Bollinger Band features
+replay_epochs = 0  # Batched replay passes over each simulation's transitions
+replay_batch_size = 256
+historical_data = None  # Price history with precomputed Bollinger Bands
+historical_states = None  # Q-table row for every step plus one, see build_states
+data_file = None  # CSV the price history was loaded from
 
 # Model
 output_file = 'simulation_results.json'
+transactions_file = 'transactions.npz'
 q_table_file = 'q_table.pkl'
 
-# Load historical stock data from CSV file
-csv_file_path = args.file  # Ensure the CSV file is in the current working directory
-historical_data = pd.read_csv(csv_file_path, parse_dates=['Date'])
-historical_data.set_index('Date', inplace=True)
-
-# Load or initialize Q-table
-if os.path.exists(q_table_file):
-    with open(q_table_file, 'rb') as f:
-        q_table = pickle.load(f)
-else:
-    q_table = np.zeros((window, num_actions))  # Initialize Q-table
-
-# Calculate Moving Average and Bollinger Bands
-def calculate_moving_average(data, window):
-    return data.rolling(window=window).mean()
-
-def calculate_bollinger_bands(data, window, num_std_dev):
-    rolling_mean = calculate_moving_average(data, window)
-    rolling_std = data.rolling(window=window).std()
-    upper_band = rolling_mean + (rolling_std * num_std_dev)
-    lower_band = rolling_mean - (rolling_std * num_std_dev)
-    return rolling_mean, upper_band, lower_band
+def parse_args():
+    # Step 1: Set up the argument parser
+    parser = argparse.ArgumentParser(description="Run stock trading simulations based on user-defined parameters.")
+    parser.add_argument('--num', type=int, default=5, help='Number of simulations to run')
+    parser.add_argument('--file', type=str, required=True, help='Path to the CSV file containing stock data')
+    parser.add_argument('--limit_trades', type=bool, default=False, help='Limit the maximum number of trades per simulation')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes to run simulations in. With 1, each simulation keeps training the '
+                             'Q-table left by the previous one; with more, every simulation trains its own copy of the '
+                             'starting table and the copies are averaged, so results differ from a 1-worker run')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible simulations')
+    parser.add_argument('--engine', choices=['pandas', 'kernel'], default='pandas', help='Backtest engine; kernel gives the same results much faster')
+    parser.add_argument('--state', choices=['step', 'bands'], default='step', help='Agent state: the step within the window, or Bollinger Band position, width and momentum')
+    parser.add_argument('--replay-epochs', type=int, default=0, help='Extra batched Q-table passes over each simulation\'s transitions')
+    parser.add_argument('--replay-batch', type=int, default=replay_batch_size, help='Transitions per batched Q-table update during replay')
+    parser.add_argument('--log-level', choices=transactions.LOG_LEVELS, default='all', help="Transactions to keep: all, trades (holds are only counted) or none (everything is only counted)")
+    parser.add_argument('--transactions', type=str, default=transactions_file, help='Where to write the transaction log (.npz, or .parquet with pyarrow)')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the portfolio value chart')
+    parser.add_argument('--plot-file', type=str, default=None, help='Save the chart to this image file instead of opening a window')
+
+    # Step 2: Parse arguments
+    args = parser.parse_args()
+
+    # Validate and handle the arguments
+    try:
+        # Check if the number of simulations is a positive integer
+        if args.num <= 0:
+            raise ValueError("Number of simulations must be a positive integer.")
+        if args.workers <= 0:
+            raise ValueError("Number of workers must be a positive integer.")
+        if args.replay_epochs < 0 or args.replay_batch <= 0:
+            raise ValueError("Replay epochs must not be negative and the replay batch must be positive.")
+
+        # Attempt to open the specified file to ensure it exists
+        with open(args.file, 'r') as file:
+            pass  # If the file opens successfully, we do nothing else here
+
+    except FileNotFoundError:
+        print(f"Error: The file '{args.file}' does not exist. Please check the file path and try again.")
+        sys.exit(1)  # Exit the script with an error code
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)  # Exit the script with an error code
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        sys.exit(1)  # Exit the script with an error code
+
+    return args
+
+def load_historical_data(csv_file_path):
+    # Load historical stock data from the memory-mapped cache of the CSV file
+    data = load_prices(csv_file_path)
+
+    # Bollinger Bands only depend on past prices, so compute them once per dataset
+    add_bollinger_bands(data, window, num_std_dev)
+    return data
+
+def set_historical_data(data):
+    # Price history (with Bollinger Bands) the backtests in this process run on
+    global historical_data, historical_states
+    historical_data = data
+    historical_states = build_states(data)
+
+def get_num_states():
+    return indicators.NUM_BAND_STATES if state_mode == 'bands' else window
+
+def build_states(data):
+    # The state of step i only uses bars before it, so states[i + 1] (the
+    # next state of step i) is already known once bar i has been seen
+    if state_mode == 'step':
+        return np.arange(len(data) + 1) % window
+    codes = indicators.encode_band_states(data['Adj Close'], data['MA'], data['Upper Band'], data['Lower Band'], num_std_dev)
+    return np.concatenate(([indicators.WARMUP_STATE], codes))
+
+def load_q_table():
+    # Load or initialize Q-table
+    shape = (get_num_states(), num_actions)
+    if os.path.exists(q_table_file):
+        with open(q_table_file, 'rb') as f:
+            q_table = pickle.load(f)
+        if q_table.shape == shape:
+            return np.ascontiguousarray(q_table, dtype=np.float64)
+        print(f"Q-table in {q_table_file} has shape {q_table.shape}, expected {shape} for '{state_mode}' states. Starting from a new one.")
+    return np.zeros(shape)  # Initialize Q-table
 
 # Perform action and update portfolio
 def perform_action(action, price, portfolio, transaction_log, max_trades, cooldown_counter, epsilon, alpha, gamma):
@@ -128,36 +175,24 @@ def perform_action(action, price, portfolio, transaction_log, max_trades, cooldo
             portfolio['cash'] -= cost
             fees += amount * price * fee_percentage
             stop_loss_price = price * (1 - stop_loss_percentage)
-            portfolio['investments'].append((price, amount, stop_loss_price))
-            transaction_log.append({'type': 'buy', 'amount': amount, 'price': price, 'total_spent': cost, 'reason': 'buy_signal'})
+            portfolio['investments'].add(price, amount, stop_loss_price)
+            transaction_log.record(transactions.BUY, amount, price, cost)
     elif action == 1:  # Sell
         if len(portfolio['investments']) > 0:
-            sell_amount = 0
-            for i, (buy_price, invest_amount, stop_loss_price) in enumerate(portfolio['investments']):
-                if invest_amount > 0:
-                    amount_to_sell = min(invest_amount, max_single_order_amount / price)
-                    revenue = amount_to_sell * price * (1 - fee_percentage)
-                    portfolio['cash'] += revenue
-                    fees += amount_to_sell * price * fee_percentage
-                    portfolio['investments'][i] = (buy_price, invest_amount - amount_to_sell, stop_loss_price)
-                    sell_amount += amount_to_sell
-                    transaction_log.append({'type': 'sell', 'amount': amount_to_sell, 'price': price, 'total_gained': revenue, 'reason': 'sell_signal'})
-                    if sell_amount >= max_single_order_amount / price:
-                        break
+            for amount_to_sell in portfolio['investments'].sell(max_single_order_amount / price).tolist():
+                revenue = amount_to_sell * price * (1 - fee_percentage)
+                portfolio['cash'] += revenue
+                fees += amount_to_sell * price * fee_percentage
+                transaction_log.record(transactions.SELL, amount_to_sell, price, revenue)
     elif action == 2:  # Hold
-        transaction_log.append({'type': 'hold', 'reason': 'hold_signal'})
+        transaction_log.record(transactions.HOLD, price=price)
 
     # Apply stop-loss for each position
-    for i, (buy_price, invest_amount, stop_loss_price) in enumerate(portfolio['investments']):
-        if price <= stop_loss_price and invest_amount > 0:
-            amount_to_sell = min(invest_amount, max_single_order_amount / price)
-            revenue = amount_to_sell * price * (1 - fee_percentage)
-            portfolio['cash'] += revenue
-            fees += amount_to_sell * price * fee_percentage
-            portfolio['investments'][i] = (buy_price, invest_amount - amount_to_sell, stop_loss_price)
-            transaction_log.append({'type': 'sell (stop-loss)', 'amount': amount_to_sell, 'price': price, 'total_gained': revenue, 'reason': 'stop_loss'})
-            if invest_amount - amount_to_sell <= 0:
-                portfolio['investments'].pop(i)
+    for amount_to_sell in portfolio['investments'].trigger_stop_loss(price, max_single_order_amount / price).tolist():
+        revenue = amount_to_sell * price * (1 - fee_percentage)
+        portfolio['cash'] += revenue
+        fees += amount_to_sell * price * fee_percentage
+        transaction_log.record(transactions.STOP_LOSS, amount_to_sell, price, revenue)
 
     # Reward calculation
     reward = get_total_portfolio_value(price, portfolio) - initial_cash
@@ -165,20 +200,21 @@ def perform_action(action, price, portfolio, transaction_log, max_trades, cooldo
     return reward, fees, cooldown_counter
 
 def get_total_portfolio_value(price, portfolio):
-    investment_value = sum(amount * price for _, amount, _ in portfolio['investments'])
+    investment_value = portfolio['investments'].total_amount * price
     return portfolio['cash'] + investment_value
 
 def get_number_of_shares(portfolio):
-    return sum(amount for _, amount, _ in portfolio['investments'])
+    return portfolio['investments'].total_amount
 
 def get_average_cost_per_share(portfolio):
-    total_cost = sum(buy_price * amount for buy_price, amount, _ in portfolio['investments'])
+    total_cost = portfolio['investments'].total_cost
     total_amount = get_number_of_shares(portfolio)
     return total_cost / total_amount if total_amount > 0 else 0
 
-def choose_action(state, q_table, epsilon):
-    if np.random.rand() < epsilon:  # Exploration
-        return np.random.choice(num_actions)
+def choose_action(state, q_table, epsilon, draws):
+    explore, random_action = draws.next()
+    if explore < epsilon:  # Exploration
+        return random_action
     else:  # Exploitation
         return np.argmax(q_table[state])
 
@@ -188,10 +224,29 @@ def update_q_table(state, action, reward, next_state, q_table, alpha, gamma):
     td_error = td_target - q_table[state, action]
     q_table[state, action] += alpha * td_error
 
+def update_q_table_batch(states, actions, rewards, next_states, q_table, alpha, gamma):
+    # update_q_table for arrays of transitions at once; the TD errors are
+    # computed against the table before the batch, and repeated
+    # (state, action) pairs add up instead of overwriting each other
+    td_target = rewards + gamma * q_table[next_states].max(axis=1)
+    td_error = td_target - q_table[states, actions]
+    np.add.at(q_table, (states, actions), alpha * td_error)
+
+def replay_experience(q_table, states, actions, rewards, rng):
+    # Revisit a simulation's transitions in shuffled minibatches
+    n = len(actions)
+    next_states = states[1:n + 1]
+    states = states[:n]
+    for _ in range(replay_epochs):
+        order = rng.permutation(n)
+        for start in range(0, n, replay_batch_size):
+            batch = order[start:start + replay_batch_size]
+            update_q_table_batch(states[batch], actions[batch], rewards[batch], next_states[batch], q_table, alpha_base, gamma_base)
+
 def reset_portfolio():
     return {
         'cash': initial_cash,
-        'investments': [],
+        'investments': PositionBook(),
         'transactions': [],
         'total_fees': 0
     }
@@ -210,49 +265,65 @@ def adjust_parameters(reward, epsilon, alpha, gamma, cooldown_period):
 
     return epsilon, alpha, gamma, cooldown_period
 
+def new_simulation(max_trades, q_table, rng, state=0):
+    # Everything a backtest carries from one step to the next
+    return {
+        'current_step': 0,
+        'state': state,
+        'portfolio': reset_portfolio(),
+        'transaction_log': TransactionLog(log_level),
+        'draws': kernel.RandomBlocks(rng, num_actions),
+        'q_table': q_table,
+        'max_trades': max_trades,
+        # Initialize dynamic parameters
+        'epsilon': epsilon_base,
+        'alpha': alpha_base,
+        'gamma': gamma_base,
+        'cooldown_period': cooldown_period_base,
+        'cooldown_counter': 0,
+    }
+
+def run_step(sim, price, date, next_state):
+    # Advance the simulation by one price bar; returns the action and reward
+    current_step = sim['current_step']
+    q_table = sim['q_table']
+    epsilon, alpha, gamma = sim['epsilon'], sim['alpha'], sim['gamma']
+
+    sim['transaction_log'].step = current_step
+    state = sim['state']
+    action = choose_action(state, q_table, epsilon, sim['draws'])
+    reward, fees, sim['cooldown_counter'] = perform_action(action, price, sim['portfolio'], sim['transaction_log'], sim['max_trades'], sim['cooldown_counter'], epsilon, alpha, gamma)
+    update_q_table(state, action, reward, next_state, q_table, alpha, gamma)
+    sim['state'] = next_state
+
+    sim['portfolio']['total_fees'] += fees
+
+    if get_total_portfolio_value(price, sim['portfolio']) <= 0:
+        q_table[:] = 0  # Reset Q-table
+        sim['portfolio'] = reset_portfolio()
+        sim['cooldown_counter'] = cooldown_period_base
+        print(f"Total portfolio value depleted on {date}. Resetting portfolio and saving Q-table.")
+
+    sim['epsilon'], sim['alpha'], sim['gamma'], sim['cooldown_period'] = adjust_parameters(reward, epsilon, alpha, gamma, sim['cooldown_period'])
+
+    sim['current_step'] = current_step + 1
+    return action, reward
+
 # Run backtest
-def run_backtest(max_trades):
-    global current_step, q_table
-    portfolio = reset_portfolio()
-    transaction_log = []
-    historical_data['MA'] = np.nan
-    historical_data['Upper Band'] = np.nan
-    historical_data['Lower Band'] = np.nan
-
-    # Initialize dynamic parameters
-    epsilon = epsilon_base
-    alpha = alpha_base
-    gamma = gamma_base
-    cooldown_period = cooldown_period_base
-    cooldown_counter = 0
-
-    for date, row in historical_data.iterrows():
-        price = row['Adj Close']
-        stock_data = historical_data.loc[:date, 'Adj Close']
-        if len(stock_data) >= window:
-            rolling_mean, upper_band, lower_band = calculate_bollinger_bands(stock_data, window, num_std_dev)
-            historical_data.at[date, 'MA'] = rolling_mean.iloc[-1]
-            historical_data.at[date, 'Upper Band'] = upper_band.iloc[-1]
-            historical_data.at[date, 'Lower Band'] = lower_band.iloc[-1]
-
-        state = current_step % window
-        action = choose_action(state, q_table, epsilon)
-        reward, fees, cooldown_counter = perform_action(action, price, portfolio, transaction_log, max_trades, cooldown_counter, epsilon, alpha, gamma)
-        next_state = (current_step + 1) % window
-        update_q_table(state, action, reward, next_state, q_table, alpha, gamma)
-
-        portfolio['total_fees'] += fees
-
-        if get_total_portfolio_value(price, portfolio) <= 0:
-            q_table = np.zeros((window, num_actions))  # Reset Q-table
-            portfolio = reset_portfolio()
-            cooldown_counter = cooldown_period_base
-            print(f"Total portfolio value depleted on {date}. Resetting portfolio and saving Q-table.")
-
-        epsilon, alpha, gamma, cooldown_period = adjust_parameters(reward, epsilon, alpha, gamma, cooldown_period)
-
-        current_step += 1
+def run_backtest(max_trades, q_table, rng):
+    states = historical_states
+    sim = new_simulation(max_trades, q_table, rng, states[0])
+    actions = np.zeros(len(historical_data), dtype=np.int64)
+    rewards = np.zeros(len(historical_data))
+
+    for i, (date, row) in enumerate(historical_data.iterrows()):
+        actions[i], rewards[i] = run_step(sim, row['Adj Close'], date, states[i + 1])
 
+    if replay_epochs:
+        replay_experience(q_table, states, actions, rewards, rng)
+
+    portfolio = sim['portfolio']
+    transaction_log = sim['transaction_log']
     final_price = historical_data['Adj Close'].iloc[-1]
     final_portfolio_value = get_total_portfolio_value(final_price, portfolio)
     shares_held = get_number_of_shares(portfolio)
@@ -263,46 +334,189 @@ def run_backtest(max_trades):
         'shares_held': shares_held,
         'average_cost_per_share': average_cost_per_share,
         'transactions': transaction_log,
+        'transaction_counts': transaction_log.summary(),
         'total_fees': portfolio['total_fees']
     }
 
-    return result
-
-# Run multiple simulations and store results
-simulation_results = []
-portfolio_values = []
+    return result, q_table
+
+# Same backtest as run_backtest, run by kernel.py over plain arrays
+def run_backtest_kernel(max_trades, q_table, rng):
+    draws = kernel.RandomBlocks(rng, num_actions)
+    prices = historical_data['Adj Close'].to_numpy(dtype=np.float64)
+    states = historical_states
+
+    params = np.zeros(kernel.PARAM_SIZE)
+    params[kernel.INITIAL_CASH] = initial_cash
+    params[kernel.MAX_ORDER] = max_single_order_amount
+    params[kernel.COOLDOWN_BASE] = cooldown_period_base
+    params[kernel.STOP_LOSS] = stop_loss_percentage
+    params[kernel.MAKER_FEE] = maker_fee_percentage
+    params[kernel.TAKER_FEE] = taker_fee_percentage
+    params[kernel.MAX_TRADES] = max_trades
+    params[kernel.LIMIT_TRADES] = limit_trades
+    params[kernel.LOG_LEVEL] = len(transactions.LOG_LEVELS) - 1 - transactions.LOG_LEVELS.index(log_level)
+
+    state = np.zeros(kernel.STATE_SIZE)
+    state[kernel.CASH] = initial_cash
+    state[kernel.EPSILON] = epsilon_base
+    state[kernel.ALPHA] = alpha_base
+    state[kernel.GAMMA] = gamma_base
+    state[kernel.COOLDOWN_PERIOD] = cooldown_period_base
+
+    actions = np.zeros(len(prices), dtype=np.int64)
+    rewards = np.zeros(len(prices))
+    events = kernel.run_kernel(prices, states, q_table, draws, params, state, actions, rewards)
+    if replay_epochs:
+        replay_experience(q_table, states, actions, rewards, rng)
+
+    # Resets are not transactions, only reported
+    resets = events['kind'] == kernel.EVENT_RESET
+    for step in events['step'][resets].tolist():
+        print(f"Total portfolio value depleted on {historical_data.index[step]}. Resetting portfolio and saving Q-table.")
+    kept = ~resets
+    transaction_log = TransactionLog(log_level, capacity=max(1, int(kept.sum())))
+    transaction_log.extend(events['step'][kept], events['kind'][kept], events['amount'][kept], events['price'][kept], events['total'][kept])
+    transaction_log.counts[:] = state[kernel.TYPE_COUNTS:kernel.TYPE_COUNTS + len(transactions.TYPE_NAMES)]
+
+    final_price = prices[-1]
+    shares_held = state[kernel.TOTAL_AMOUNT]
+    result = {
+        'final_portfolio_value': float(state[kernel.CASH] + shares_held * final_price),
+        'shares_held': float(shares_held),
+        'average_cost_per_share': float(state[kernel.TOTAL_COST] / shares_held) if shares_held > 0 else 0,
+        'transactions': transaction_log,
+        'transaction_counts': transaction_log.summary(),
+        'total_fees': float(state[kernel.TOTAL_FEES])
+    }
 
-for i in range(num_simulations):
-    current_step = 0
-    max_trades = random.randint(1, 5) if limit_trades else float('inf')  # Randomly select the maximum number of trades if limit_trades is True
-    print(f"Running simulation {i+1}/{num_simulations} with a max of {max_trades} trades" if limit_trades else f"Running simulation {i+1}/{num_simulations} with no trade limit")
-    result = run_backtest(max_trades)
-    simulation_results.append(result)
-    portfolio_values.append(result['final_portfolio_value'])
+    return result, q_table
+
+def run_simulation(index, num_simulations, q_table, seed):
+    # Every simulation draws from its own generator, so runs are independent
+    # of each other and of the order in which workers pick them up
+    rng = np.random.default_rng(seed)
+    max_trades = int(rng.integers(1, 6)) if limit_trades else float('inf')  # Randomly select the maximum number of trades if limit_trades is True
+    print(f"Running simulation {index+1}/{num_simulations} with a max of {max_trades} trades" if limit_trades else f"Running simulation {index+1}/{num_simulations} with no trade limit")
+    if backtest_engine == 'kernel':
+        return run_backtest_kernel(max_trades, q_table, rng)
+    return run_backtest(max_trades, q_table, rng)
+
+def init_worker(csv_file_path, limit, engine, level, mode, epochs, batch_size):
+    # Each worker maps the cached price history read-only, so the pages are
+    # shared between processes instead of copied into each one
+    global limit_trades, backtest_engine, log_level, state_mode, replay_epochs, replay_batch_size
+    limit_trades = limit
+    backtest_engine = engine
+    log_level = level
+    state_mode = mode
+    replay_epochs = epochs
+    replay_batch_size = batch_size
+    set_historical_data(load_historical_data(csv_file_path))
+
+def run_simulation_task(task):
+    index, num_simulations, q_table, seed = task
+    # q_table arrives pickled, so each task trains its own copy
+    return run_simulation(index, num_simulations, q_table, seed)
+
+def store_transactions(index, result, writer):
+    # Stream the simulation's transactions to disk and keep only the summary
+    writer.write(index + 1, result.pop('transactions'))
+    return result
 
-    # Save Q-table after each simulation
+# Run multiple simulations and store results. The training differs with the
+# worker count: one worker chains the Q-table through the simulations, more
+# train independent copies and average them, so the two give different results
+# for the same seeds (each is reproducible for a given --seed and --workers)
+def run_simulations(num_simulations, q_table, seeds, workers, writer):
+    if workers == 1:
+        # Simulations run back to back and keep training the same Q-table
+        simulation_results = []
+        for i in range(num_simulations):
+            result, q_table = run_simulation(i, num_simulations, q_table, seeds[i])
+            simulation_results.append(store_transactions(i, result, writer))
+
+            # Save Q-table after each simulation
+            with open(q_table_file, 'wb') as f:
+                pickle.dump(q_table, f)
+        return simulation_results
+
+    # Workers start from the same Q-table and train independent copies of it
+    tasks = [(i, num_simulations, q_table, seeds[i]) for i in range(num_simulations)]
+    simulation_results = []
+    q_table_sum = np.zeros_like(q_table, dtype=np.float64)
+    with Pool(workers, initializer=init_worker, initargs=(data_file, limit_trades, backtest_engine, log_level, state_mode, replay_epochs, replay_batch_size)) as pool:
+        # Results arrive in simulation order and are written as they come in
+        for i, (result, table) in enumerate(pool.imap(run_simulation_task, tasks, chunksize=max(1, num_simulations // (workers * 4)))):
+            simulation_results.append(store_transactions(i, result, writer))
+            q_table_sum += table
+
+    # Merge the independently trained tables by averaging them
+    q_table = q_table_sum / num_simulations
     with open(q_table_file, 'wb') as f:
         pickle.dump(q_table, f)
-
-# Save results to JSON file
-with open(output_file, 'w') as f:
-    json.dump(simulation_results, f, indent=4)
-
-# Display summary of each simulation
-for i, result in enumerate(simulation_results):
-    print(f"Simulation {i+1} Summary:")
-    print(f"Final Portfolio Value: ${result['final_portfolio_value']:.2f}")
-    print(f"Shares Held: {result['shares_held']:.4f}")
-    print(f"Average Cost Per Share: ${result['average_cost_per_share']:.2f}")
-    print(f"Total Fees: ${result['total_fees']:.2f}")
-    print("\n")
-
-# Plotting the final portfolio values of each simulation
-plt.figure(figsize=(10, 6))
-plt.plot(range(1, num_simulations + 1), portfolio_values, marker='o', linestyle='-', color='b')
-plt.title('Final Portfolio Values Over Multiple Simulations')
-plt.xlabel('Simulation Number')
-plt.ylabel('Final Portfolio Value')
-plt.grid(True)
-plt.show()
-
+    return simulation_results
+
+def plot_portfolio_values(portfolio_values, plot_file=None):
+    # Plotting the final portfolio values of each simulation
+    if plot_file:
+        plt.switch_backend('Agg')  # No display needed to write an image
+    num_simulations = len(portfolio_values)
+    plt.figure(figsize=(10, 6))
+    plt.plot(range(1, num_simulations + 1), portfolio_values, marker='o', linestyle='-', color='b')
+    plt.title('Final Portfolio Values Over Multiple Simulations')
+    plt.xlabel('Simulation Number')
+    plt.ylabel('Final Portfolio Value')
+    plt.grid(True)
+    if plot_file:
+        plt.savefig(plot_file)
+        print(f"Chart saved to {plot_file}")
+    else:
+        plt.show()
+
+def main():
+    global data_file, limit_trades, backtest_engine, log_level, state_mode, replay_epochs, replay_batch_size
+    args = parse_args()
+
+    # Step 3: Assign arguments to variables
+    num_simulations = args.num  # Number of simulations to run
+    limit_trades = args.limit_trades  # Limit the maximum number of trades per simulation
+    backtest_engine = args.engine
+    log_level = args.log_level
+    state_mode = args.state
+    replay_epochs = args.replay_epochs
+    replay_batch_size = args.replay_batch
+    workers = min(args.workers, num_simulations)
+
+    data_file = args.file
+    set_historical_data(load_historical_data(data_file))
+    q_table = load_q_table()
+
+    # One independent seed per simulation, derived from --seed when given
+    seeds = np.random.SeedSequence(args.seed).spawn(num_simulations)
+
+    writer = open_transaction_writer(args.transactions)
+    try:
+        simulation_results = run_simulations(num_simulations, q_table, seeds, workers, writer)
+    finally:
+        writer.close()
+    portfolio_values = [result['final_portfolio_value'] for result in simulation_results]
+
+    # Save results to JSON file; the transactions themselves are in args.transactions
+    with open(output_file, 'w') as f:
+        json.dump(simulation_results, f, indent=4)
+
+    # Display summary of each simulation
+    for i, result in enumerate(simulation_results):
+        print(f"Simulation {i+1} Summary:")
+        print(f"Final Portfolio Value: ${result['final_portfolio_value']:.2f}")
+        print(f"Shares Held: {result['shares_held']:.4f}")
+        print(f"Average Cost Per Share: ${result['average_cost_per_share']:.2f}")
+        print(f"Total Fees: ${result['total_fees']:.2f}")
+        print("\n")
+
+    if not args.no_plot:
+        plot_portfolio_values(portfolio_values, args.plot_file)
+
+if __name__ == "__main__":
+    main()
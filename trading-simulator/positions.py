@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class PositionBook:
+    """
+    Open DCA lots stored in parallel NumPy arrays (buy price, amount,
+    stop-loss price) in the order they were bought.
+
+    Totals are kept as running sums so the portfolio value, share count and
+    average cost are O(1). Closed lots stay in place with a zero amount and
+    are compacted away once they make up more than half of the book.
+    """
+
+    def __init__(self, capacity=64):
+        self.buy_price = np.empty(capacity)
+        self.amount = np.empty(capacity)
+        self.stop_loss_price = np.empty(capacity)
+        self.size = 0  # Lots written to the arrays, open or closed
+        self.open_lots = 0
+        self.total_amount = 0.0
+        self.total_cost = 0.0
+        self.max_stop_loss = -np.inf  # Upper bound on the open stop-loss prices
+
+    def __len__(self):
+        return self.open_lots
+
+    def add(self, buy_price, amount, stop_loss_price):
+        if self.size == len(self.amount):
+            self.compact()
+            if self.size == len(self.amount):
+                self._grow()
+        i = self.size
+        self.buy_price[i] = buy_price
+        self.amount[i] = amount
+        self.stop_loss_price[i] = stop_loss_price
+        self.size += 1
+        self.open_lots += 1
+        self.total_amount += amount
+        self.total_cost += buy_price * amount
+        self.max_stop_loss = max(self.max_stop_loss, stop_loss_price)
+
+    def sell(self, max_amount):
+        """
+        Sell up to max_amount from each open lot, oldest first, until the
+        amount sold reaches max_amount. Returns the amount sold per lot.
+        """
+        lots = np.flatnonzero(self.amount[:self.size] > 0)
+        amounts = np.minimum(self.amount[lots], max_amount)
+        reached = np.flatnonzero(np.cumsum(amounts) >= max_amount)
+        if reached.size:
+            lots = lots[:reached[0] + 1]
+            amounts = amounts[:reached[0] + 1]
+        self._reduce(lots, amounts)
+        return amounts
+
+    def trigger_stop_loss(self, price, max_amount):
+        """
+        Sell up to max_amount from every open lot whose stop-loss price has
+        been reached. Returns the amount sold per lot.
+        """
+        if price > self.max_stop_loss:
+            return np.empty(0)
+        open_amounts = self.amount[:self.size]
+        lots = np.flatnonzero((price <= self.stop_loss_price[:self.size]) & (open_amounts > 0))
+        amounts = np.minimum(open_amounts[lots], max_amount)
+        self._reduce(lots, amounts)
+        return amounts
+
+    def compact(self):
+        # Drop closed lots, keeping the open ones in purchase order
+        keep = np.flatnonzero(self.amount[:self.size] > 0)
+        n = len(keep)
+        self.buy_price[:n] = self.buy_price[keep]
+        self.amount[:n] = self.amount[keep]
+        self.stop_loss_price[:n] = self.stop_loss_price[keep]
+        self.size = n
+        self.max_stop_loss = self.stop_loss_price[:n].max() if n else -np.inf
+
+    def _reduce(self, lots, amounts):
+        # Lots touched per step are few, so the running totals are updated in
+        # order, one lot at a time
+        for i, amount_sold in zip(lots.tolist(), amounts.tolist()):
+            remaining = self.amount[i] - amount_sold
+            self.total_amount -= amount_sold
+            self.total_cost -= self.buy_price[i] * amount_sold
+            if remaining <= 0:
+                remaining = 0.0
+                self.open_lots -= 1
+            self.amount[i] = remaining
+        if self.open_lots == 0:
+            # Clear any rounding left over once nothing is held
+            self.size = 0
+            self.total_amount = 0.0
+            self.total_cost = 0.0
+            self.max_stop_loss = -np.inf
+        elif self.size > 32 and self.open_lots < self.size // 2:
+            self.compact()
+
+    def _grow(self):
+        capacity = 2 * len(self.amount)
+        for name in ('buy_price', 'amount', 'stop_loss_price'):
+            grown = np.empty(capacity)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
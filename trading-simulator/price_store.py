@@ -0,0 +1,169 @@
+"""
+Cached binary price store shared by the CSV-driven tools.
+
+The first load of a CSV parses it once, sorts it by date and writes every
+numeric column (and the dates) as its own .npy file. Later loads memory-map
+those files, so startup skips CSV and date parsing entirely and parallel
+processes share the same pages instead of each holding a copy.
+
+Cache layout, next to the CSV by default:
+
+    .price_cache/BTC-USD.csv-<path>.json         source size, mtime and SHA-256
+    .price_cache/BTC-USD.csv-<path>-<hash>/      one .npy file per column
+
+<path> is a short hash of the CSV's absolute path, so same-named CSVs from
+different directories can share a PRICE_CACHE_DIR without evicting each
+other's entries.
+
+A cache entry is reused while the source size and mtime are unchanged. If
+only the mtime moved, the content hash decides. Entries are written to a
+temporary directory and published by atomically replacing the .json
+pointer, so a crashed or concurrent build never leaves a half-written
+cache behind.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = '.price_cache'
+FORMAT_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_paths(csv_path, cache_dir=None):
+    csv_path = os.path.abspath(csv_path)
+    cache_dir = cache_dir or os.environ.get('PRICE_CACHE_DIR') or os.path.join(os.path.dirname(csv_path), CACHE_DIR_NAME)
+    return csv_path, cache_dir, os.path.join(cache_dir, source_name(csv_path) + '.json')
+
+
+def source_name(csv_path):
+    # The file name, plus its directory's identity for a shared cache directory
+    path_hash = hashlib.sha256(os.path.abspath(csv_path).encode()).hexdigest()[:8]
+    return f"{os.path.basename(csv_path)}-{path_hash}"
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == FORMAT_VERSION else None
+
+
+def _write_json_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _cache_is_current(meta, csv_path, meta_path, stat):
+    if meta is None or meta['size'] != stat.st_size:
+        return False
+    if meta['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    # Touched but possibly unchanged: compare contents before rebuilding
+    if file_sha256(csv_path) != meta['sha256']:
+        return False
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _write_json_atomic(meta_path, meta)
+    return True
+
+
+def build_cache(csv_path, cache_dir=None, date_column='Date'):
+    """
+    Parse csv_path and write its columnar cache. Returns the new metadata.
+    """
+    csv_path, cache_dir, meta_path = cache_paths(csv_path, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(csv_path)
+    sha256 = file_sha256(csv_path)
+
+    data = pd.read_csv(csv_path, parse_dates=[date_column])
+    data.set_index(date_column, inplace=True)
+    data.sort_index(inplace=True, kind='stable')
+
+    entry = f"{source_name(csv_path)}-{sha256[:16]}"
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=entry + '.tmp')
+    columns = []
+    np.save(os.path.join(tmp_dir, 'index.npy'), data.index.to_numpy(dtype='datetime64[ns]'))
+    for i, column in enumerate(data.columns):
+        if not pd.api.types.is_numeric_dtype(data[column]):
+            continue  # Only numeric columns can be memory-mapped
+        file_name = f"{i}.npy"
+        np.save(os.path.join(tmp_dir, file_name), np.ascontiguousarray(data[column].to_numpy()))
+        columns.append({'name': column, 'file': file_name})
+
+    entry_dir = os.path.join(cache_dir, entry)
+    if os.path.isdir(entry_dir):
+        # Same content was cached before; the existing entry is identical
+        shutil.rmtree(tmp_dir)
+    else:
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # Lost a race with another process
+
+    old_meta = _read_meta(meta_path)
+    meta = {
+        'version': FORMAT_VERSION,
+        'source': csv_path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+        'entry': entry,
+        'index_name': date_column,
+        'rows': len(data),
+        'columns': columns,
+    }
+    _write_json_atomic(meta_path, meta)
+
+    # The previous version of this file is no longer referenced
+    if old_meta is not None and old_meta['entry'] != entry:
+        shutil.rmtree(os.path.join(cache_dir, old_meta['entry']), ignore_errors=True)
+    return meta
+
+
+def load_columns(csv_path, cache_dir=None, date_column='Date'):
+    """
+    Return (dates, {column: array}) for csv_path as read-only memory-mapped
+    arrays, building or refreshing the cache first when needed.
+    """
+    csv_path, cache_dir, meta_path = cache_paths(csv_path, cache_dir)
+    meta = _read_meta(meta_path)
+    if not _cache_is_current(meta, csv_path, meta_path, os.stat(csv_path)):
+        meta = build_cache(csv_path, cache_dir, date_column)
+    entry_dir = os.path.join(cache_dir, meta['entry'])
+    try:
+        dates = np.load(os.path.join(entry_dir, 'index.npy'), mmap_mode='r')
+        columns = {column['name']: np.load(os.path.join(entry_dir, column['file']), mmap_mode='r')
+                   for column in meta['columns']}
+    except FileNotFoundError:
+        # Entry removed underneath us, e.g. by a cleanup in another process
+        build_cache(csv_path, cache_dir, date_column)
+        return load_columns(csv_path, cache_dir, date_column)
+    return dates, columns
+
+
+def load_prices(csv_path, cache_dir=None, date_column='Date'):
+    """
+    Load csv_path as a DataFrame indexed by date and sorted, backed by the
+    memory-mapped cache columns.
+    """
+    dates, columns = load_columns(csv_path, cache_dir, date_column)
+    index = pd.DatetimeIndex(dates, name=date_column)
+    return pd.DataFrame(columns, index=index, copy=False)
@@ -0,0 +1,175 @@
+"""
+Columnar transaction log for multi_dca.py.
+
+Transactions are appended into typed NumPy buffers (enum-coded type and
+reason, float amount/price/total) instead of one dict per event, and are
+written per simulation to a compressed .npz archive or, when pyarrow is
+installed, to a Parquet file.
+"""
+
+import zipfile
+
+import numpy as np
+
+# Transaction type codes; each type has exactly one reason
+BUY = 0
+SELL = 1
+HOLD = 2
+STOP_LOSS = 3
+TYPE_NAMES = ('buy', 'sell', 'hold', 'sell (stop-loss)')
+REASON_NAMES = ('buy_signal', 'sell_signal', 'hold_signal', 'stop_loss')
+
+# Log levels: 'all' keeps every event, 'trades' only counts holds,
+# 'none' only counts events
+LOG_LEVELS = ('all', 'trades', 'none')
+
+COLUMNS = ('step', 'type', 'reason', 'amount', 'price', 'total')
+DTYPES = (np.int64, np.uint8, np.uint8, np.float64, np.float64, np.float64)
+
+
+class TransactionLog:
+    def __init__(self, level='all', capacity=1024):
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Log level must be one of: {', '.join(LOG_LEVELS)}")
+        self.level = level
+        self.step = 0  # Step the next recorded event belongs to
+        self.size = 0
+        self.counts = np.zeros(len(TYPE_NAMES), dtype=np.int64)
+        self.buffers = {name: np.empty(capacity, dtype=dtype) for name, dtype in zip(COLUMNS, DTYPES)}
+
+    def __len__(self):
+        return self.size
+
+    def keeps(self, kind):
+        return self.level == 'all' or (self.level == 'trades' and kind != HOLD)
+
+    def record(self, kind, amount=0.0, price=0.0, total=0.0):
+        self.counts[kind] += 1
+        if not self.keeps(kind):
+            return
+        if self.size == len(self.buffers['step']):
+            self._reserve(self.size)
+        i = self.size
+        self.buffers['step'][i] = self.step
+        self.buffers['type'][i] = kind
+        self.buffers['reason'][i] = kind
+        self.buffers['amount'][i] = amount
+        self.buffers['price'][i] = price
+        self.buffers['total'][i] = total
+        self.size += 1
+
+    def extend(self, steps, kinds, amounts, prices, totals):
+        # Bulk append of events already filtered by level, e.g. from kernel.py
+        n = len(kinds)
+        if self.size + n > len(self.buffers['step']):
+            self._reserve(max(self.size, n))
+        end = self.size + n
+        for name, values in zip(COLUMNS, (steps, kinds, kinds, amounts, prices, totals)):
+            self.buffers[name][self.size:end] = values
+        self.size = end
+
+    def clear(self):
+        # Drop the recorded events but keep the per-type counts
+        self.size = 0
+
+    def columns(self):
+        return {name: values[:self.size] for name, values in self.buffers.items()}
+
+    def summary(self):
+        return {name: int(count) for name, count in zip(TYPE_NAMES, self.counts)}
+
+    def __getstate__(self):
+        # Only ship the used part of the buffers between processes
+        state = self.__dict__.copy()
+        state['buffers'] = {name: values.copy() for name, values in self.columns().items()}
+        return state
+
+    def _reserve(self, extra):
+        capacity = len(self.buffers['step']) + max(extra, 1)
+        for name, values in self.buffers.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.buffers[name] = grown
+
+
+class NpzTransactionWriter:
+    """
+    Streams each simulation's columns into a compressed .npz archive as
+    entries named 'sim00001/amount' etc., readable with np.load().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def write(self, simulation, log):
+        for name, values in log.columns().items():
+            with self.archive.open(f"sim{simulation:05d}/{name}.npy", 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.ascontiguousarray(values))
+
+    def close(self):
+        self.archive.close()
+
+
+class ParquetTransactionWriter:
+    """
+    Streams each simulation into a Parquet file as one row group, with the
+    type and reason columns dictionary-encoded. Requires pyarrow.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow. Install it with 'pip install pyarrow' or use a .npz file.")
+        self.pa = pa
+        self.path = path
+        self.schema = pa.schema([
+            ('simulation', pa.int32()),
+            ('step', pa.int64()),
+            ('type', pa.dictionary(pa.uint8(), pa.string())),
+            ('reason', pa.dictionary(pa.uint8(), pa.string())),
+            ('amount', pa.float64()),
+            ('price', pa.float64()),
+            ('total', pa.float64()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, simulation, log):
+        pa = self.pa
+        columns = log.columns()
+        table = pa.table({
+            'simulation': np.full(len(log), simulation, dtype=np.int32),
+            'step': columns['step'],
+            'type': pa.DictionaryArray.from_arrays(columns['type'], list(TYPE_NAMES)),
+            'reason': pa.DictionaryArray.from_arrays(columns['reason'], list(REASON_NAMES)),
+            'amount': columns['amount'],
+            'price': columns['price'],
+            'total': columns['total'],
+        }, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_transaction_writer(path):
+    if path.endswith('.parquet'):
+        return ParquetTransactionWriter(path)
+    if path.endswith('.npz'):
+        return NpzTransactionWriter(path)
+    raise ValueError("Transaction file must end in .npz or .parquet")
+
+
+def read_transactions(path):
+    """
+    Read an archive written by NpzTransactionWriter back into
+    {simulation: {column: array}}.
+    """
+    simulations = {}
+    with np.load(path) as archive:
+        for key in archive.files:
+            simulation, name = key.split('/')
+            simulations.setdefault(int(simulation[3:]), {})[name] = archive[key]
+    return simulations